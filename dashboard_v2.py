@@ -3,9 +3,15 @@ import streamlit as st
 import datetime as dt
 import pandas as pd
 import asyncio
-import aiohttp
 import numpy as np
 
+from gauges_v2 import GaugeSeries, as_gauge_series, fetch_usgs_gauge_async, gauge_series, get_gauge_store_async, register_gauges
+import history_v2  # noqa: F401 (persists every gauge refresh to the local history store)
+from http_v2 import FetchError, error_from_exception, error_from_status, pooled_session, refresh_session
+from metrics_v2 import render_diagnostics_panel, timed
+from refresher_v2 import get_refresher, render_data_age
+from scoring_v2 import CONDITIONS, CoastalScoringEngine
+
 # Import map module safely
 try:
     from map_v2 import render_coastal_map
@@ -95,43 +101,57 @@ def load_coastal_region_specs():
         "Olympic Peninsula": COASTAL_OP,
     }
 
+def coastal_usgs_gauges(specs):
+    return [
+        (g["ID"], g["P"])
+        for rivers in specs.values() for r in rivers
+        for g in r.get("Gauges", []) if g.get("Source") == "USGS"
+    ]
+
+# USGS observations come from the shared gauge store (also used by the planner)
+register_gauges(coastal_usgs_gauges(load_coastal_region_specs()))
+
 # ============================================================
 # 2. ASYNC DATA FETCHING (MULTI-SOURCE + NOAA FORECASTS)
 # ============================================================
 
 async def coastal_fetch_usgs_async(session, site_id, param):
-    """Async USGS fetcher."""
-    try:
-        url = "https://waterservices.usgs.gov/nwis/iv/"
-        params = {
-            "format": "json",
-            "sites": site_id,
-            "parameterCd": param,
-            "period": "P3D", 
-            "siteStatus": "all"
-        }
-        async with session.get(url, params=params, timeout=8) as response:
-            if response.status != 200: return {"value": []}
-            data = await response.json()
-            if "value" not in data or not data["value"]["timeSeries"]:
-                return {"value": []}
-            return {"value": data["value"]["timeSeries"][0]["values"][0]["value"]}
-    except Exception:
-        return {"value": []}
+    """Async USGS fetcher (single gauge, RDB parsed straight into a GaugeSeries; None/FetchError otherwise)."""
+    return await fetch_usgs_gauge_async(session, site_id, param, "P3D", {"siteStatus": "all"}, timeout=8)
+
+# Rolling CDEC windows kept between refreshes: (station, sensor) -> GaugeSeries (naive local time)
+CDEC_WINDOW_S = 3 * 86400
+_CDEC_RETAINED = {}
 
 async def coastal_fetch_cdec_async(session, station_id, sensor_id="20"):
-    """Async CDEC fetcher (California)."""
+    """Async CDEC fetcher (California).
+
+    Once a recent window is retained, only readings since its last one are requested
+    (CDEC's Start is a date, so that is "since midnight of the last reading") and appended.
+    Like the USGS store, a failed refresh keeps serving the retained window (the failure
+    is still counted in fetch_errors_total); without one the FetchError is returned.
+    """
+    key = (station_id, sensor_id)
+    retained = _CDEC_RETAINED.get(key)
+    now = dt.datetime.now()
+    start = now - dt.timedelta(days=3)
+    delta = bool(retained) and (now - retained.last_time()).total_seconds() < CDEC_WINDOW_S
+    if delta: start = retained.last_time()
+    # Deltas must hit the network: a disk-cached reply would replay an old slice
+    kwargs = {"cache": False} if delta else {}
     try:
         url = "https://cdec.water.ca.gov/dynamicapp/req/CSVDataServlet"
         params = {
             "Stations": station_id,
             "Sensor": sensor_id,
             "dur": "E",
-            "Start": (dt.datetime.now() - dt.timedelta(days=3)).strftime("%Y-%m-%d"),
-            "End": dt.datetime.now().strftime("%Y-%m-%d")
+            "Start": start.strftime("%Y-%m-%d"),
+            "End": now.strftime("%Y-%m-%d")
         }
-        async with session.get(url, params=params, timeout=8) as response:
-            if response.status != 200: return []
+        async with session.get(url, params=params, timeout=8, **kwargs) as response:
+            if response.status != 200:
+                error = error_from_status("CDEC", response.status)
+                return retained or error
             text = await response.text()
             lines = text.strip().split("\n")
             series = []
@@ -150,31 +170,58 @@ async def coastal_fetch_cdec_async(session, station_id, sensor_id="20"):
                         series.append((ts, val))
                 except:
                     continue
+            series = GaugeSeries.from_pairs(series, site_id=station_id, param=sensor_id, source="CDEC")
+            if retained: series = retained.append(series, CDEC_WINDOW_S)
+            if series: _CDEC_RETAINED[key] = series
             return series
-    except Exception:
-        return []
-
-async def coastal_fetch_noaa_eta_async(session, spec):
-    """Async precipitation probability fetcher."""
-    zone = spec.get("NOAA_zone")
+    except Exception as e:
+        error = error_from_exception("CDEC", e)
+        return retained or error
+
+# NOAA_zone prefix -> (office, gridX, gridY) of the hourly forecast used for precip ETA
+NOAA_ZONE_GRIDPOINTS = {
+    "CAC": ("EKA", 50, 160),
+    "ORC": ("PQR", 110, 80),
+    "WAC": ("SEW", 140, 80),
+}
+
+def coastal_zone_gridpoint(zone):
     if not zone: return None
-    try:
-        if "CAC" in zone: office, gx, gy = "EKA", 50, 160
-        elif "ORC" in zone: office, gx, gy = "PQR", 110, 80
-        elif "WAC" in zone: office, gx, gy = "SEW", 140, 80
-        else: return None
+    for prefix, grid in NOAA_ZONE_GRIDPOINTS.items():
+        if prefix in zone: return grid
+    return None
 
+async def coastal_fetch_grid_eta_async(session, gridpoint):
+    """Hours until the first >=50% precip period at one forecast gridpoint."""
+    office, gx, gy = gridpoint
+    try:
         url = f"https://api.weather.gov/gridpoints/{office}/{gx},{gy}/forecast/hourly"
         headers = {"User-Agent": "CoastalSteelheadDashboard/2.0"}
         async with session.get(url, headers=headers, timeout=5) as response:
-            if response.status != 200: return None
+            if response.status != 200: return error_from_status("NWS", response.status)
             r = await response.json()
             periods = r.get("properties", {}).get("periods", [])
             for i, p in enumerate(periods):
                 pop = p.get("probabilityOfPrecipitation", {}).get("value", 0)
                 if pop and pop >= 50: return i
         return None
-    except: return None
+    except Exception as e: return error_from_exception("NWS", e)
+
+async def coastal_fetch_noaa_eta_async(session, spec, eta_cache=None):
+    """Async precipitation probability fetcher.
+
+    eta_cache maps gridpoint -> in-flight/finished ETA future; pass one dict per
+    refresh so each gridpoint is downloaded and scanned once for all rivers.
+    """
+    grid = coastal_zone_gridpoint(spec.get("NOAA_zone"))
+    if not grid: return None
+    if eta_cache is None:
+        return await coastal_fetch_grid_eta_async(session, grid)
+    fut = eta_cache.get(grid)
+    if fut is None:
+        fut = asyncio.ensure_future(coastal_fetch_grid_eta_async(session, grid))
+        eta_cache[grid] = fut
+    return await asyncio.shield(fut)
 
 
 # ============================================================
@@ -198,58 +245,59 @@ def coastal_extract_36hr_forecast(forecasts):
     return out
 
 
-async def coastal_fetch_nws_forecast(session, nws_id):
-    """Fetches river forecast (stage/flow) from NWPS API, returning peak + next 36 hrs."""
+def coastal_summarize_nws_forecast(forecasts):
+    """Reduces an NWPS hydrograph forecast to peak + next 36 hrs."""
+    if not forecasts: return None
+    try:
+        max_val, max_time = -1, None
+        for pt in forecasts:
+            val = pt.get("primary", 0)
+            if val > max_val:
+                max_val, max_time = val, pt.get("validTime", "")
+
+        peak_str = None
+        if max_val > -1 and max_time:
+            try:
+                dt_obj = dt.datetime.fromisoformat(max_time.replace("Z", "+00:00"))
+                peak_str = f"Peak: {max_val:,.0f} @ {dt_obj.strftime('%a %I%p')}"
+            except:
+                peak_str = f"Peak: {max_val:,.0f}"
+
+        forecast_36hr = coastal_extract_36hr_forecast(forecasts)
+        return {"peak": peak_str, "next36": forecast_36hr}
+    except: return None
+
+async def coastal_fetch_nws_hydrograph(session, nws_id):
+    """Fetches the raw NWPS hydrograph forecast once; both the peak/36h and 96h views derive from it."""
     if not nws_id: return None
     try:
         url = f"https://api.water.noaa.gov/nwps/v1/gauges/{nws_id}"
         headers = {"User-Agent": "CoastalSteelheadDashboard/2.0"}
         async with session.get(url, headers=headers, timeout=6) as response:
-            if response.status != 200: return None
+            if response.status != 200: return error_from_status("NWPS", response.status)
             data = await response.json()
-            forecasts = data.get("hydrograph", {}).get("forecast", [])
-            if not forecasts: return None
-
-            max_val, max_time = -1, None
-            for pt in forecasts:
-                val = pt.get("primary", 0)
-                if val > max_val:
-                    max_val, max_time = val, pt.get("validTime", "")
-
-            peak_str = None
-            if max_val > -1 and max_time:
-                try:
-                    dt_obj = dt.datetime.fromisoformat(max_time.replace("Z", "+00:00"))
-                    peak_str = f"Peak: {max_val:,.0f} @ {dt_obj.strftime('%a %I%p')}"
-                except:
-                    peak_str = f"Peak: {max_val:,.0f}"
+            return data.get("hydrograph", {}).get("forecast", [])
+    except Exception as e: return error_from_exception("NWPS", e)
 
-            forecast_36hr = coastal_extract_36hr_forecast(forecasts)
-            return {"peak": peak_str, "next36": forecast_36hr}
-    except: return None
+async def coastal_fetch_nws_forecast(session, nws_id):
+    """Fetches river forecast (stage/flow) from NWPS API, returning peak + next 36 hrs."""
+    return coastal_summarize_nws_forecast(await coastal_fetch_nws_hydrograph(session, nws_id))
 
 async def coastal_fetch_nws_forecast_full(session, nws_id):
     """Fetches full NWS hydrograph for 96h prediction."""
-    if not nws_id: return None
-    try:
-        url = f"https://api.water.noaa.gov/nwps/v1/gauges/{nws_id}"
-        async with session.get(url, headers={"User-Agent": "Dashboard/2.0"}, timeout=6) as resp:
-            if resp.status != 200: return None
-            data = await resp.json()
-            return data.get("hydrograph", {}).get("forecast", [])
-    except: return None
+    forecasts = await coastal_fetch_nws_hydrograph(session, nws_id)
+    return None if isinstance(forecasts, FetchError) else forecasts
 
 # ============================================================
 # 3. HYDROLOGY & PREDICTIVE LOGIC
 # ============================================================
 
 def coastal_compute_trend(series):
+    series = as_gauge_series(series)
     if len(series) < 2: return "↔", None, "↔ stable"
-    end_time = series[-1][0]
-    cutoff = end_time - dt.timedelta(hours=12)
-    recent = [s for s in series if s[0] >= cutoff]
+    recent = series.since(series.t[-1] - 12 * 3600)
     if len(recent) < 2: recent = series
-    start_val, end_val = recent[0][1], recent[-1][1]
+    start_val, end_val = float(recent.v[0]), float(recent.v[-1])
     if start_val <= 0: return "↔", None, "↔ stable"
     pct = (end_val - start_val) / start_val * 100.0
     if pct > 5: return "↑", pct, "↑ rising"
@@ -257,21 +305,22 @@ def coastal_compute_trend(series):
     return "↔", pct, "↔ stable"
 
 def coastal_make_sparkline_html(series, num_points=24):
+    series = as_gauge_series(series)
     if not series: return ""
-    vals = [v for (_, v) in series]
+    vals = series.v.astype(float)
     if len(vals) > num_points:
-        idx = np.linspace(0, len(vals)-1, num_points).astype(int)
-        vals = [vals[i] for i in idx]
-    if not vals: return ""
-    min_v, max_v = min(vals), max(vals)
-    norm = [(v - min_v)/(max_v - min_v) if max_v > min_v else 0.5 for v in vals]
+        vals = vals[np.linspace(0, len(vals)-1, num_points).astype(int)]
+    min_v, max_v = vals.min(), vals.max()
+    norm = (vals - min_v) / (max_v - min_v) if max_v > min_v else np.full(len(vals), 0.5)
     chars = "▁▂▃▄▅▆▇█"
-    peak_idx = vals.index(max(vals))
+    char_idx = (norm * (len(chars)-1)).astype(int)
+    step = np.sign(np.diff(vals, prepend=vals[0]))
+    peak_idx = int(vals.argmax())
     html = []
-    for i, n in enumerate(norm):
-        char = chars[int(n * (len(chars)-1))]
+    for i in range(len(vals)):
+        char = chars[char_idx[i]]
         # Modified colors: Rising=Orange, Dropping=Green, Peak=Red
-        color = "#FF9800" if (i > 0 and vals[i] > vals[i-1]) else "#66BB6A" if (i > 0 and vals[i] < vals[i-1]) else "#9E9E9E"
+        color = "#FF9800" if step[i] > 0 else "#66BB6A" if step[i] < 0 else "#9E9E9E"
         if i == peak_idx: 
             html.append(f"<span style='color:#EF5350; font-weight:bold;'>{char}</span>") # Red Peak
         else: 
@@ -280,18 +329,17 @@ def coastal_make_sparkline_html(series, num_points=24):
     return "".join(html)
 
 def coastal_time_since_peak(series):
+    series = as_gauge_series(series)
     if not series: return None
-    vals = [v for (_,v) in series]
-    peak_time = series[vals.index(max(vals))][0]
-    return (series[-1][0] - peak_time).total_seconds() / 3600.0
+    return float(series.t[-1] - series.t[series.v.argmax()]) / 3600.0
 
 def coastal_recession_rate(series):
+    series = as_gauge_series(series)
     if len(series) < 2: return 0.0
-    recent = [v for v in series if v[0] >= series[-1][0] - dt.timedelta(hours=24)]
+    recent = series.since(series.t[-1] - 24 * 3600)
     if len(recent) < 2: recent = series[-2:]
-    t0, v0 = recent[0]; t1, v1 = recent[-1]
-    hours = (t1 - t0).total_seconds() / 3600.0
-    return (v1 - v0) / hours if hours > 0 else 0.0
+    hours = (recent.t[-1] - recent.t[0]) / 3600.0
+    return float(recent.v[-1] - recent.v[0]) / hours if hours > 0 else 0.0
 
 def coastal_get_condition(val, spec, trend, hours):
     if val is None:
@@ -359,107 +407,168 @@ def coastal_storm_cycle(trend_text, hours_since_peak):
 # 4. ORCHESTRATION (THE ASYNC LOOP)
 # ============================================================
 
-async def process_single_river(session, region, spec):
-    gauges = spec.get("Gauges", [])
-    result = {
-        "spec": spec, "region": region, "last_val": None, "series": [],
-        "source": "none", "icon": "🚫", "timestamp": None,
-        "storm_eta": None, "is_modeled": False, "is_proxy": False,
-        "nws_peak": None, "forecast_36hr": None, "nws_raw": [], 
-        "scores": {"now": 0.0, "48h": 0.0, "96h": 0.0}
-    }
+RIVER_DEADLINE_S = 12  # Per-river cap so one slow upstream cannot stall the whole refresh
 
+async def coastal_fetch_first_gauge(session, gauges, gauge_store=None):
+    """Walks the Gauges list in order and returns (series, gauge, errors) for the first one with data."""
+    errors = []
     for g in gauges:
         if g.get("ID") == "NO_GAUGE": continue
-        source, series = g.get("Source", "USGS"), []
-        is_proxy_gauge = g.get("Is_Proxy", False)
+        source, series = g.get("Source", "USGS"), None
 
         if source == "USGS":
-            usgs_data = await coastal_fetch_usgs_async(session, g["ID"], g["P"])
-            if usgs_data["value"]:
-                for v in usgs_data["value"]:
-                    try:
-                        ts = dt.datetime.strptime(v["dateTime"][:19], "%Y-%m-%dT%H:%M:%S")
-                        series.append((ts, float(v["value"])))
-                    except: continue
+            stored = gauge_series(gauge_store, g["ID"], g["P"]) if gauge_store is not None else None
+            if isinstance(stored, FetchError):
+                errors.append(stored)
+            elif stored is not None:
+                series = stored
+            else:
+                series = await coastal_fetch_usgs_async(session, g["ID"], g["P"])
+                if isinstance(series, FetchError):
+                    errors.append(series)
+                    series = None
         elif source == "CDEC":
             series = await coastal_fetch_cdec_async(session, g["ID"])
+            if isinstance(series, FetchError):
+                errors.append(series)
+                series = None
 
         if series:
-            series.sort(key=lambda x: x[0])
-            result.update({
-                "last_val": series[-1][1], "series": series, "source": source,
-                "icon": "📡", "timestamp": series[-1][0], "gauge_used": g
-            })
-            if is_proxy_gauge:
-                result["is_proxy"] = True
-                result["source"] = f"Proxy ({g.get('Name_Proxy', 'Neighbor')})"
-            break
+            return series, g, errors
+    return GaugeSeries.empty(), None, errors
 
-    eta_hours = await coastal_fetch_noaa_eta_async(session, spec)
+@timed("process_single_river")
+async def process_single_river(session, region, spec, gauge_store=None, eta_cache=None):
+    gauges = spec.get("Gauges", [])
+    result = {
+        "spec": spec, "region": region, "last_val": None, "series": GaugeSeries.empty(),
+        "source": "none", "icon": "🚫", "timestamp": None,
+        "storm_eta": None, "is_modeled": False, "is_proxy": False,
+        "nws_peak": None, "forecast_36hr": None, "nws_raw": [], 
+        "scores": {"now": 0.0, "48h": 0.0, "96h": 0.0}, "errors": []
+    }
 
+    # Gauge, precip ETA and NWPS fetches are independent: run them together.
+    # Only the gauge fallback chain is sequential (inside coastal_fetch_first_gauge).
+    gauge_task = asyncio.ensure_future(coastal_fetch_first_gauge(session, gauges, gauge_store))
+    eta_task = asyncio.ensure_future(coastal_fetch_noaa_eta_async(session, spec, eta_cache))
+    tasks = [gauge_task, eta_task]
+    nws_task = None
     if spec.get("NWS_ID"):
-        nws_fc = await coastal_fetch_nws_forecast(session, spec["NWS_ID"])
+        nws_task = asyncio.ensure_future(coastal_fetch_nws_hydrograph(session, spec["NWS_ID"]))
+        tasks.append(nws_task)
+
+    done, pending = await asyncio.wait(tasks, timeout=RIVER_DEADLINE_S)
+    for t in pending: t.cancel()
+
+    def task_result(task, default, source):
+        if task not in done:
+            result["errors"].append(FetchError(source, "deadline", detail=f"> {RIVER_DEADLINE_S}s"))
+            return default
+        if task.exception() is not None:
+            result["errors"].append(error_from_exception(source, task.exception()))
+            return default
+        value = task.result()
+        if isinstance(value, FetchError):
+            result["errors"].append(value)
+            return default
+        return value
+
+    series, g, gauge_errors = task_result(gauge_task, (GaugeSeries.empty(), None, []), "Gauge")
+    result["errors"].extend(gauge_errors)
+    if series:
+        result.update({
+            "last_val": series.last_value(), "series": series, "source": g.get("Source", "USGS"),
+            "icon": "📡", "timestamp": series.last_time(), "gauge_used": g
+        })
+        if g.get("Is_Proxy", False):
+            result["is_proxy"] = True
+            result["source"] = f"Proxy ({g.get('Name_Proxy', 'Neighbor')})"
+
+    eta_hours = task_result(eta_task, None, "NWS")
+
+    if nws_task is not None:
+        # One NWPS request, parsed once into the peak/36h view and the raw 96h list
+        nws_raw = task_result(nws_task, None, "NWPS")
+        nws_fc = coastal_summarize_nws_forecast(nws_raw)
         if nws_fc:
             result["nws_peak"] = nws_fc.get("peak")
             result["forecast_36hr"] = nws_fc.get("next36")
-        
-        # New: Fetch Full Raw Forecast for 96h Prediction
-        result["nws_raw"] = await coastal_fetch_nws_forecast_full(session, spec.get("NWS_ID"))
+        result["nws_raw"] = nws_raw
 
-    arrow, pct, trend_text = coastal_compute_trend(result["series"])
-    hours = coastal_time_since_peak(result["series"])
-    
-    # Calculate Scores (Fix applied here: Pass series explicitly)
-    result["scores"]["now"] = coastal_score(result["last_val"], spec, trend_text, result["series"])
-    for lead in [48, 96]:
-        f_val, f_trend = predict_future_state(result["nws_raw"], lead)
-        # Future scores don't use 'series' history, so we pass None implicitly or explicitly
-        result["scores"][f"{lead}h"] = coastal_score(f_val, spec, f_trend)
-
-    if result["last_val"] is None:
-        result.update({
-            "is_modeled": True, "source": "NOAA Forecast", "icon": "🧪", "timestamp": dt.datetime.now()
-        })
-        if eta_hours is not None and eta_hours < 24:
-            cond_text, cond_color, trend_text = "likely high", "#FFCC80", "↑ rising?"
-            storm_cycle, hydro_insight = ("Rising", "🌧️", "#FFCDD2"), f"🌧️ Storm in {eta_hours}h • Likely rising"
+    result["eta_hours"] = eta_hours
+    return result
+
+@timed("score_rivers")
+def coastal_apply_scores(results, now=None):
+    """Scores, trends and conditions for every river in one batched pass (scoring_v2)."""
+    engine = CoastalScoringEngine(
+        [r["spec"] for r in results], [r["series"] for r in results], [r["nws_raw"] for r in results], now
+    )
+    scores, conds, trends = engine.scores(), engine.conditions(), engine.trend_text()
+    for i, result in enumerate(results):
+        arrow, trend_text = trends[i]
+        pct = None if np.isnan(engine.pct[i]) else float(engine.pct[i])
+        hours = None if np.isnan(engine.hours_since_peak[i]) else float(engine.hours_since_peak[i])
+        eta_hours = result["eta_hours"]
+        result["scores"] = {h: float(v[i]) for h, v in scores.items()}
+        result["hours_since_peak"] = hours
+        result["recession_rate"] = float(engine.recession[i])
+
+        if result["last_val"] is None:
+            result.update({
+                "is_modeled": True, "source": "NOAA Forecast", "icon": "🧪", "timestamp": dt.datetime.now()
+            })
+            if eta_hours is not None and eta_hours < 24:
+                cond_text, cond_color, trend_text = "likely high", "#FFCC80", "↑ rising?"
+                storm_cycle, hydro_insight = ("Rising", "🌧️", "#FFCDD2"), f"🌧️ Storm in {eta_hours}h • Likely rising"
+            else:
+                cond_text, cond_color, trend_text = "likely low", "#FFEB3B", "↔ stable"
+                storm_cycle, hydro_insight = ("Low/Clear", "💧", "#BBDEFB"), "💧 No rain forecast • Modeled"
+            spark = "<span style='color:#999; font-size:0.8em;'>-- Modeled --</span>"
         else:
-            cond_text, cond_color, trend_text = "likely low", "#FFEB3B", "↔ stable"
-            storm_cycle, hydro_insight = ("Low/Clear", "💧", "#BBDEFB"), "💧 No rain forecast • Modeled"
-        spark = "<span style='color:#999; font-size:0.8em;'>-- Modeled --</span>"
-    else:
-        cond_text, cond_color = coastal_get_condition(result["last_val"], spec, trend_text, hours)
-        storm_cycle = coastal_storm_cycle(trend_text, hours)
-        hydro_insight = f"{storm_cycle[1]} {storm_cycle[0]} • ETA: {eta_hours if eta_hours else '--'}h"
-        spark = coastal_make_sparkline_html(result["series"])
-
-    result.update({
-        "arrow": arrow, "pct_change": pct, "trend_text": trend_text, "spark": spark,
-        "cond_text": cond_text, "cond_color": cond_color,
-        "storm_cycle": storm_cycle, "hydro_insight": hydro_insight,
-        "time_str": result["timestamp"].strftime("%m/%d %H:%M") if result["timestamp"] else "Modeled"
-    })
+            cond_text, cond_color = CONDITIONS[int(conds[i])]
+            storm_cycle = coastal_storm_cycle(trend_text, hours)
+            hydro_insight = f"{storm_cycle[1]} {storm_cycle[0]} • ETA: {eta_hours if eta_hours else '--'}h"
+            spark = coastal_make_sparkline_html(result["series"])
 
-    return result
+        result.update({
+            "arrow": arrow, "pct_change": pct, "trend_text": trend_text, "spark": spark,
+            "cond_text": cond_text, "cond_color": cond_color,
+            "storm_cycle": storm_cycle, "hydro_insight": hydro_insight,
+            "time_str": result["timestamp"].strftime("%m/%d %H:%M") if result["timestamp"] else "Modeled"
+        })
+    return results
 
+@timed("dashboard_refresh")
 async def fetch_all_data():
     specs = load_coastal_region_specs()
     tasks = []
-    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False)) as session:
+    # P3D observations for every gauge, shared with the planner (one USGS fan-out)
+    gauge_store = await get_gauge_store_async()
+    async with pooled_session() as raw_session:
+        # Shared gauges and NWPS endpoints are requested once per refresh, unchanged
+        # payloads are revalidated against the on-disk cache (304s), and each host
+        # is rate limited with retries and a circuit breaker
+        session = refresh_session(raw_session)
+        eta_cache = {}  # One precip ETA per forecast gridpoint per refresh
         for region, rivers in specs.items():
-            for r in rivers: tasks.append(process_single_river(session, region, r))
+            for r in rivers: tasks.append(process_single_river(session, region, r, gauge_store, eta_cache))
         flat_results = await asyncio.gather(*tasks)
+    coastal_apply_scores(flat_results)
     grouped = {r: [] for r in specs.keys()}
     for res in flat_results: grouped[res["region"]].append(res)
     return grouped
 
-# Renamed to force cache invalidation
-@st.cache_data(ttl=900, show_spinner=False)
+def get_dashboard_refresher():
+    return get_refresher("coastal_dashboard", fetch_all_data)
+
 def get_dashboard_data_v3():
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    return loop.run_until_complete(fetch_all_data())
+    """Latest background snapshot; only the very first load waits on the network."""
+    refresher = get_dashboard_refresher()
+    snap = refresher.latest() or refresher.wait_for_snapshot()
+    if snap is None: return {r: [] for r in load_coastal_region_specs()}
+    return snap.data
 
 # ============================================================
 # 5. UI RENDERERS
@@ -468,9 +577,12 @@ def get_dashboard_data_v3():
 def render_filters():
     with st.sidebar:
         st.header("Filters")
+        refresher = get_dashboard_refresher()
         if st.button("🔄 Refresh Data"):
-            get_dashboard_data_v3.clear()
+            # Refresh in the background, past the disk cache's fresh window; current data stays on screen
+            refresher.request_refresh(revalidate=True)
             st.rerun()
+        render_data_age(refresher)
         st.divider()
         regions = list(load_coastal_region_specs().keys())
         sel_regions = []
@@ -484,6 +596,8 @@ def render_filters():
         for c in conds:
             if st.checkbox(c.title(), value=True, key=f"cond_{c}"):
                 sel_conds.append(c)
+        st.divider()
+        render_diagnostics_panel()
     return sel_regions, sel_conds
 
 def coastal_render_region_summary(coastal_data):
@@ -598,6 +712,14 @@ def coastal_tile(item):
             f"📈 Next 36 hrs: {mini}</div>"
         )
 
+    # Upstream failures behind this tile (structured FetchError results)
+    if item.get("errors"):
+        errs = ", ".join(sorted({e.describe() for e in item["errors"]}))
+        fcst_html += (
+            f"<div style='font-size:0.70rem; color:{fg}; opacity:0.85; margin-top:2px;'>"
+            f"⚠️ {errs}</div>"
+        )
+
     style = f"background-color:{bg}; color:{fg}; {font_style} padding:8px; border-radius:8px; margin-bottom:10px; font-size:0.85rem; border:1px solid rgba(0,0,0,0.1); line-height:1.4;"
     
     html = (
@@ -621,8 +743,12 @@ def render_coastal_dashboard():
     st.set_page_config(page_title="Coastal Dashboard", layout="wide")
     st.title("🌊 Coastal Conditions Dashboard")
     
-    # Use v3 cache to force reload of colors
-    data = get_dashboard_data_v3()
+    # Served from the background refresher's latest snapshot
+    if get_dashboard_refresher().latest() is None:
+        with st.spinner("Loading live data..."):
+            data = get_dashboard_data_v3()
+    else:
+        data = get_dashboard_data_v3()
     sel_regions, sel_conds = render_filters()
     
     t1, t2, t3, t4 = st.tabs(["Current", "48h Forecast", "96h Forecast", "Map View"])
@@ -25,6 +25,13 @@ except ImportError as e:
     st.error(f"Error importing planner_v3: {e}")
     def render_planner(): st.warning("Planner V3 unavailable - check if planner_v3.py exists")
 
+# Optional Prometheus /metrics endpoint (only when STEELHEAD_METRICS_PORT is set)
+try:
+    from metrics_v2 import start_metrics_server
+    start_metrics_server()
+except ImportError:
+    pass
+
 # --- HOME SCREEN ---
 def render_home():
     st.title("🧭 Expedition App v2.0")
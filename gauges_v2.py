@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import datetime as dt
+import io
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from http_v2 import (
+    FetchError, error_from_exception, error_from_status, pooled_session, refresh_session, revalidation_requested,
+)
+import metrics_v2 as metrics
+from metrics_v2 import timed
+from refresher_v2 import get_refresher
+
+# ============================================================
+# 1. COMPACT GAUGE SERIES
+# ============================================================
+
+_NAIVE_EPOCH = dt.datetime(1970, 1, 1)
+
+def display_value(x):
+    # float32 -> the shortest decimal that round-trips (3.57, not 3.569999933242798)
+    return float(str(np.float32(x)))
+
+class GaugeSeries:
+    """Time-sorted gauge observations: int64 epoch seconds + float32 values (12 bytes/point).
+
+    Stands in for the old [(datetime, float)] lists: len(), truthiness, indexing, slicing
+    and iteration still yield (datetime, value) pairs, while hot paths work on .t / .v.
+    Datetimes are aware in the gauge's own UTC offset, or naive when the source gave no
+    zone (utc_offset_s is None; CDEC). Arrays are read-only: series are shared snapshot data.
+    """
+
+    __slots__ = ("t", "v", "site_id", "param", "source", "utc_offset_s")
+
+    def __init__(self, t, v, site_id=None, param=None, source=None, utc_offset_s=None):
+        self.t = np.asarray(t, dtype=np.int64)
+        self.v = np.asarray(v, dtype=np.float32)
+        self.t.flags.writeable = False
+        self.v.flags.writeable = False
+        self.site_id, self.param, self.source, self.utc_offset_s = site_id, param, source, utc_offset_s
+
+    @classmethod
+    def empty(cls, **meta):
+        return cls(np.empty(0, np.int64), np.empty(0, np.float32), **meta)
+
+    @classmethod
+    def from_pairs(cls, pairs, **meta):
+        """[(datetime, value)] in any order -> GaugeSeries (zone taken from the first point)."""
+        if not pairs: return cls.empty(**meta)
+        first = pairs[0][0]
+        if first.tzinfo is None:
+            meta.setdefault("utc_offset_s", None)
+            t = [int((ts - _NAIVE_EPOCH).total_seconds()) for ts, _ in pairs]
+        else:
+            meta.setdefault("utc_offset_s", int(first.utcoffset().total_seconds()))
+            t = [int(ts.timestamp()) for ts, _ in pairs]
+        t = np.array(t, dtype=np.int64)
+        v = np.array([val for _, val in pairs], dtype=np.float32)
+        order = np.argsort(t, kind="stable")
+        return cls(t[order], v[order], **meta)
+
+    def _with(self, t, v):
+        return GaugeSeries(t, v, self.site_id, self.param, self.source, self.utc_offset_s)
+
+    def datetime_at(self, i):
+        secs = int(self.t[i])
+        if self.utc_offset_s is None: return _NAIVE_EPOCH + dt.timedelta(seconds=secs)
+        tz = dt.timezone(dt.timedelta(seconds=self.utc_offset_s))
+        return dt.datetime.fromtimestamp(secs, tz)
+
+    def __len__(self):
+        return len(self.t)
+
+    def __bool__(self):
+        return len(self.t) > 0
+
+    def __getitem__(self, i):
+        if isinstance(i, slice): return self._with(self.t[i], self.v[i])
+        return self.datetime_at(i), display_value(self.v[i])
+
+    def __iter__(self):
+        for i in range(len(self.t)):
+            yield self[i]
+
+    def __repr__(self):
+        return f"GaugeSeries({self.source} {self.site_id}/{self.param}, {len(self)} points)"
+
+    @property
+    def nbytes(self):
+        return self.t.nbytes + self.v.nbytes
+
+    def last_time(self):
+        return self.datetime_at(-1) if len(self) else None
+
+    def last_value(self):
+        return display_value(self.v[-1]) if len(self) else None
+
+    def since(self, epoch_s):
+        """Points at or after epoch_s (same clock as .t); a view, not a copy."""
+        i = int(np.searchsorted(self.t, epoch_s, side="left"))
+        return self._with(self.t[i:], self.v[i:])
+
+    def append(self, newer, keep_s=None):
+        """Rolling-window append: newer's points after our last timestamp, trimmed to the
+        trailing keep_s seconds (relative to the latest point). Returns a new series;
+        this one stays untouched for snapshot readers."""
+        if not len(self): merged = newer
+        elif not len(newer): merged = self
+        else:
+            fresh = newer.since(int(self.t[-1]) + 1)
+            merged = GaugeSeries(
+                np.concatenate([self.t, fresh.t]), np.concatenate([self.v, fresh.v]),
+                self.site_id, self.param, self.source, newer.utc_offset_s  # Offset follows DST
+            )
+        if keep_s is None or not len(merged): return merged
+        return merged.since(int(merged.t[-1]) - int(keep_s))
+
+    def last_hours(self, hours, now=None):
+        """Points from the last `hours` of wall-clock time (relative to the latest point if naive)."""
+        if self.utc_offset_s is None:
+            if not len(self): return self
+            return self.since(int(self.t[-1]) - int(hours * 3600))
+        now = now or dt.datetime.now(dt.timezone.utc)
+        return self.since(int(now.timestamp() - hours * 3600))
+
+def as_gauge_series(series):
+    """GaugeSeries passthrough; legacy [(datetime, value)] lists (or None) are converted."""
+    if isinstance(series, GaugeSeries): return series
+    return GaugeSeries.from_pairs(list(series or []))
+
+# ============================================================
+# 2. BATCHED USGS FETCHING (SHARED BY DASHBOARD + PLANNER)
+# ============================================================
+
+USGS_IV_URL = "https://waterservices.usgs.gov/nwis/iv/"
+USGS_DV_URL = "https://waterservices.usgs.gov/nwis/dv/"
+USGS_DV_MEAN = "00003"  # Daily-value statistic code for the daily mean
+USGS_MAX_SITES = 100  # NWIS IV limit on sites per request
+USGS_MAX_ROWS_PER_REQUEST = 100_000  # Caps one response body (~4-5 MB of RDB) for long periods
+USGS_ROWS_PER_HOUR = 4  # 15-minute instantaneous values
+
+# RDB tz_cd -> UTC offset (seconds); NWIS reports each row in the gauge's local standard/daylight time
+USGS_TZ_OFFSETS_S = {
+    "UTC": 0, "GMT": 0, "HST": -36000, "AKST": -32400, "AKDT": -28800,
+    "PST": -28800, "PDT": -25200, "MST": -25200, "MDT": -21600,
+    "CST": -21600, "CDT": -18000, "EST": -18000, "EDT": -14400,
+}
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def period_hours(period):
+    """ISO-8601 NWIS period ('P3D', 'PT12H', 'P30D') -> hours, or None."""
+    m = re.fullmatch(r"P(?:(\d+)D)?(?:T(?:(\d+)H)?)?", str(period or ""))
+    if not m or not any(m.groups()): return None
+    return int(m.group(1) or 0) * 24 + int(m.group(2) or 0)
+
+def sites_per_request(period):
+    """How many gauges one request may carry so the body stays bounded for long periods."""
+    rows = (period_hours(period) or 72) * USGS_ROWS_PER_HOUR
+    return max(1, min(USGS_MAX_SITES, USGS_MAX_ROWS_PER_REQUEST // max(rows, 1)))
+
+def _rdb_block_series(block, param, stat=None):
+    """One site's RDB block -> (site_id, GaugeSeries) using the pandas C parser, no per-row Python."""
+    value_col = re.compile(rf"\d+_{param}" + (rf"_{stat}" if stat else ""))
+    df = pd.read_csv(
+        io.BytesIO(block), sep="\t", comment="#", skiprows=[1],
+        usecols=lambda c: c in ("site_no", "datetime", "tz_cd") or value_col.fullmatch(c) is not None,
+        dtype={"site_no": str, "tz_cd": "category"}
+    )
+    if df.empty or "site_no" not in df.columns: return None, None
+    site_id = df["site_no"].iat[0]
+    # "<ts_id>_<param>" value columns; keep the first one with data (several sensors can share a param)
+    for col in [c for c in df.columns if value_col.fullmatch(c)]:
+        # Numeric columns arrive as float already; qualifier text ("Ice", "Eqp") becomes NaN
+        values = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64)
+        keep = ~np.isnan(values)
+        if not keep.any(): continue
+        local = pd.to_datetime(df["datetime"], format="ISO8601").to_numpy("datetime64[s]").astype(np.int64)
+        if "tz_cd" in df.columns:
+            # Offset per category, gathered by code (missing tz_cd = code -1 -> the appended 0)
+            tz = df["tz_cd"].cat
+            by_code = np.array([USGS_TZ_OFFSETS_S.get(c, 0) for c in tz.categories] + [0], dtype=np.int64)
+            offsets = by_code[tz.codes.to_numpy()]
+        else:
+            offsets = np.zeros(len(df), dtype=np.int64)  # Daily values carry no time of day
+        t, v, offsets = (local - offsets)[keep], values[keep], offsets[keep]
+        if len(t) > 1 and (np.diff(t) < 0).any():
+            order = np.argsort(t, kind="stable")
+            t, v, offsets = t[order], v[order], offsets[order]
+        return site_id, GaugeSeries(t, v, site_id, param, "USGS", int(offsets[-1]))
+    return site_id, None
+
+def parse_usgs_rdb(body, param, stat=None):
+    """Multi-site NWIS RDB (tab-separated) body -> {(site_id, param): GaugeSeries}.
+
+    Each site is its own header block; blocks are parsed one at a time straight into
+    int64/float32 arrays, so no JSON document or per-point objects are ever built.
+    stat selects a daily-value statistic column (e.g. USGS_DV_MEAN) for dv responses.
+    """
+    out = {}
+    blocks = body.split(b"\nagency_cd")
+    for block in blocks[1:]:
+        site_id, series = _rdb_block_series(b"agency_cd" + block, param, stat)
+        if site_id and series is not None and (site_id, param) not in out:
+            out[(site_id, param)] = series
+    return out
+
+async def _fetch_usgs_chunk(session, site_ids, param, period, extra_params, timeout, cache=True, url=USGS_IV_URL, stat=None):
+    params = {"format": "rdb", "sites": ",".join(site_ids), "parameterCd": param}
+    if period: params["period"] = period
+    if stat: params["statCd"] = stat
+    params.update(extra_params or {})
+    kwargs = {} if cache else {"cache": False}
+    try:
+        async with session.get(url, params=params, timeout=timeout, **kwargs) as response:
+            if response.status != 200: return error_from_status("USGS", response.status)
+            body = await response.read()
+        found = parse_usgs_rdb(body, param, stat)
+    except Exception as e:
+        return error_from_exception("USGS", e)
+    return {(s, param): found.get((s, param)) or GaugeSeries.empty(site_id=s, param=param, source="USGS") for s in site_ids}
+
+async def fetch_usgs_batch_async(session, gauges, period="P3D", extra_params=None, timeout=15):
+    """Batched USGS fetcher.
+
+    gauges: iterable of (site_id, param) pairs. Sites are grouped by parameter code
+    into multi-site NWIS IV requests (fewer sites per request for long periods).
+    Returns {(site_id, param): GaugeSeries}. Gauges whose request failed are left out
+    so callers can fall back to a single-site fetch (the failed chunks' FetchErrors are skipped here).
+    """
+    by_param = {}
+    for site_id, param in gauges:
+        if not site_id or site_id == "NO_GAUGE": continue
+        ids = by_param.setdefault(param, [])
+        if site_id not in ids: ids.append(site_id)
+
+    tasks = [
+        _fetch_usgs_chunk(session, chunk, param, period, extra_params, timeout)
+        for param, ids in by_param.items()
+        for chunk in _chunks(ids, sites_per_request(period))
+    ]
+    results = {}
+    for part in await asyncio.gather(*tasks):
+        if part: results.update(part)
+    return results
+
+def usgs_start_dt(epoch_s):
+    """NWIS startDT (UTC, minute resolution) for an epoch-seconds timestamp."""
+    return dt.datetime.fromtimestamp(int(epoch_s), dt.timezone.utc).strftime("%Y-%m-%dT%H:%MZ")
+
+async def fetch_usgs_delta_async(session, last_seen, extra_params=None, timeout=15):
+    """Incremental fetch: only observations at or after each gauge's last known timestamp.
+
+    last_seen: {(site_id, param): epoch seconds of the newest point already held}.
+    Gauges are sorted by that timestamp before chunking so one startDT (the chunk's oldest)
+    fits every site in the request. Responses bypass the disk cache (one-off URLs).
+    Returns {(site_id, param): GaugeSeries of new points}; failed chunks are left out.
+    """
+    by_param = {}
+    for (site_id, param), last_s in last_seen.items():
+        by_param.setdefault(param, []).append((last_s, site_id))
+    tasks = []
+    for param, items in by_param.items():
+        items.sort()
+        for chunk in _chunks(items, USGS_MAX_SITES):
+            extra = dict(extra_params or {}, startDT=usgs_start_dt(chunk[0][0]))
+            tasks.append(_fetch_usgs_chunk(session, [s for _, s in chunk], param, None, extra, timeout, cache=False))
+    results = {}
+    for part in await asyncio.gather(*tasks):
+        if part: results.update(part)
+    return results
+
+async def fetch_usgs_range_async(session, site_ids, param, start, end, daily=False, timeout=60):
+    """Explicit startDT/endDT pull (dates) for backfills: IV, or daily means when daily=True.
+
+    Returns {(site_id, param): GaugeSeries} or a FetchError. Bypasses the response cache.
+    """
+    extra = {"startDT": start.strftime("%Y-%m-%d"), "endDT": end.strftime("%Y-%m-%d"), "siteStatus": "all"}
+    if daily:
+        return await _fetch_usgs_chunk(session, site_ids, param, None, extra, timeout, False, USGS_DV_URL, USGS_DV_MEAN)
+    return await _fetch_usgs_chunk(session, site_ids, param, None, extra, timeout, False)
+
+async def fetch_usgs_gauge_async(session, site_id, param, period="P3D", extra_params=None, timeout=15):
+    """One gauge -> GaugeSeries, None if NWIS has no data for it, or a FetchError."""
+    part = await _fetch_usgs_chunk(session, [site_id], param, period, extra_params, timeout)
+    if isinstance(part, FetchError): return part
+    return part[(site_id, param)] or None
+
+# ============================================================
+# 3. SHARED GAUGE-OBSERVATION STORE
+# ============================================================
+
+# Widest window any page needs (dashboard P3D); the planner reads a 48h slice.
+GAUGE_WINDOW = "P3D"
+GAUGE_WINDOW_HOURS = 72
+GAUGE_MAX_AGE_S = 300  # Consumers trigger a store refresh if the snapshot is older
+GAUGE_FULL_RESYNC_S = 6 * 3600  # Full-window pull that picks up USGS provisional revisions and fills gaps
+
+# Rolling windows kept between refreshes so later refreshes only fetch new readings.
+# Only the refresher thread writes these.
+_RETAINED = {}
+_LAST_FULL_SYNC = {"at": 0.0}
+_STORE_LISTENERS = []
+
+# One worker: listener runs never overlap (history merges are read-modify-write) and the
+# refresh publishes its snapshot without waiting on them
+_LISTENER_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gauge-store-listeners")
+
+def add_store_listener(fn):
+    """fn(store) runs in the background after every store refresh, e.g. to persist history."""
+    if fn not in _STORE_LISTENERS: _STORE_LISTENERS.append(fn)
+
+def _notify_store_listeners(store):
+    for fn in list(_STORE_LISTENERS):
+        try:
+            fn(store)
+        except Exception:
+            pass  # A listener must never break the live refresh
+
+_GAUGE_REGISTRY = set()
+_GAUGE_REGISTRY_LOCK = threading.Lock()
+
+def register_gauges(gauges):
+    """Adds (site_id, param) pairs to the shared store's fetch list (called at import by each page)."""
+    with _GAUGE_REGISTRY_LOCK:
+        for site_id, param in gauges:
+            if site_id and site_id != "NO_GAUGE": _GAUGE_REGISTRY.add((site_id, param))
+
+def registered_gauges():
+    with _GAUGE_REGISTRY_LOCK:
+        return sorted(_GAUGE_REGISTRY)
+
+@timed("gauge_store_refresh")
+async def fetch_gauge_store():
+    """One USGS fan-out for every registered gauge: {(site_id, param): GaugeSeries}.
+
+    Gauges with a recent retained window are fetched incrementally (startDT = last reading)
+    and appended; new gauges, stale windows and the periodic resync pull the full window.
+    """
+    gauges = registered_gauges()
+    now_s = time.time()
+    window_s = GAUGE_WINDOW_HOURS * 3600
+    full_resync = now_s - _LAST_FULL_SYNC["at"] >= GAUGE_FULL_RESYNC_S
+    last_seen = {}
+    if not full_resync:
+        for key in gauges:
+            old = _RETAINED.get(key)
+            if old and now_s - old.t[-1] < window_s: last_seen[key] = int(old.t[-1])
+    full = [g for g in gauges if g not in last_seen]
+    metrics.inc("gauge_fetches_total", len(full), mode="full")
+    metrics.inc("gauge_fetches_total", len(last_seen), mode="delta")
+
+    async with pooled_session() as raw_session:
+        session = refresh_session(raw_session)
+        extra = {"siteStatus": "all"}
+        batch, delta = await asyncio.gather(
+            fetch_usgs_batch_async(session, full, period=GAUGE_WINDOW, extra_params=extra),
+            fetch_usgs_delta_async(session, last_seen, extra)
+        )
+        for key, newer in delta.items():
+            batch[key] = _RETAINED[key].append(newer, window_s)
+        # Gauges from a failed request get one full single-site retry each
+        missing = [g for g in gauges if g not in batch]
+        retries = await asyncio.gather(*[
+            _fetch_usgs_chunk(session, [site_id], param, GAUGE_WINDOW, extra, 8) for site_id, param in missing
+        ])
+        for key, part in zip(missing, retries):
+            if part: batch.update(part)
+            elif _RETAINED.get(key): batch[key] = _RETAINED[key]  # Keep the last good window
+            else: batch[key] = part  # FetchError: recorded so readers can report why
+
+    if full_resync: _LAST_FULL_SYNC["at"] = now_s
+    _RETAINED.clear()
+    _RETAINED.update({k: v for k, v in batch.items() if isinstance(v, GaugeSeries) and v})
+    if _STORE_LISTENERS:
+        _LISTENER_EXECUTOR.submit(_notify_store_listeners, dict(batch))
+    return batch
+
+def get_gauge_refresher():
+    return get_refresher("gauges", fetch_gauge_store)
+
+def get_gauge_store(max_age_s=GAUGE_MAX_AGE_S, revalidate=False):
+    """Latest shared store, refreshed first if missing or older than max_age_s.
+
+    revalidate=True refreshes it regardless, past the disk cache's fresh window.
+    Blocking; async callers should run it in an executor. Returns {} if nothing could be fetched.
+    """
+    refresher = get_gauge_refresher()
+    age = refresher.snapshot_age_s()
+    if revalidate or age is None or age > max_age_s:
+        snap = refresher.refresh_and_wait(revalidate=revalidate)
+    else:
+        snap = refresher.latest()
+    return snap.data if snap else {}
+
+async def get_gauge_store_async(max_age_s=GAUGE_MAX_AGE_S):
+    # A manual refresh of the caller (http_v2.revalidating) refreshes the store too
+    return await asyncio.get_running_loop().run_in_executor(None, get_gauge_store, max_age_s, revalidation_requested())
+
+def gauge_series(store, site_id, param, hours=None):
+    """One gauge's stored GaugeSeries, limited to the last `hours` if given (a view, no copy).
+
+    Returns None when the gauge is not in the store (caller may fetch it directly),
+    or the stored FetchError if the store could not get it.
+    """
+    if (site_id, param) not in store: return None
+    series = store[(site_id, param)]
+    if isinstance(series, FetchError) or hours is None: return series
+    return series.last_hours(hours)
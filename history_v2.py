@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""Local multi-season gauge history.
+
+Observations live in SQLite as one row per (gauge, kind, month): the month's int64
+epoch seconds and float32 values stored as two raw array blobs, so a range query
+reads a handful of contiguous partitions and np.frombuffer()s them back into a
+GaugeSeries without touching the network. The live gauge refresher appends every
+refresh; `python history_v2.py backfill` pulls years of NWIS daily or IV data in
+batched requests.
+"""
+import argparse
+import asyncio
+import datetime as dt
+import os
+import sqlite3
+import sys
+import threading
+
+import numpy as np
+
+from gauges_v2 import (
+    USGS_MAX_ROWS_PER_REQUEST, USGS_MAX_SITES, USGS_ROWS_PER_HOUR,
+    GaugeSeries, add_store_listener, fetch_usgs_range_async, registered_gauges,
+)
+from http_v2 import FetchError, pooled_session, refresh_session
+
+# ============================================================
+# 1. PARTITIONED STORE
+# ============================================================
+
+HISTORY_PATH = os.environ.get("STEELHEAD_HISTORY_DB", os.path.join(".cache", "gauge_history.sqlite"))
+KIND_IV = "iv"  # 15-minute instantaneous values
+KIND_DV = "dv"  # Daily means (timestamps are UTC midnight of the gauge's local date)
+
+def _epoch_s(x):
+    """datetime (aware, or naive UTC) / date / epoch seconds / None -> int epoch seconds or None."""
+    if x is None: return None
+    if isinstance(x, dt.datetime):
+        if x.tzinfo is None: x = x.replace(tzinfo=dt.timezone.utc)
+        return int(x.timestamp())
+    if isinstance(x, dt.date):
+        return int(dt.datetime(x.year, x.month, x.day, tzinfo=dt.timezone.utc).timestamp())
+    return int(x)
+
+def _month_keys(t):
+    """Epoch seconds -> months since 1970-01 (the partition key)."""
+    return t.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+
+class HistoryStore:
+    """Per-gauge, per-month columnar partitions of observations in one SQLite file.
+
+    Writes merge into the existing partition (newer values win on the same timestamp,
+    so provisional readings get revised). Storage errors degrade to empty reads and
+    dropped writes; history is an optimization, never a dependency of the live pages.
+    """
+
+    def __init__(self, path=HISTORY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            folder = os.path.dirname(self.path)
+            if folder: os.makedirs(folder, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS partitions ("
+                " site_id TEXT, param TEXT, kind TEXT, month INTEGER,"
+                " n INTEGER, first_t INTEGER, last_t INTEGER, utc_offset_s INTEGER,"
+                " t BLOB, v BLOB, PRIMARY KEY (site_id, param, kind, month)) WITHOUT ROWID"
+            )
+        return self._conn
+
+    def write(self, series, kind=KIND_IV):
+        """Merges a GaugeSeries into its month partitions; returns points now stored for those months."""
+        if not isinstance(series, GaugeSeries) or not series or not series.site_id: return 0
+        t, v = np.asarray(series.t), np.asarray(series.v)
+        months = _month_keys(t)
+        bounds = np.flatnonzero(np.diff(months)) + 1
+        stored = 0
+        try:
+            with self._lock:
+                db = self._db()
+                for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(t)]):
+                    month = int(months[lo])
+                    row = db.execute(
+                        "SELECT t, v FROM partitions WHERE site_id = ? AND param = ? AND kind = ? AND month = ?",
+                        (series.site_id, series.param, kind, month)
+                    ).fetchone()
+                    mt, mv = t[lo:hi], v[lo:hi]
+                    if row:
+                        mt = np.concatenate([np.frombuffer(row[0], np.int64), mt])
+                        mv = np.concatenate([np.frombuffer(row[1], np.float32), mv])
+                        # Stable sort keeps arrival order within a timestamp; keep the last (newest) one
+                        order = np.argsort(mt, kind="stable")
+                        mt, mv = mt[order], mv[order]
+                        last = np.r_[mt[1:] != mt[:-1], True]
+                        mt, mv = mt[last], mv[last]
+                    db.execute(
+                        "INSERT OR REPLACE INTO partitions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (series.site_id, series.param, kind, month, len(mt), int(mt[0]), int(mt[-1]),
+                         series.utc_offset_s, mt.astype(np.int64).tobytes(), mv.astype(np.float32).tobytes())
+                    )
+                    stored += len(mt)
+                db.commit()
+        except Exception:
+            return 0
+        return stored
+
+    def query(self, site_id, param, start=None, end=None, kind=KIND_IV):
+        """Observations with start <= t <= end (datetimes, dates or epoch seconds) as one GaugeSeries."""
+        lo, hi = _epoch_s(start), _epoch_s(end)
+        sql = "SELECT t, v, utc_offset_s FROM partitions WHERE site_id = ? AND param = ? AND kind = ?"
+        args = [site_id, param, kind]
+        if lo is not None:
+            sql += " AND last_t >= ?"; args.append(lo)
+        if hi is not None:
+            sql += " AND first_t <= ?"; args.append(hi)
+        try:
+            with self._lock:
+                rows = self._db().execute(sql + " ORDER BY month", args).fetchall()
+        except Exception:
+            rows = []
+        meta = {"site_id": site_id, "param": param, "source": "USGS"}
+        if not rows: return GaugeSeries.empty(**meta)
+        t = np.concatenate([np.frombuffer(r[0], np.int64) for r in rows])
+        v = np.concatenate([np.frombuffer(r[1], np.float32) for r in rows])
+        i = 0 if lo is None else int(np.searchsorted(t, lo, side="left"))
+        j = len(t) if hi is None else int(np.searchsorted(t, hi, side="right"))
+        return GaugeSeries(t[i:j], v[i:j], utc_offset_s=rows[-1][2], **meta)
+
+    def last_hours(self, site_id, param, hours, now=None, kind=KIND_IV):
+        end = dt.datetime.now(dt.timezone.utc) if now is None else now
+        return self.query(site_id, param, _epoch_s(end) - int(hours * 3600), end, kind)
+
+    def extent(self, site_id, param, kind=KIND_IV):
+        """(first datetime UTC, last datetime UTC, points) held for a gauge, or None."""
+        try:
+            with self._lock:
+                row = self._db().execute(
+                    "SELECT MIN(first_t), MAX(last_t), SUM(n) FROM partitions WHERE site_id = ? AND param = ? AND kind = ?",
+                    (site_id, param, kind)
+                ).fetchone()
+        except Exception:
+            return None
+        if not row or row[0] is None: return None
+        to_dt = lambda s: dt.datetime.fromtimestamp(s, dt.timezone.utc)
+        return to_dt(row[0]), to_dt(row[1]), int(row[2])
+
+    def summary(self):
+        """[(site_id, param, kind, months, points, first_t, last_t)] for every stored gauge."""
+        try:
+            with self._lock:
+                return self._db().execute(
+                    "SELECT site_id, param, kind, COUNT(*), SUM(n), MIN(first_t), MAX(last_t)"
+                    " FROM partitions GROUP BY site_id, param, kind ORDER BY site_id, param, kind"
+                ).fetchall()
+        except Exception:
+            return []
+
+_HISTORY = None
+_HISTORY_LOCK = threading.Lock()
+
+def get_history_store():
+    global _HISTORY
+    with _HISTORY_LOCK:
+        if _HISTORY is None: _HISTORY = HistoryStore()
+        return _HISTORY
+
+def history_series(site_id, param, start=None, end=None, kind=KIND_IV):
+    return get_history_store().query(site_id, param, start, end, kind)
+
+SEASON_HALF_WIDTH_DAYS = 15
+SEASON_YEARS = 10
+
+def _daily_means(series):
+    day = np.asarray(series.t) // 86400
+    days, idx = np.unique(day, return_inverse=True)
+    v = np.bincount(idx, weights=np.asarray(series.v, dtype=np.float64)) / np.bincount(idx)
+    return days * 86400, v
+
+def seasonal_daily(site_id, param, center, half_width_days=SEASON_HALF_WIDTH_DAYS, years=SEASON_YEARS):
+    """Daily means within +/- half_width_days of center's calendar date in each of the past
+    `years` years -> GaugeSeries (t = UTC midnight). Daily values where backfilled, else IV
+    averaged per UTC day; only years the store actually holds are queried.
+    """
+    store = get_history_store()
+    center = center.date() if isinstance(center, dt.datetime) else center
+    first = [e[0].date() for e in (store.extent(site_id, param, k) for k in (KIND_DV, KIND_IV)) if e]
+    ts, vs = [], []
+    for y in range(1, years + 1):
+        try:
+            c = center.replace(year=center.year - y)
+        except ValueError:
+            c = center.replace(year=center.year - y, day=28)  # Feb 29
+        lo, hi = c - dt.timedelta(days=half_width_days), c + dt.timedelta(days=half_width_days)
+        if not first or hi < min(first): break
+        s = store.query(site_id, param, lo, hi, KIND_DV)
+        if s:
+            ts.append(np.asarray(s.t)), vs.append(np.asarray(s.v, dtype=np.float64))
+            continue
+        s = store.query(site_id, param, lo, hi, KIND_IV)
+        if s:
+            t, v = _daily_means(s)
+            ts.append(t), vs.append(v)
+    meta = {"site_id": site_id, "param": param, "source": "USGS"}
+    if not ts: return GaugeSeries.empty(**meta)
+    t, v = np.concatenate(ts), np.concatenate(vs)
+    order = np.argsort(t, kind="stable")
+    return GaugeSeries(t[order], v[order].astype(np.float32), **meta)
+
+# ============================================================
+# 2. LIVE FILL FROM THE GAUGE REFRESHER
+# ============================================================
+
+def record_gauge_store(store):
+    """Store listener: persists every series of a refreshed gauge store (in the background)."""
+    history = get_history_store()
+    for series in (store or {}).values():
+        if isinstance(series, GaugeSeries) and series: history.write(series, KIND_IV)
+
+add_store_listener(record_gauge_store)
+
+# ============================================================
+# 3. BULK BACKFILL
+# ============================================================
+
+BACKFILL_IV_WINDOW_DAYS = 31  # One request spans at most this many days of IV data
+BACKFILL_DV_WINDOW_DAYS = 3650
+BACKFILL_CONCURRENCY = 4
+
+def backfill_plan(gauges, start, end, daily=False):
+    """[(param, [site_ids], window_start, window_end)] batches sized to USGS_MAX_ROWS_PER_REQUEST."""
+    span = BACKFILL_DV_WINDOW_DAYS if daily else BACKFILL_IV_WINDOW_DAYS
+    by_param = {}
+    for site_id, param in sorted(set(gauges)):
+        by_param.setdefault(param, []).append(site_id)
+    plan = []
+    day = start
+    while day <= end:
+        window_end = min(end, day + dt.timedelta(days=span - 1))
+        days = (window_end - day).days + 1
+        rows = days if daily else days * 24 * USGS_ROWS_PER_HOUR
+        per_request = max(1, min(USGS_MAX_SITES, USGS_MAX_ROWS_PER_REQUEST // rows))
+        for param, sites in by_param.items():
+            for i in range(0, len(sites), per_request):
+                plan.append((param, sites[i:i + per_request], day, window_end))
+        day = window_end + dt.timedelta(days=1)
+    return plan
+
+async def backfill_async(gauges, start, end, daily=False, store=None, progress=None):
+    """Pulls [start, end] (dates) for every (site_id, param) into the history store.
+
+    Returns (points written, [FetchError]). Batches run a few at a time through the
+    shared session stack, so the per-host rate limits and retries still apply.
+    """
+    store = store or get_history_store()
+    kind = KIND_DV if daily else KIND_IV
+    plan = backfill_plan(gauges, start, end, daily)
+    gate = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+    written, errors, done = [0], [], [0]
+    loop = asyncio.get_running_loop()
+
+    async with pooled_session() as raw:
+        session = refresh_session(raw)
+
+        async def run(param, sites, lo, hi):
+            async with gate:
+                batch = await fetch_usgs_range_async(session, sites, param, lo, hi, daily)
+            if isinstance(batch, FetchError):
+                errors.append(batch)
+            else:
+                for series in batch.values():
+                    await loop.run_in_executor(None, store.write, series, kind)
+                    written[0] += len(series)
+            done[0] += 1
+            if progress: progress(done[0], len(plan), param, sites, lo, hi)
+
+        await asyncio.gather(*(run(*step) for step in plan))
+    return written[0], errors
+
+def _parse_gauges(text):
+    """'11477000:00060,14306500' -> [(site_id, param)] (param defaults to discharge)."""
+    out = []
+    for item in filter(None, (s.strip() for s in (text or "").split(","))):
+        site_id, _, param = item.partition(":")
+        out.append((site_id, param or "00060"))
+    return out
+
+def _page_gauges():
+    """Every USGS gauge the pages register at import (the same list the live refresher polls)."""
+    import dashboard_v2  # noqa: F401 (registers coastal gauges)
+    import planner_v3  # noqa: F401 (registers planner gauges)
+    return registered_gauges()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local gauge history store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    fill = sub.add_parser("backfill", help="pull NWIS history into the store")
+    fill.add_argument("--start", required=True, type=dt.date.fromisoformat, help="YYYY-MM-DD")
+    fill.add_argument("--end", type=dt.date.fromisoformat, default=dt.date.today(), help="YYYY-MM-DD (default today)")
+    fill.add_argument("--daily", action="store_true", help="daily means (dv) instead of 15-minute IV")
+    fill.add_argument("--gauges", help="site[:param],... (default: every gauge the pages use)")
+    sub.add_parser("summary", help="list stored gauges")
+    args = parser.parse_args(argv)
+
+    store = get_history_store()
+    if args.command == "summary":
+        for site_id, param, kind, months, points, first_t, last_t in store.summary():
+            first = dt.datetime.fromtimestamp(first_t, dt.timezone.utc).date()
+            last = dt.datetime.fromtimestamp(last_t, dt.timezone.utc).date()
+            print(f"{site_id:>10} {param} {kind}  {first} .. {last}  {points:>9,} pts  {months} months")
+        return 0
+
+    gauges = _parse_gauges(args.gauges) if args.gauges else _page_gauges()
+    def progress(done, total, param, sites, lo, hi):
+        print(f"[{done}/{total}] {param} {lo}..{hi} ({len(sites)} sites)", file=sys.stderr)
+    written, errors = asyncio.run(backfill_async(gauges, args.start, args.end, args.daily, store, progress))
+    print(f"Stored {written:,} points for {len(gauges)} gauges into {store.path}")
+    for err in errors:
+        print(f"  failed batch: {err}", file=sys.stderr)
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
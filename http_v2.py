@@ -0,0 +1,629 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import weakref
+import zlib
+from urllib.parse import urlsplit
+
+import aiohttp
+
+import metrics_v2 as metrics
+
+# ============================================================
+# 1. SINGLE-FLIGHT REQUEST DEDUPLICATION
+# ============================================================
+
+class BufferedResponse:
+    """A fully read response that several callers can share.
+
+    Mirrors the parts of aiohttp.ClientResponse the fetchers use
+    (status, headers, read/text/json, async context manager).
+    """
+
+    def __init__(self, status, headers, body, encoding=None):
+        self.status = status
+        self.headers = headers
+        self._body = body
+        self._encoding = encoding or "utf-8"
+        self._json = None
+        self._json_ready = False
+
+    async def read(self):
+        return self._body
+
+    async def text(self, encoding=None):
+        return self._body.decode(encoding or self._encoding, errors="replace")
+
+    async def json(self, **kwargs):
+        # Parsed once, then shared by every caller of the same request
+        if not self._json_ready:
+            self._json = json.loads(self._body.decode(self._encoding, errors="replace"))
+            self._json_ready = True
+        return self._json
+
+    def release(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+def request_key(url, params=None):
+    """Canonical (URL, params) key used to spot duplicate requests."""
+    if not params: return (str(url), ())
+    items = params.items() if hasattr(params, "items") else params
+    return (str(url), tuple(sorted((str(k), str(v)) for k, v in items)))
+
+class _PendingRequest:
+    """`async with` adapter so wrapped sessions keep the session.get() call shape."""
+
+    def __init__(self, handler, url, params, kwargs):
+        self._handler, self._url, self._params, self._kwargs = handler, url, params, kwargs
+
+    async def __aenter__(self):
+        return await self._handler(self._url, self._params, self._kwargs)
+
+    async def __aexit__(self, *exc):
+        return False
+
+class SingleFlightSession:
+    """Request-scoped wrapper around an aiohttp session.
+
+    Concurrent (and repeated) GETs for the same (URL, params) share one
+    in-flight request; later callers await the same future and get the
+    same buffered response. Create one per refresh so results never go stale.
+    """
+
+    def __init__(self, session):
+        self._session = session
+        self._inflight = {}
+
+    def get(self, url, params=None, **kwargs):
+        return _PendingRequest(self._get, url, params, kwargs)
+
+    async def _get(self, url, params, kwargs):
+        key = request_key(url, params)
+        fut = self._inflight.get(key)
+        if fut is None:
+            metrics.record_cache("single_flight", "miss")
+            fut = asyncio.ensure_future(self._fetch(url, params, kwargs))
+            self._inflight[key] = fut
+        else:
+            metrics.record_cache("single_flight", "hit")
+        # Shield so one caller timing out does not cancel the request for the others
+        return await asyncio.shield(fut)
+
+    async def _fetch(self, url, params, kwargs):
+        async with self._session.get(url, params=params, **kwargs) as resp:
+            body = await resp.read()
+            return BufferedResponse(resp.status, resp.headers, body, getattr(resp, "charset", None))
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+# ============================================================
+# 2. PERSISTENT RESPONSE CACHE (ETAG / LAST-MODIFIED)
+# ============================================================
+
+HTTP_CACHE_PATH = os.environ.get("STEELHEAD_HTTP_CACHE", os.path.join(".cache", "http_cache.sqlite"))
+HTTP_CACHE_FRESH_S = 300        # Served from disk without contacting upstream inside this window
+HTTP_CACHE_MAX_STALE_S = 3600   # Older entries are served at once while revalidating, up to this age
+
+# Set for one fetch job (see revalidating) to send every cached GET upstream
+_REVALIDATE = contextvars.ContextVar("http_revalidate", default=False)
+
+async def revalidating(coro):
+    """Runs coro with the fresh window off: each disk-cached GET sends a conditional request.
+
+    Used for manual refreshes. The flag lives in this task's context, so the fetch's
+    own subtasks see it and other jobs on the loop do not.
+    """
+    _REVALIDATE.set(True)
+    return await coro
+
+def revalidation_requested():
+    """True inside a revalidating() job (e.g. to pass a manual refresh on to other refreshers)."""
+    return _REVALIDATE.get()
+
+class ResponseCache:
+    """SQLite store of zlib-compressed 200 responses plus their validators.
+
+    Survives restarts, redeploys and st.cache_data clears. Any storage error
+    degrades to a cache miss rather than failing the fetch.
+    """
+
+    def __init__(self, path=HTTP_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            folder = os.path.dirname(self.path)
+            if folder: os.makedirs(folder, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, url TEXT, etag TEXT, last_modified TEXT,"
+                " content_type TEXT, encoding TEXT, stored_at REAL, body BLOB)"
+            )
+        return self._conn
+
+    def get(self, key):
+        try:
+            with self._lock:
+                row = self._db().execute(
+                    "SELECT etag, last_modified, content_type, encoding, stored_at, body FROM responses WHERE key = ?",
+                    (key,)
+                ).fetchone()
+        except Exception:
+            return None
+        if not row: return None
+        etag, last_modified, content_type, encoding, stored_at, body = row
+        try:
+            body = zlib.decompress(body)
+        except Exception:
+            return None
+        return {
+            "etag": etag, "last_modified": last_modified, "content_type": content_type,
+            "encoding": encoding, "stored_at": stored_at, "body": body
+        }
+
+    def put(self, key, url, body, etag=None, last_modified=None, content_type=None, encoding=None):
+        try:
+            with self._lock:
+                db = self._db()
+                db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, url, etag, last_modified, content_type, encoding, time.time(), zlib.compress(body))
+                )
+                db.commit()
+        except Exception:
+            pass
+
+    def touch(self, key):
+        try:
+            with self._lock:
+                db = self._db()
+                db.execute("UPDATE responses SET stored_at = ? WHERE key = ?", (time.time(), key))
+                db.commit()
+        except Exception:
+            pass
+
+_RESPONSE_CACHE = None
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+def get_response_cache():
+    """Process-wide ResponseCache (one SQLite connection per process)."""
+    global _RESPONSE_CACHE
+    with _RESPONSE_CACHE_LOCK:
+        if _RESPONSE_CACHE is None:
+            _RESPONSE_CACHE = ResponseCache()
+        return _RESPONSE_CACHE
+
+def _cached_response(entry):
+    headers = {"Content-Type": entry["content_type"]} if entry.get("content_type") else {}
+    return BufferedResponse(200, headers, entry["body"], entry.get("encoding"))
+
+_REVALIDATING = {}  # cache key -> background revalidation task (runtime loop only)
+
+class DiskCachedSession:
+    """Wraps an aiohttp session with the persistent ResponseCache.
+
+    - Entries younger than fresh_s are returned straight from disk.
+    - Entries up to max_stale_s old are returned straight from disk too, while an
+      If-None-Match / If-Modified-Since request refreshes them in the background
+      (stale-while-revalidate; on the shared runtime loop only).
+    - Older entries, and every entry inside revalidating(), are revalidated before
+      returning; a 304 refreshes the entry and returns the stored body.
+    - If upstream errors or times out, the stored copy is served (stale-if-error).
+    - get(..., cache=False) bypasses the store for one-off URLs (e.g. incremental startDT windows).
+    SQLite reads and writes run in the default executor, off the event loop.
+    """
+
+    def __init__(self, session, cache=None, fresh_s=HTTP_CACHE_FRESH_S, max_stale_s=HTTP_CACHE_MAX_STALE_S):
+        self._session = session
+        self._cache = cache or get_response_cache()
+        self._fresh_s = fresh_s
+        self._max_stale_s = max_stale_s
+
+    def get(self, url, params=None, **kwargs):
+        return _PendingRequest(self._get, url, params, kwargs)
+
+    async def _get(self, url, params, kwargs):
+        kwargs = dict(kwargs)
+        if not kwargs.pop("cache", True):
+            async with self._session.get(url, params=params, **kwargs) as resp:
+                return BufferedResponse(resp.status, resp.headers, await resp.read(), getattr(resp, "charset", None))
+
+        key = json.dumps(request_key(url, params))
+        loop = asyncio.get_running_loop()
+        entry = await loop.run_in_executor(None, self._cache.get, key)
+        age = time.time() - entry["stored_at"] if entry else None
+        if entry and not _REVALIDATE.get():
+            if age < self._fresh_s:
+                metrics.record_cache("disk", "fresh")
+                return _cached_response(entry)
+            if age < self._max_stale_s and _RUNTIME is not None and loop is _RUNTIME.loop:
+                metrics.record_cache("disk", "stale_while_revalidate")
+                if key not in _REVALIDATING:
+                    task = asyncio.ensure_future(self._background(url, params, kwargs, key, entry))
+                    _REVALIDATING[key] = task
+                    task.add_done_callback(lambda _: _REVALIDATING.pop(key, None))
+                return _cached_response(entry)
+        return await self._revalidate(url, params, kwargs, key, entry)
+
+    async def _background(self, url, params, kwargs, key, entry):
+        try:
+            await self._revalidate(url, params, kwargs, key, entry)
+        except Exception:
+            pass  # The stale copy was served; the next refresh tries again
+
+    async def _revalidate(self, url, params, kwargs, key, entry):
+        if entry:
+            headers = dict(kwargs.get("headers") or {})
+            if entry.get("etag"): headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"): headers["If-Modified-Since"] = entry["last_modified"]
+            kwargs = dict(kwargs, headers=headers)
+
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._session.get(url, params=params, **kwargs) as resp:
+                if resp.status == 304 and entry:
+                    metrics.record_cache("disk", "not_modified")
+                    await loop.run_in_executor(None, self._cache.touch, key)
+                    return _cached_response(entry)
+                body = await resp.read()
+                charset = getattr(resp, "charset", None)
+                if resp.status == 200:
+                    metrics.record_cache("disk", "changed" if entry else "miss")
+                    await loop.run_in_executor(None, functools.partial(
+                        self._cache.put, key, str(url), body,
+                        etag=resp.headers.get("ETag"),
+                        last_modified=resp.headers.get("Last-Modified"),
+                        content_type=resp.headers.get("Content-Type"),
+                        encoding=charset
+                    ))
+                elif entry and resp.status >= 500:
+                    metrics.record_cache("disk", "stale_on_error")
+                    return _cached_response(entry)
+                return BufferedResponse(resp.status, resp.headers, body, charset)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            if entry:
+                metrics.record_cache("disk", "stale_on_error")
+                return _cached_response(entry)
+            raise
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+# ============================================================
+# 3. PROCESS-WIDE ASYNC RUNTIME + POOLED SESSION
+# ============================================================
+
+POOL_LIMIT = 64            # Total open connections
+POOL_LIMIT_PER_HOST = 8    # Per upstream host (USGS, CDEC, NWPS, api.weather.gov)
+POOL_KEEPALIVE_S = 75
+DNS_CACHE_TTL_S = 600
+SESSION_TIMEOUT_S = 30
+
+def make_connector():
+    return aiohttp.TCPConnector(
+        ssl=False,
+        limit=POOL_LIMIT,
+        limit_per_host=POOL_LIMIT_PER_HOST,
+        keepalive_timeout=POOL_KEEPALIVE_S,
+        use_dns_cache=True,
+        ttl_dns_cache=DNS_CACHE_TTL_S,
+    )
+
+def make_session():
+    return aiohttp.ClientSession(
+        connector=make_connector(),
+        timeout=aiohttp.ClientTimeout(total=SESSION_TIMEOUT_S),
+        headers={"Accept-Encoding": "gzip, deflate"},
+    )
+
+class AsyncRuntime:
+    """One daemon thread running one event loop, plus one long-lived ClientSession.
+
+    Fetch jobs from every page are submitted here, so DNS, TCP and TLS
+    connections to the upstream hosts are reused across refreshes.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._session = None
+        self._thread = threading.Thread(target=self.loop.run_forever, name="async-runtime", daemon=True)
+        self._thread.start()
+
+    async def session(self):
+        # Created lazily on the runtime loop; recreated if it was ever closed
+        if self._session is None or self._session.closed:
+            self._session = make_session()
+        return self._session
+
+    def submit(self, coro):
+        """Schedules a coroutine on the runtime loop; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Blocking submit-and-wait for use from ordinary threads."""
+        fut = self.submit(coro)
+        try:
+            return fut.result(timeout)
+        except BaseException:
+            fut.cancel()
+            raise
+
+_RUNTIME = None
+_RUNTIME_LOCK = threading.Lock()
+
+def get_runtime():
+    global _RUNTIME
+    with _RUNTIME_LOCK:
+        if _RUNTIME is None:
+            _RUNTIME = AsyncRuntime()
+        return _RUNTIME
+
+@contextlib.asynccontextmanager
+async def pooled_session():
+    """Yields the runtime's pooled session when running on the runtime loop.
+
+    Called from any other event loop (scripts, ad-hoc runs) it yields a
+    short-lived session with the same tuning and closes it afterwards.
+    """
+    if _RUNTIME is not None and asyncio.get_running_loop() is _RUNTIME.loop:
+        yield await _RUNTIME.session()
+    else:
+        async with make_session() as session:
+            yield session
+
+# ============================================================
+# 4. PER-HOST RATE LIMITING, RETRIES + CIRCUIT BREAKER
+# ============================================================
+
+# host -> (max concurrent requests, sustained requests/sec, burst)
+HOST_LIMITS = {
+    "waterservices.usgs.gov": (4, 5.0, 10),
+    "cdec.water.ca.gov": (2, 2.0, 4),
+    "api.water.noaa.gov": (8, 10.0, 20),
+    "api.weather.gov": (4, 3.0, 6),
+}
+DEFAULT_HOST_LIMIT = (4, 5.0, 10)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 2
+BACKOFF_BASE_S = 0.5
+BACKOFF_MAX_S = 8.0
+BREAKER_THRESHOLD = 5    # Consecutive failed requests (after retries) before a host is cut off
+BREAKER_COOLDOWN_S = 60  # Then one probe request is let through
+
+class FetchError:
+    """Structured failure result returned by fetchers instead of []/None.
+
+    Falsy and iterable-as-empty, so existing `if not series` checks still
+    treat it as "no data", while the UI can say why.
+    """
+
+    __slots__ = ("source", "kind", "status", "detail")
+
+    def __init__(self, source, kind, status=None, detail=""):
+        self.source, self.kind, self.status, self.detail = source, kind, status, detail
+
+    def __bool__(self):
+        return False
+
+    def __iter__(self):
+        return iter(())
+
+    def describe(self):
+        return f"{self.source} {self.kind}" + (f" {self.status}" if self.status else "")
+
+    def __repr__(self):
+        return f"FetchError({self.describe()!r}, detail={self.detail!r})"
+
+class CircuitOpenError(Exception):
+    def __init__(self, host):
+        super().__init__(f"circuit open for {host}")
+        self.host = host
+
+def error_from_status(source, status):
+    kind = "rate_limited" if status == 429 else "http"
+    metrics.record_fetch_error(source, kind)
+    return FetchError(source, kind, status)
+
+def error_from_exception(source, exc):
+    if isinstance(exc, CircuitOpenError): kind = "circuit_open"
+    elif isinstance(exc, asyncio.TimeoutError): kind = "timeout"
+    elif isinstance(exc, (aiohttp.ClientError, OSError)): kind = "network"
+    elif isinstance(exc, (ValueError, KeyError, IndexError, TypeError)): kind = "parse"
+    else: kind = type(exc).__name__
+    metrics.record_fetch_error(source, kind)
+    return FetchError(source, kind, detail=str(exc)[:200])
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() sleeps until a token is available."""
+
+    def __init__(self, rate, burst):
+        self.rate, self.capacity = rate, float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self._take()
+            if wait <= 0: return
+            await asyncio.sleep(wait)
+
+class CircuitBreaker:
+    """Closed -> open after BREAKER_THRESHOLD consecutive failures -> half-open probe after cooldown."""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown_s=BREAKER_COOLDOWN_S):
+        self.threshold, self.cooldown_s = threshold, cooldown_s
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True when closed; "probe" for the single half-open probe (truthy); False while open."""
+        with self._lock:
+            if self.opened_at is None: return True
+            if self._probing or time.monotonic() - self.opened_at < self.cooldown_s: return False
+            self._probing = True
+            return "probe"
+
+    def release_probe(self):
+        """A probe that ended without an outcome (cancelled): stay open for another cooldown."""
+        with self._lock:
+            if self._probing:
+                self._probing = False
+                self.opened_at = time.monotonic()
+
+    def record_success(self):
+        with self._lock:
+            self.failures, self.opened_at, self._probing = 0, None, False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None: return "closed"
+        return "half-open" if self._probing else "open"
+
+class _HostPolicy:
+    def __init__(self, host):
+        _, rate, burst = HOST_LIMITS.get(host, DEFAULT_HOST_LIMIT)
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker()
+
+_HOST_POLICIES = {}
+_HOST_POLICIES_LOCK = threading.Lock()
+_HOST_SEMAPHORES = weakref.WeakKeyDictionary()  # loop -> {host: Semaphore}
+
+def host_policy(host):
+    """Process-wide bucket + breaker for one upstream host."""
+    with _HOST_POLICIES_LOCK:
+        policy = _HOST_POLICIES.get(host)
+        if policy is None:
+            policy = _HostPolicy(host)
+            _HOST_POLICIES[host] = policy
+        return policy
+
+def _host_semaphore(host):
+    # asyncio semaphores are bound to one loop, so keep one set per loop
+    per_loop = _HOST_SEMAPHORES.setdefault(asyncio.get_running_loop(), {})
+    sem = per_loop.get(host)
+    if sem is None:
+        sem = asyncio.Semaphore(HOST_LIMITS.get(host, DEFAULT_HOST_LIMIT)[0])
+        per_loop[host] = sem
+    return sem
+
+def _retry_delay(attempt, retry_after=None):
+    if retry_after:
+        try:
+            return min(BACKOFF_MAX_S, float(retry_after))
+        except ValueError:
+            pass
+    base = min(BACKOFF_MAX_S, BACKOFF_BASE_S * (2 ** attempt))
+    return base / 2 + random.uniform(0, base / 2)
+
+class ResilientSession:
+    """Per-host concurrency cap, token-bucket rate limit, jittered retries and circuit breaker.
+
+    Retries 429/5xx and network errors up to MAX_RETRIES times (honouring
+    Retry-After). Raises CircuitOpenError without touching the network while
+    a host's breaker is open.
+    """
+
+    def __init__(self, session):
+        self._session = session
+
+    def get(self, url, params=None, **kwargs):
+        return _PendingRequest(self._get, url, params, kwargs)
+
+    async def _get(self, url, params, kwargs):
+        host = urlsplit(str(url)).hostname or ""
+        policy = host_policy(host)
+        probe, settled, attempt = False, False, 0
+        try:
+            while True:
+                try:
+                    async with _host_semaphore(host):
+                        # Checked after queueing so waiters see a breaker that opened meanwhile;
+                        # a half-open probe owns its retries, so it is only admitted once
+                        if not probe:
+                            allowed = policy.breaker.allow()
+                            if not allowed: raise CircuitOpenError(host)
+                            probe = allowed == "probe"
+                        await policy.bucket.acquire()
+                        t0 = time.perf_counter()
+                        try:
+                            async with self._session.get(url, params=params, **kwargs) as resp:
+                                body = await resp.read()
+                                response = BufferedResponse(resp.status, resp.headers, body, getattr(resp, "charset", None))
+                        except Exception as e:
+                            metrics.record_request(host, type(e).__name__, time.perf_counter() - t0)
+                            raise
+                        metrics.record_request(host, response.status, time.perf_counter() - t0, len(body))
+                except (asyncio.CancelledError, CircuitOpenError):
+                    raise
+                except Exception:
+                    # The breaker counts failed requests, not individual attempts
+                    if attempt >= MAX_RETRIES:
+                        settled = True
+                        policy.breaker.record_failure()
+                        raise
+                    await asyncio.sleep(_retry_delay(attempt))
+                    attempt += 1
+                    continue
+
+                if response.status not in RETRY_STATUSES:
+                    settled = True
+                    policy.breaker.record_success()
+                    return response
+                if attempt >= MAX_RETRIES:
+                    settled = True
+                    policy.breaker.record_failure()
+                    return response
+                await asyncio.sleep(_retry_delay(attempt, response.headers.get("Retry-After")))
+                attempt += 1
+        finally:
+            # Cancelled (refresh timeout, river deadline) mid-probe: free the probe slot
+            if probe and not settled: policy.breaker.release_probe()
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+def refresh_session(raw_session):
+    """Standard per-refresh stack: single-flight -> disk cache -> rate limit/retry -> pooled session."""
+    return SingleFlightSession(DiskCachedSession(ResilientSession(raw_session)))
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+# ============================================================
+# 1. TRIP MODEL (HUBS x DAYS AS ARRAYS)
+# ============================================================
+
+DRIVE_HOUR_COST = 0.10    # Score points given up per hour behind the wheel
+FUEL_DOLLAR_COST = 0.01   # Score points given up per fuel dollar ($100 ~ one point)
+FAMILIAR_BONUS = 1.5      # Same boost the greedy walk gave familiar waters when ranking
+MIN_DAY_VALUE = 2.5       # A river-day below this (after the bonus) is not worth fishing
+SHORT_HOP_HOURS = 4.0     # Drive in the morning and fish the same day
+STAY_CAP = 4              # Days in a row one hub is worth fishing (the greedy walk's 1-4); later days are extensions
+TOP_K = 5                 # Distinct alternatives offered next to the best plan
+
+# Drive-cost weightings (per hour, per fuel dollar, per mile) solved side by side to
+# trace the score / miles / fuel trade-off; row 0 is the planner's own objective
+PARETO_WEIGHTS = (
+    (DRIVE_HOUR_COST, FUEL_DOLLAR_COST, 0.0),
+    *((DRIVE_HOUR_COST * s, FUEL_DOLLAR_COST * s, 0.0) for s in (0.0, 0.5, 2.0, 4.0, 8.0, 16.0)),
+    *((0.0, 0.0, m) for m in (0.001, 0.003, 0.01, 0.03)),
+    *((0.0, f, 0.0) for f in (0.005, 0.02, 0.05, 0.1)),
+)
+
+def drive_days(hours):
+    """Hub-to-hub drive -> days consumed: 0 (AM hop), 1 (<= 12 h), 2 (<= 27 h), else 3."""
+    hours = np.asarray(hours, dtype=np.float64)
+    return np.select([hours <= SHORT_HOP_HOURS, hours <= 12, hours <= 27], [0, 1, 2], 3)
+
+def return_days(hours):
+    """Drive home -> days consumed (same thresholds as the planner's get_return_days_needed)."""
+    hours = np.asarray(hours, dtype=np.float64)
+    return np.select([hours <= 12, hours <= 27], [1, 2], 3)
+
+class TripProblem:
+    """One planning request as arrays: H hubs, R fishable options, T days.
+
+    scores is (R, T): the real 0-5 score of option r on day t (flat for today's ratings,
+    day-varying once forecasts are folded in). An option-day is worth its score plus
+    FAMILIAR_BONUS for familiar waters and is eligible from MIN_DAY_VALUE; a hub-day is
+    worth its best eligible option for STAY_CAP days in a row. Drive cost folds hours and
+    fuel into score points. order (H,) places hubs along the coast (NaN = off it): the trip
+    then runs up or down the coast without doubling back, so a stay can't be reset by
+    hopping between neighbours.
+    """
+
+    def __init__(self, hubs, home, options, scores, hours, miles, gas_prices, mpg, gas_adj=0.0, order=None):
+        self.hubs = list(hubs)
+        self.home = self.hubs.index(home)
+        self.options = list(options)  # [{"name", "hub", "label", "familiar"}]
+        self.scores = np.asarray(scores, dtype=np.float64).reshape(len(self.options), -1)
+        self.days = self.scores.shape[1]
+        self.hours = np.asarray(hours, dtype=np.float64)
+        self.miles = np.asarray(miles, dtype=np.float64)
+        gas = np.asarray(gas_prices, dtype=np.float64) + gas_adj
+        self.fuel = self.miles / mpg * gas[:, None]  # Priced where the leg starts
+        self.cost = DRIVE_HOUR_COST * self.hours + FUEL_DOLLAR_COST * self.fuel
+        self.drive_days = drive_days(self.hours)
+        self.return_days = return_days(self.hours[:, self.home])
+        self.return_days[self.home] = 0
+        self.routes = self._route_masks(order)
+        self._hub_values()
+
+    def _route_masks(self, order):
+        """Allowed hub-to-hub moves (directions, H, H): one mask per direction along the coast.
+
+        Home leads anywhere, off-coast hubs lead onto the coast, coastal hubs only onward.
+        """
+        H = len(self.hubs)
+        off_diag = ~np.eye(H, dtype=bool)
+        if order is None: return off_diag[None]
+        pos = np.asarray(order, dtype=np.float64)
+        with np.errstate(invalid="ignore"):
+            ahead = pos[None, :] > pos[:, None]  # NaN compares False
+        onto = ~np.isfinite(pos)[:, None] & np.isfinite(pos)[None, :]
+        masks = np.stack([ahead | onto, ahead.T | onto])
+        masks[:, self.home] = off_diag[self.home]
+        return masks
+
+    def _hub_values(self):
+        H, T = len(self.hubs), self.days
+        hub_of = np.array([self.hubs.index(o["hub"]) for o in self.options], dtype=np.int64)
+        bonus = np.array([FAMILIAR_BONUS if o.get("familiar") else 0.0 for o in self.options])
+        value = self.scores + bonus[:, None]
+        value = np.where(value >= MIN_DAY_VALUE, value, 0.0)
+        self.value = np.zeros((T, H))
+        self.pick = np.full((T, H), -1, dtype=np.int64)
+        for h in np.unique(hub_of):
+            rows = np.flatnonzero(hub_of == h)
+            best = rows[value[rows].argmax(axis=0)]
+            self.value[:, h] = value[best, np.arange(T)]
+            self.pick[:, h] = np.where(self.value[:, h] > 0, best, -1)
+
+# ============================================================
+# 2. DYNAMIC-PROGRAMMING SOLVER
+# ============================================================
+
+class Plan:
+    """A solved itinerary: ordered steps plus its totals.
+
+    steps are (kind, day, from_hub, to_hub, option) with kind in "fish" (option -1 =
+    unscored extension day, e.g. past STAY_CAP), "hop" (AM drive, fish the same day),
+    "drive" and "return".
+    """
+
+    __slots__ = ("steps", "objective", "score", "fish_days", "miles", "hours", "fuel")
+
+    def __init__(self, problem, steps):
+        self.steps = steps
+        self.score = float(sum(problem.scores[o, d] for kind, d, _, _, o in steps if kind == "fish" and o >= 0))
+        self.fish_days = sum(1 for kind, _, h, _, _ in steps if kind == "fish" and h != problem.home)
+        legs = [(a, b) for kind, _, a, b, _ in steps if kind in ("hop", "drive", "return") and a != b]
+        self.miles = float(sum(problem.miles[a, b] for a, b in legs))
+        self.hours = float(sum(problem.hours[a, b] for a, b in legs))
+        self.fuel = float(sum(problem.fuel[a, b] for a, b in legs))
+        fished = sum(problem.value[d, h] for kind, d, h, _, o in steps if kind == "fish" and o >= 0)
+        self.objective = float(fished - sum(problem.cost[a, b] for a, b in legs))
+
+    @property
+    def stops(self):
+        """Hubs in visiting order: two plans with the same stops differ only in timing."""
+        return tuple(b for kind, _, _, b, _ in self.steps if kind in ("hop", "drive"))
+
+    def __repr__(self):
+        return f"Plan(score={self.score:.1f}, fish_days={self.fish_days}, miles={self.miles:.0f}, fuel=${self.fuel:.0f})"
+
+def solve_itinerary(problem, start, opening=()):
+    """Best plan from hub `start` on day 0, back home exactly at the end of the window.
+
+    opening is a fixed run of steps from `start`; the solver plans on from where it ends.
+    """
+    h, d = _after(problem, start, opening)
+    value, action, succ = _solve(problem, problem.cost[None], 1)
+    col = int(np.argmax(value[d, :, h, 0, 0]))
+    return _trace(problem, h, d, value, action, succ, col, 0, opening)
+
+def solve_alternatives(problem, start, k=TOP_K, depth=None, weights=PARETO_WEIGHTS, opening=()):
+    """One batched solve -> (top: up to k best plans with distinct stops, pareto: plans
+    not beaten on all of score, miles and fuel). top[0] is solve_itinerary's plan.
+
+    Keeps the `depth` best continuations per state (default 4k, since many runner-ups
+    only shift a drive by a day) for every weighting in `weights` at once.
+    """
+    depth = depth or 4 * k
+    w = np.asarray(weights, dtype=np.float64)
+    costs = (w[:, 0, None, None] * problem.hours + w[:, 1, None, None] * problem.fuel
+             + w[:, 2, None, None] * problem.miles)
+    costs[0] = problem.cost
+    value, action, succ = _solve(problem, costs, depth)
+    h, d = _after(problem, start, opening)
+    dirs = len(problem.routes)
+
+    plans, seen = [], set()
+    for wi in range(len(w)):
+        # Both directions of one weighting, best first
+        ranked = sorted(((value[d, wi * dirs + r, h, 0, ki], wi * dirs + r, ki)
+                         for r in range(dirs) for ki in range(depth)), key=lambda x: -x[0])
+        for v, col, ki in ranked:
+            if not np.isfinite(v): break
+            plan = _trace(problem, h, d, value, action, succ, col, ki, opening)
+            key = tuple(plan.steps)
+            if key not in seen:
+                seen.add(key)
+                plans.append((wi, plan))
+    if not plans:
+        plan = _trace(problem, h, d, value, action, succ, 0, 0, opening)
+        return [plan], [plan]
+
+    top, stops = [], set()
+    for wi, plan in plans:
+        if wi == 0 and plan.stops not in stops and len(top) < k:
+            stops.add(plan.stops)
+            top.append(plan)
+
+    points = np.array([(-p.score, p.miles, p.fuel) for _, p in plans]).round(6)
+    pareto, taken = [], set()
+    for i in np.argsort(points[:, 0], kind="stable"):
+        if plans[i][1].score <= 0 or tuple(points[i]) in taken: continue
+        if ((points <= points[i]).all(axis=1) & (points < points[i]).any(axis=1)).any(): continue
+        taken.add(tuple(points[i]))
+        pareto.append(plans[i][1])
+    return top, pareto
+
+def _after(problem, start, steps):
+    """(hub, day) where a run of fixed steps from hub `start` leaves the trip."""
+    h, d = problem.hubs.index(start), 0
+    for kind, day, a, b, _ in steps:
+        if kind == "fish": h, d = b, day + 1
+        elif kind == "hop": h, d = b, day
+        elif kind == "drive": h, d = b, day + int(problem.drive_days[a, b])
+    return h, d
+
+def _top(cand, depth):
+    """Indices of the depth best candidates along the last axis, best first."""
+    best = np.argpartition(-cand, depth - 1, axis=-1)[..., :depth] if cand.shape[-1] > depth else \
+        np.broadcast_to(np.arange(cand.shape[-1]), cand.shape)
+    return np.take_along_axis(best, np.argsort(-np.take_along_axis(cand, best, axis=-1), axis=-1, kind="stable"), axis=-1)
+
+def _solve(problem, costs, depth):
+    """Backward k-best DP over (day, hub, stay), batched over W cost matrices (W, H, H)
+    times the problem's route directions (column w * directions + direction).
+
+    Every action (fish, AM hop + fish, multi-day drive, return home) advances the day,
+    so one sweep over days is exact. stay counts the days fished in a row at the hub;
+    from STAY_CAP on a day there is worth nothing. value[d, c, h, s, k] is the k-th best
+    value of being at hub h on the morning of day d after s days there; action/succ point
+    at the move and the successor's rank. Work is O(T * W * H^2 * depth) array ops.
+    """
+    T, H, S, dirs = problem.days, len(problem.hubs), STAY_CAP + 1, len(problem.routes)
+    W = len(costs) * dirs
+    FISH, RETURN = H, H + 1
+    value = np.full((T + 1, W, H, S, depth), -np.inf)
+    action = np.full((T + 1, W, H, S, depth), -1, dtype=np.int64)
+    succ = np.zeros((T + 1, W, H, S, depth), dtype=np.int64)
+    hub_ids, ranks, stays = np.arange(H), np.arange(depth), np.arange(S)
+    next_stay = np.minimum(stays + 1, STAY_CAP)
+
+    ret_cost = np.repeat(costs[:, :, problem.home], dirs, axis=0)
+    move_cost = np.where(problem.routes[None], costs[:, None], np.inf).reshape(W, H, H)
+    move_action, move_succ = np.repeat(hub_ids, depth), np.tile(ranks, H)
+    # Candidate layout along the last axis: [return | fish x depth | best moves x depth]
+    fixed_action = np.broadcast_to(np.concatenate([[RETURN], np.full(depth, FISH)]), (W, H, S, depth + 1))
+    fixed_succ = np.broadcast_to(np.concatenate([[0], ranks]), (W, H, S, depth + 1))
+
+    for d in range(T, -1, -1):
+        ends = d + problem.return_days == T
+        ret = np.where(ends, -ret_cost, -np.inf)
+        if d == T:
+            value[d, ..., 0] = ret[:, :, None]
+            action[d, ..., 0] = RETURN
+            continue
+
+        day_value = np.where(stays < STAY_CAP, problem.value[d][:, None], 0.0)
+        fish = day_value[None, :, :, None] + value[d + 1][:, :, next_stay]
+        # Value of arriving at hub g after a leg of D days, for D = 0 (AM hop) .. 3
+        arrive = np.full((4, W, H, depth), -np.inf)
+        arrive[0] = fish[:, :, 0]
+        for D in (1, 2, 3):
+            if d + D <= T: arrive[D] = value[d + D][:, :, 0]
+        move = arrive[problem.drive_days, :, hub_ids[None, :], :].transpose(2, 0, 1, 3) - move_cost[..., None]
+        move = move.reshape(W, H, H * depth)
+        top = _top(move, depth)  # Moves don't depend on the stay: rank them once per hub
+        moves = np.broadcast_to(np.take_along_axis(move, top, axis=2)[:, :, None], (W, H, S, depth))
+
+        cand = np.concatenate([np.broadcast_to(ret[:, :, None, None], (W, H, S, 1)), fish, moves], axis=3)
+        cand_action = np.concatenate([fixed_action, np.broadcast_to(move_action[top][:, :, None], (W, H, S, depth))], axis=3)
+        cand_succ = np.concatenate([fixed_succ, np.broadcast_to(move_succ[top][:, :, None], (W, H, S, depth))], axis=3)
+        best = _top(cand, depth)
+        value[d] = np.take_along_axis(cand, best, axis=3)
+        action[d], succ[d] = np.take_along_axis(cand_action, best, axis=3), np.take_along_axis(cand_succ, best, axis=3)
+
+    return value, action, succ
+
+def _trace(problem, h, d, value, action, succ, w, k, opening=()):
+    H, steps, s = len(problem.hubs), list(opening), 0
+    if not np.isfinite(value[d, w, h, s, k]):
+        # Window shorter than the drive home: just head back
+        return Plan(problem, steps + [("return", d, h, problem.home, -1)])
+    while True:
+        a, k = int(action[d, w, h, s, k]), int(succ[d, w, h, s, k])
+        if a == H + 1:
+            steps.append(("return", d, h, problem.home, -1))
+            break
+        if a == H:
+            steps.append(("fish", d, h, h, int(problem.pick[d, h]) if s < STAY_CAP else -1))
+            d, s = d + 1, min(s + 1, STAY_CAP)
+            continue
+        if problem.drive_days[h, a] == 0:
+            steps.append(("hop", d, h, a, -1))
+            steps.append(("fish", d, a, a, int(problem.pick[d, a])))
+            d, h, s = d + 1, a, 1
+        else:
+            steps.append(("drive", d, h, a, -1))
+            d, h, s = d + int(problem.drive_days[h, a]), a, 0
+    return Plan(problem, steps)
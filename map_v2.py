@@ -2,6 +2,9 @@ import streamlit as st
 import pydeck as pdk
 import pandas as pd
 
+from metrics_v2 import timed
+
+@timed("render_coastal_map")
 def render_coastal_map(data_dict, filters):
     """
     Renders map using the unified data structure from dashboard_v2.
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import functools
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ============================================================
+# 1. IN-PROCESS METRICS REGISTRY
+# ============================================================
+
+PREFIX = "steelhead"
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7)
+CACHE_HIT_RESULTS = ("hit", "fresh", "not_modified", "stale_on_error")
+
+_LOCK = threading.Lock()
+_COUNTERS = {}    # (name, labels) -> float
+_HISTOGRAMS = {}  # (name, labels) -> {"buckets": tuple, "counts": list, "sum": float, "count": int}
+_HELP = {
+    "http_requests_total": "Upstream HTTP requests by host and status (or error class).",
+    "http_request_seconds": "Upstream HTTP request latency by host.",
+    "http_response_bytes": "Upstream response payload size by host.",
+    "cache_events_total": "Cache lookups by layer (single_flight, disk) and result.",
+    "fetch_errors_total": "Structured fetch failures by source and kind.",
+    "phase_seconds": "Wall time of scoring/render/refresh phases.",
+    "gauge_fetches_total": "Gauges pulled per store refresh, full window vs incremental (delta).",
+}
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def inc(name, value=1, **labels):
+    key = (name, _labels(labels))
+    with _LOCK:
+        _COUNTERS[key] = _COUNTERS.get(key, 0) + value
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    key = (name, _labels(labels))
+    with _LOCK:
+        h = _HISTOGRAMS.get(key)
+        if h is None:
+            h = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            _HISTOGRAMS[key] = h
+        for i, b in enumerate(h["buckets"]):
+            if value <= b: h["counts"][i] += 1
+        h["sum"] += value
+        h["count"] += 1
+
+def record_request(host, status, seconds, nbytes=None):
+    """One upstream attempt; status is an HTTP code or an error class name."""
+    inc("http_requests_total", host=host, status=status)
+    observe("http_request_seconds", seconds, host=host)
+    if nbytes is not None:
+        observe("http_response_bytes", nbytes, BYTES_BUCKETS, host=host)
+
+def record_cache(layer, result):
+    inc("cache_events_total", layer=layer, result=result)
+
+def record_fetch_error(source, kind):
+    inc("fetch_errors_total", source=source, kind=kind)
+
+def timed(phase):
+    """Decorator recording phase_seconds{phase=...} for sync or async functions."""
+    def wrap(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_inner(*args, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    observe("phase_seconds", time.perf_counter() - t0, phase=phase)
+            return async_inner
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe("phase_seconds", time.perf_counter() - t0, phase=phase)
+        return inner
+    return wrap
+
+def reset():
+    with _LOCK:
+        _COUNTERS.clear()
+        _HISTOGRAMS.clear()
+
+# ============================================================
+# 2. EXPORT (JSON + PROMETHEUS TEXT)
+# ============================================================
+
+def snapshot():
+    """JSON-friendly dump of every counter and histogram."""
+    with _LOCK:
+        counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(_COUNTERS.items())]
+        hists = [
+            {"name": n, "labels": dict(l), "buckets": list(h["buckets"]), "counts": list(h["counts"]),
+             "sum": h["sum"], "count": h["count"]}
+            for (n, l), h in sorted(_HISTOGRAMS.items())
+        ]
+    return {"counters": counters, "histograms": hists}
+
+def to_json():
+    return json.dumps(snapshot(), indent=2)
+
+def _fmt_labels(labels, extra=None):
+    items = list(labels.items()) + (list(extra.items()) if extra else [])
+    if not items: return ""
+    inner = ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in items)
+    return "{" + inner + "}"
+
+def to_prometheus():
+    """Prometheus text exposition format (v0.0.4)."""
+    snap = snapshot()
+    lines, seen = [], set()
+    for c in snap["counters"]:
+        name = f"{PREFIX}_{c['name']}"
+        if name not in seen:
+            lines += [f"# HELP {name} {_HELP.get(c['name'], '')}", f"# TYPE {name} counter"]
+            seen.add(name)
+        lines.append(f"{name}{_fmt_labels(c['labels'])} {c['value']}")
+    for h in snap["histograms"]:
+        name = f"{PREFIX}_{h['name']}"
+        if name not in seen:
+            lines += [f"# HELP {name} {_HELP.get(h['name'], '')}", f"# TYPE {name} histogram"]
+            seen.add(name)
+        for b, cnt in zip(h["buckets"], h["counts"]):
+            lines.append(f"{name}_bucket{_fmt_labels(h['labels'], {'le': b})} {cnt}")
+        lines.append(f"{name}_bucket{_fmt_labels(h['labels'], {'le': '+Inf'})} {h['count']}")
+        lines.append(f"{name}_sum{_fmt_labels(h['labels'])} {h['sum']}")
+        lines.append(f"{name}_count{_fmt_labels(h['labels'])} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+# ============================================================
+# 3. OPTIONAL /metrics ENDPOINT
+# ============================================================
+
+METRICS_PORT = os.environ.get("STEELHEAD_METRICS_PORT")
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body, ctype = to_json().encode(), "application/json"
+        elif self.path.startswith("/metrics"):
+            body, ctype = to_prometheus().encode(), "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+_SERVER = None
+_SERVER_LOCK = threading.Lock()
+
+def start_metrics_server(port=None):
+    """Serves /metrics (Prometheus) and /metrics.json on a daemon thread; once per process.
+
+    Does nothing unless a port is given or STEELHEAD_METRICS_PORT is set.
+    """
+    global _SERVER
+    port = port or METRICS_PORT
+    if not port: return None
+    with _SERVER_LOCK:
+        if _SERVER is None:
+            try:
+                _SERVER = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+            except OSError:
+                return None  # Port taken (e.g. another replica on this host)
+            threading.Thread(target=_SERVER.serve_forever, name="metrics-server", daemon=True).start()
+        return _SERVER
+
+# ============================================================
+# 4. SIDEBAR DIAGNOSTICS PANEL
+# ============================================================
+
+def _hist_quantile(h, q):
+    if not h["count"]: return None
+    target = q * h["count"]
+    for b, cnt in zip(h["buckets"], h["counts"]):
+        if cnt >= target: return b
+    return float("inf")
+
+def diagnostics_tables():
+    """Per-host and per-phase summary rows for the diagnostics panel."""
+    snap = snapshot()
+    hosts = {}
+    for c in snap["counters"]:
+        if c["name"] != "http_requests_total": continue
+        row = hosts.setdefault(c["labels"]["host"], {"host": c["labels"]["host"], "requests": 0, "errors": 0})
+        row["requests"] += c["value"]
+        status = c["labels"]["status"]
+        if not (status.isdigit() and int(status) < 400): row["errors"] += c["value"]
+    for h in snap["histograms"]:
+        host = h["labels"].get("host")
+        if host not in hosts: continue
+        if h["name"] == "http_request_seconds":
+            hosts[host]["avg_s"] = round(h["sum"] / h["count"], 3) if h["count"] else None
+            hosts[host]["p90_s<="] = _hist_quantile(h, 0.9)
+        elif h["name"] == "http_response_bytes":
+            hosts[host]["kb_total"] = round(h["sum"] / 1024, 1)
+
+    cache = {}
+    for c in snap["counters"]:
+        if c["name"] != "cache_events_total": continue
+        layer = cache.setdefault(c["labels"]["layer"], {"layer": c["labels"]["layer"]})
+        layer[c["labels"]["result"]] = c["value"]
+    for layer in cache.values():
+        total = sum(v for k, v in layer.items() if k != "layer")
+        hits = sum(v for k, v in layer.items() if k in CACHE_HIT_RESULTS)
+        layer["hit_rate"] = round(hits / total, 2) if total else None
+
+    errors = [dict(c["labels"], count=c["value"]) for c in snap["counters"] if c["name"] == "fetch_errors_total"]
+    phases = [
+        {"phase": h["labels"]["phase"], "calls": h["count"],
+         "avg_ms": round(1000 * h["sum"] / h["count"], 1) if h["count"] else None,
+         "p90_ms<=": (_hist_quantile(h, 0.9) or 0) * 1000}
+        for h in snap["histograms"] if h["name"] == "phase_seconds"
+    ]
+    return list(hosts.values()), list(cache.values()), errors, phases
+
+def render_diagnostics_panel():
+    """Optional sidebar panel; call inside `with st.sidebar:`."""
+    import streamlit as st
+    if not st.checkbox("🩺 Diagnostics", value=False, key="show_diagnostics"): return
+    hosts, cache, errors, phases = diagnostics_tables()
+    st.caption("Upstream hosts")
+    st.dataframe(hosts, hide_index=True)
+    st.caption("Cache layers")
+    st.dataframe(cache, hide_index=True)
+    if errors:
+        st.caption("Fetch errors")
+        st.dataframe(errors, hide_index=True)
+    st.caption("Phases")
+    st.dataframe(phases, hide_index=True)
+    st.download_button("Download metrics (JSON)", to_json(), file_name="steelhead_metrics.json", mime="application/json")
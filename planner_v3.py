@@ -1,15 +1,26 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import datetime
 from datetime import date, timedelta
-import requests
 import re
 import math
 import asyncio
-import aiohttp
 import json
 import os
 import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from gauges_v2 import as_gauge_series, fetch_usgs_gauge_async, gauge_series, get_gauge_store_async, register_gauges
+from history_v2 import seasonal_daily  # Importing also persists every gauge refresh to history
+from http_v2 import FetchError, error_from_exception, error_from_status, pooled_session, refresh_session
+from itinerary_v2 import TOP_K, TripProblem, solve_alternatives, solve_itinerary
+from metrics_v2 import record_cache, timed
+from refresher_v2 import get_refresher, render_data_age
+from routes_v2 import RouteIndex, load_route_db, tier_for_view
+from scoring_v2 import FISHABLE_SCORE, PlannerOutlookEngine, PlannerScoringEngine, climatology_scores, scenario_fish_days
 
 # --- CONFIGURATION ---
 if 'reset_id' not in st.session_state:
@@ -25,55 +36,55 @@ def trigger_reset():
 
 RIVER_REGIONS = {
     "Northern California": [
-        {"Name": "Gualala", "ID": "11467510", "T": "250-1200 cfs", "Hub": "Pepperwood"},
-        {"Name": "Garcia", "ID": "11467600", "T": "250-1100 cfs", "Hub": "Pepperwood"},
-        {"Name": "Navarro", "ID": "11468000", "T": "350-1500 cfs", "Hub": "Pepperwood"},
-        {"Name": "Mattole", "ID": "11468900", "T": "500-3000 cfs", "Hub": "Pepperwood"},
-        {"Name": "SF Eel", "ID": "11476500", "T": "800-4000 cfs", "Hub": "Pepperwood"},
-        {"Name": "Eel (Main)", "ID": "11477000", "T": "2000-15000 cfs", "Hub": "Pepperwood"},
-        {"Name": "Van Duzen", "ID": "11478500", "T": "500-2500 cfs", "Hub": "Maple Grove"},
-        {"Name": "Mad River", "ID": "11481000", "T": "600-3500 cfs", "Hub": "Eureka"},
-        {"Name": "Redwood Creek", "ID": "11482500", "T": "400-1500 cfs", "Hub": "Eureka"},
-        {"Name": "Smith River (CA)", "ID": "11532500", "T": "1500-7500 cfs", "Hub": "Hiouchi"},
+        {"Name": "Gualala", "ID": "11467510", "T": "250-1200 cfs", "NWS": "GRLC1", "Hub": "Pepperwood"},
+        {"Name": "Garcia", "ID": "11467600", "T": "250-1100 cfs", "NWS": "GRCC1", "Hub": "Pepperwood"},
+        {"Name": "Navarro", "ID": "11468000", "T": "350-1500 cfs", "NWS": "NVRC1", "Hub": "Pepperwood"},
+        {"Name": "Mattole", "ID": "11468900", "T": "500-3000 cfs", "NWS": "MATC1", "Hub": "Pepperwood"},
+        {"Name": "SF Eel", "ID": "11476500", "T": "800-4000 cfs", "NWS": "MRNC1", "Hub": "Pepperwood"},
+        {"Name": "Eel (Main)", "ID": "11477000", "T": "2000-15000 cfs", "NWS": "SCOC1", "Hub": "Pepperwood"},
+        {"Name": "Van Duzen", "ID": "11478500", "T": "500-2500 cfs", "NWS": "BRGC1", "Hub": "Maple Grove"},
+        {"Name": "Mad River", "ID": "11481000", "T": "600-3500 cfs", "NWS": "ARCC1", "Hub": "Eureka"},
+        {"Name": "Redwood Creek", "ID": "11482500", "T": "400-1500 cfs", "NWS": "ORIC1", "Hub": "Eureka"},
+        {"Name": "Smith River (CA)", "ID": "11532500", "T": "1500-7500 cfs", "NWS": "JEDC1", "Hub": "Hiouchi"},
     ],
     "Southern Oregon Coast": [
         {"Name": "Winchuck", "ID": "14400200", "T": "250-900 cfs", "Hub": "Brookings"},
-        {"Name": "Chetco", "ID": "14400000", "T": "1500-5000 cfs", "Hub": "Brookings"},
-        {"Name": "Pistol", "ID": "14400000", "T": "300-1100 cfs", "Hub": "Gold Beach"},
-        {"Name": "Illinois", "ID": "14377100", "T": "1000-4000 cfs", "Hub": "Gold Beach"},
-        {"Name": "Rogue", "ID": "14372300", "T": "2000-8000 cfs", "Hub": "Gold Beach"},
+        {"Name": "Chetco", "ID": "14400000", "T": "1500-5000 cfs", "NWS": "CHTO3", "Hub": "Brookings"},
+        {"Name": "Pistol", "ID": "14400000", "T": "300-1100 cfs", "NWS": "CHTO3", "Hub": "Gold Beach"},
+        {"Name": "Illinois", "ID": "14377100", "T": "1000-4000 cfs", "NWS": "KRBO3", "Hub": "Gold Beach"},
+        {"Name": "Rogue", "ID": "14372300", "T": "2000-8000 cfs", "NWS": "AGNO3", "Hub": "Gold Beach"},
         {"Name": "Elk River", "ID": "14327250", "T": "4.0-6.0 ft", "P": "00065", "Hub": "Port Orford"},
         {"Name": "Sixes River", "ID": "14327150", "T": "5.0-9.0 ft", "P": "00065", "Hub": "Port Orford"},
         {"Name": "Floras/New", "ID": "14327137", "T": "300-1100 cfs", "Hub": "Port Orford"},
     ],
     "Central Oregon Coast": [
-        {"Name": "Coquille (S.F.)", "ID": "14325000", "T": "4.0-9.0 ft", "P": "00065", "Hub": "Coos Bay"},
-        {"Name": "Coquille (Main)", "ID": "14326500", "T": "2500-8500 cfs", "Hub": "Coos Bay"},
+        {"Name": "Coquille (S.F.)", "ID": "14325000", "T": "4.0-9.0 ft", "P": "00065", "NWS": "POWO3", "Hub": "Coos Bay"},
+        {"Name": "Coquille (Main)", "ID": "14326500", "T": "2500-8500 cfs", "NWS": "COQO3", "Hub": "Coos Bay"},
         {"Name": "Tenmile", "ID": "NO_GAUGE", "T": "250-900 cfs", "Hub": "Coos Bay"},
-        {"Name": "Umpqua (Main)", "ID": "14321000", "T": "3000-12000 cfs", "Hub": "Reedsport"},
-        {"Name": "N. Umpqua", "ID": "14319500", "T": "1200-4000 cfs", "Hub": "Steamboat"},
-        {"Name": "Siuslaw", "ID": "14307620", "T": "4.0-10.0 ft", "P": "00065", "Hub": "Reedsport"},
+        {"Name": "Umpqua (Main)", "ID": "14321000", "T": "3000-12000 cfs", "NWS": "ELKO3", "Hub": "Reedsport"},
+        {"Name": "N. Umpqua", "ID": "14319500", "T": "1200-4000 cfs", "NWS": "WINO3", "Hub": "Steamboat"},
+        {"Name": "Siuslaw", "ID": "14307620", "T": "4.0-10.0 ft", "P": "00065", "NWS": "MPLO3", "Hub": "Reedsport"},
     ],
     "Northern Oregon Coast": [
-        {"Name": "Alsea", "ID": "14306500", "T": "3.0-9.0 ft", "P": "00065", "Hub": "Newport"},
-        {"Name": "Siletz", "ID": "14305500", "T": "3.5-8.0 ft", "P": "00065", "Hub": "Newport"},
-        {"Name": "Nestucca", "ID": "14303600", "T": "3.5-7.5 ft", "P": "00065", "Hub": "Tillamook"},
-        {"Name": "Wilson", "ID": "14301500", "T": "3.5-7.5 ft", "P": "00065", "Hub": "Tillamook"},
-        {"Name": "Nehalem", "ID": "14301000", "T": "3.5-9.0 ft", "P": "00065", "Hub": "Tillamook"},
+        {"Name": "Alsea", "ID": "14306500", "T": "3.0-9.0 ft", "P": "00065", "NWS": "TIDO3", "Hub": "Newport"},
+        {"Name": "Siletz", "ID": "14305500", "T": "3.5-8.0 ft", "P": "00065", "NWS": "SILO3", "Hub": "Newport"},
+        {"Name": "Nestucca", "ID": "14303600", "T": "3.5-7.5 ft", "P": "00065", "NWS": "BEVO3", "Hub": "Tillamook"},
+        {"Name": "Wilson", "ID": "14301500", "T": "3.5-7.5 ft", "P": "00065", "NWS": "TLMO3", "Hub": "Tillamook"},
+        {"Name": "Nehalem", "ID": "14301000", "T": "3.5-9.0 ft", "P": "00065", "NWS": "FOSO3", "Hub": "Tillamook"},
     ],
     "Washington Coast": [
-        {"Name": "Willapa", "ID": "12010000", "T": "800-2600 cfs", "Hub": "Aberdeen"},
-        {"Name": "Satsop", "ID": "12035000", "T": "1500-7000 cfs", "Hub": "Aberdeen"},
-        {"Name": "Wynoochee", "ID": "12037400", "T": "1000-5000 cfs", "Hub": "Aberdeen"},
-        {"Name": "Humptulips", "ID": "12039005", "T": "1500-6000 cfs", "Hub": "Aberdeen"},
+        {"Name": "Willapa", "ID": "12010000", "T": "800-2600 cfs", "NWS": "WLLW1", "Hub": "Aberdeen"},
+        {"Name": "Satsop", "ID": "12035000", "T": "1500-7000 cfs", "NWS": "SATW1", "Hub": "Aberdeen"},
+        {"Name": "Wynoochee", "ID": "12037400", "T": "1000-5000 cfs", "NWS": "MNTW1", "Hub": "Aberdeen"},
+        {"Name": "Humptulips", "ID": "12039005", "T": "1500-6000 cfs", "NWS": "HMPW1", "Hub": "Aberdeen"},
     ],
     "Olympic Peninsula": [
-        {"Name": "Quinault", "ID": "12039500", "T": "2000-10000 cfs", "Hub": "Forks"},
-        {"Name": "Queets", "ID": "12040500", "T": "2000-8000 cfs", "Hub": "Queets"},
-        {"Name": "Hoh", "ID": "12041200", "T": "1500-6000 cfs", "Hub": "Hoh"},
-        {"Name": "Bogachiel", "ID": "12043015", "T": "1000-6000 cfs", "Hub": "Bogachiel"},
-        {"Name": "Calawah", "ID": "12043000", "T": "1000-4000 cfs", "Hub": "Forks"},
-        {"Name": "Sol Duc", "ID": "12041500", "T": "600-2400 cfs", "Hub": "Forks"},
+        {"Name": "Quinault", "ID": "12039500", "T": "2000-10000 cfs", "NWS": "QNTW1", "Hub": "Forks"},
+        {"Name": "Queets", "ID": "12040500", "T": "2000-8000 cfs", "NWS": "QUEW1", "Hub": "Queets"},
+        {"Name": "Hoh", "ID": "12041200", "T": "1500-6000 cfs", "NWS": "HOHW1", "Hub": "Hoh"},
+        {"Name": "Bogachiel", "ID": "12043015", "T": "1000-6000 cfs", "NWS": "LPUW1", "Hub": "Bogachiel"},
+        {"Name": "Calawah", "ID": "12043000", "T": "1000-4000 cfs", "NWS": "FKSW1", "Hub": "Forks"},
+        {"Name": "Sol Duc", "ID": "12041500", "T": "600-2400 cfs", "NWS": "SOLW1", "Hub": "Forks"},
     ]
 }
 
@@ -117,83 +128,167 @@ for reg, rivers in RIVER_REGIONS.items():
 HUB_TO_REGION['Pyramid'] = 'Pyramid'
 HUB_TO_REGION['Eagle'] = 'Eagle'
 
+# Flows come from the shared gauge store (also used by the coastal dashboard)
+register_gauges((r["ID"], r.get("P", "00060")) for rivers in RIVER_REGIONS.values() for r in rivers)
+FLOW_WINDOW_HOURS = 48  # Planner scores on the last 2 days of the shared P3D window
+
 # ============================================================
 # 2. INTELLIGENCE (ASYNC FLOWS & WEATHER)
 # ============================================================
 
 async def fetch_usgs_series_async(session, site_id, param, period="P2D"):
     if site_id == "NO_GAUGE": return None
+    return await fetch_usgs_gauge_async(session, site_id, param, period, timeout=6)
+
+async def fetch_nwps_forecast_async(session, nws_id):
+    """Raw NWPS hydrograph forecast points for one forecast point (or a FetchError)."""
     try:
-        url = "https://waterservices.usgs.gov/nwis/iv/"
-        params = {"format": "json", "sites": site_id, "parameterCd": param, "period": period}
-        async with session.get(url, params=params, timeout=6) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-                vals = data['value']['timeSeries'][0]['values'][0]['value']
-                series = []
-                for v in vals:
-                    dt_val = datetime.datetime.fromisoformat(v["dateTime"].replace("Z", "+00:00"))
-                    series.append((dt_val, float(v["value"])))
-                return series
-    except:
-        return None
-    return None
+        url = f"https://api.water.noaa.gov/nwps/v1/gauges/{nws_id}"
+        async with session.get(url, headers={"User-Agent": "SteelheadNavigator"}, timeout=6) as resp:
+            if resp.status != 200: return error_from_status("NWPS", resp.status)
+            data = await resp.json()
+            return data.get("hydrograph", {}).get("forecast", []) or []
+    except Exception as e:
+        return error_from_exception("NWPS", e)
+
+# Gridpoint resolution (points -> forecast URL) never changes for a fixed location,
+# so it is resolved once and persisted; each refresh then costs one request per location.
+NWS_POINTS_CACHE_PATH = os.environ.get("STEELHEAD_NWS_POINTS", os.path.join(".cache", "nws_points.json"))
+NWS_POINTS_SEED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nws_points.json")  # Optional, baked at build time
+NWS_INVALIDATE_STATUSES = (301, 302, 303, 307, 308, 404)
+
+_NWS_POINTS = None
+
+def nws_points_key(lat, lon):
+    return f"{round(lat, 4)},{round(lon, 4)}"
+
+def load_nws_points():
+    """{"lat,lon": forecast_url} from the runtime cache, else the build-time seed, else {}."""
+    global _NWS_POINTS
+    if _NWS_POINTS is None:
+        _NWS_POINTS = {}
+        for path in (NWS_POINTS_CACHE_PATH, NWS_POINTS_SEED_PATH):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    _NWS_POINTS = dict(json.load(f))
+                break
+            except Exception:
+                continue
+    return _NWS_POINTS
+
+def save_nws_points(points):
+    try:
+        folder = os.path.dirname(NWS_POINTS_CACHE_PATH)
+        if folder: os.makedirs(folder, exist_ok=True)
+        tmp = NWS_POINTS_CACHE_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(points, f, indent=1, sort_keys=True)
+        os.replace(tmp, NWS_POINTS_CACHE_PATH)
+    except Exception:
+        pass  # Read-only disk: resolution just stays in memory for this process
+
+async def resolve_forecast_url(session, lat, lon, headers):
+    """One /points lookup -> forecast URL (or a FetchError)."""
+    point_url = f"https://api.weather.gov/points/{nws_points_key(lat, lon)}"
+    async with session.get(point_url, headers=headers, timeout=5) as resp:
+        if resp.status != 200: return error_from_status("NWS", resp.status)
+        point_data = await resp.json()
+        return point_data['properties']['forecast']
 
-async def fetch_weather_async(session, name, lat, lon):
+async def fetch_weather_async(session, name, lat, lon, points=None):
+    """Forecast periods for one location.
+
+    points is the persistent {"lat,lon": forecast_url} map; the cached URL is used directly
+    and only dropped when the forecast endpoint answers 404 or redirects (grid moved).
+    Other failures keep the entry so a transient NWS outage never forces re-resolution.
+    """
     headers = {"User-Agent": "SteelheadNavigator"}
+    points = load_nws_points() if points is None else points
+    key = nws_points_key(lat, lon)
     try:
-        point_url = f"https://api.weather.gov/points/{round(lat, 4)},{round(lon, 4)}"
-        async with session.get(point_url, headers=headers, timeout=5) as resp1:
-            if resp1.status != 200: return (name, [])
-            point_data = await resp1.json()
-            forecast_url = point_data['properties']['forecast']
-            
+        forecast_url = points.get(key)
+        if forecast_url:
+            async with session.get(forecast_url, headers=headers, timeout=5, allow_redirects=False) as resp:
+                if resp.status == 200:
+                    forecast_data = await resp.json()
+                    return (name, forecast_data['properties']['periods'])
+                if resp.status not in NWS_INVALIDATE_STATUSES:
+                    return (name, error_from_status("NWS", resp.status))
+            points.pop(key, None)
+
+        forecast_url = await resolve_forecast_url(session, lat, lon, headers)
+        if isinstance(forecast_url, FetchError): return (name, forecast_url)
+        points[key] = forecast_url
+
         async with session.get(forecast_url, headers=headers, timeout=5) as resp2:
-            if resp2.status != 200: return (name, [])
+            if resp2.status != 200: return (name, error_from_status("NWS", resp2.status))
             forecast_data = await resp2.json()
             return (name, forecast_data['properties']['periods'])
-    except:
-        return (name, [])
+    except Exception as e:
+        return (name, error_from_exception("NWS", e))
 
+@timed("planner_refresh")
 async def fetch_all_data_async(weather_locs):
-    connector = aiohttp.TCPConnector(ssl=False)
-    async with aiohttp.ClientSession(connector=connector) as session:
-        flow_tasks = []
-        flow_keys = []
-        for reg, rivers in RIVER_REGIONS.items():
-            for r in rivers:
-                flow_keys.append(r["Name"])
-                flow_tasks.append(fetch_usgs_series_async(session, r["ID"], r.get("P", "00060")))
+    async with pooled_session() as raw_session:
+        session = refresh_session(raw_session)
+        rivers = [r for reg_rivers in RIVER_REGIONS.values() for r in reg_rivers]
         
+        points = load_nws_points()
+        resolved_before = dict(points)
         weather_tasks = []
         for name, lat, lon in weather_locs:
-            weather_tasks.append(fetch_weather_async(session, name, lat, lon))
+            weather_tasks.append(fetch_weather_async(session, name, lat, lon, points))
+        nws_ids = sorted({r["NWS"] for r in rivers if r.get("NWS")})
             
-        flow_results = await asyncio.gather(*flow_tasks)
-        weather_results = await asyncio.gather(*weather_tasks)
+        gauge_store, weather_results, nwps_results = await asyncio.gather(
+            get_gauge_store_async(),
+            asyncio.gather(*weather_tasks),
+            asyncio.gather(*(fetch_nwps_forecast_async(session, i) for i in nws_ids))
+        )
+        
+        # Slice each river out of the shared store; fetch directly only if it is missing
+        flows, retry_names, retry_tasks = {}, [], []
+        for r in rivers:
+            key = (r["ID"], r.get("P", "00060"))
+            if r["ID"] == "NO_GAUGE":
+                flows[r["Name"]] = None
+                continue
+            series = gauge_series(gauge_store, *key, hours=FLOW_WINDOW_HOURS)
+            if isinstance(series, FetchError):
+                flows[r["Name"]] = series
+            elif series is not None:
+                flows[r["Name"]] = series or None
+            else:
+                retry_names.append(r["Name"])
+                retry_tasks.append(fetch_usgs_series_async(session, *key))
+        flows.update(zip(retry_names, await asyncio.gather(*retry_tasks)))
+        if points != resolved_before: save_nws_points(points)
         
         return {
-            "flows": dict(zip(flow_keys, flow_results)),
-            "weather": dict(weather_results)
+            "flows": flows,
+            "weather": dict(weather_results),
+            "nwps": dict(zip(nws_ids, nwps_results))
         }
 
-@st.cache_data(ttl=900)
+WEATHER_LOCS = [
+    ("Pyramid", 40.01, -119.62), 
+    ("Eureka", 40.80, -124.16),
+    ("Crescent City", 41.75, -124.20),
+    ("Brookings", 42.05, -124.27), 
+    ("Coos Bay", 43.36, -124.21),
+    ("Tillamook", 45.45, -123.84),
+    ("Forks", 47.95, -124.38)
+]
+
+def get_live_refresher():
+    return get_refresher("planner_live", lambda: fetch_all_data_async(WEATHER_LOCS))
+
 def get_live_data():
-    weather_locs = [
-        ("Pyramid", 40.01, -119.62), 
-        ("Eureka", 40.80, -124.16),
-        ("Crescent City", 41.75, -124.20),
-        ("Brookings", 42.05, -124.27), 
-        ("Coos Bay", 43.36, -124.21),
-        ("Tillamook", 45.45, -123.84),
-        ("Forks", 47.95, -124.38)
-    ]
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        return loop.run_until_complete(fetch_all_data_async(weather_locs))
-    except:
-        return {"flows": {}, "weather": {}}
+    """Latest background snapshot; only the very first load waits on the network."""
+    refresher = get_live_refresher()
+    snap = refresher.latest() or refresher.wait_for_snapshot()
+    if snap is None: return {"flows": {}, "weather": {}, "nwps": {}}
+    return snap.data
 
 # --- SCORING & UTILS ---
 
@@ -206,20 +301,14 @@ def parse_range(t_str):
         return 0, 99999
 
 def get_trend(series):
-    if not series or len(series) < 2: return "stable"
-    series.sort(key=lambda x: x[0])
+    series = as_gauge_series(series)
+    if len(series) < 2: return "stable"
+    # Start at the last reading at least 6h before the latest one (else the first)
+    i = int(np.searchsorted(series.t, series.t[-1] - 6 * 3600, side="right")) - 1
+    start_val, last_val = float(series.v[max(i, 0)]), float(series.v[-1])
     
-    last = series[-1]
-    start = None
-    target_time = last[0] - timedelta(hours=6)
-    for p in reversed(series):
-        if p[0] <= target_time:
-            start = p
-            break
-    if not start: start = series[0]
-    
-    if start[1] == 0: return "stable"
-    pct_change = (last[1] - start[1]) / start[1]
+    if start_val == 0: return "stable"
+    pct_change = (last_val - start_val) / start_val
     
     if pct_change < -0.01: return "dropping"
     if pct_change > 0.01: return "rising"
@@ -266,6 +355,97 @@ def auto_score(series, spec, weather_periods=None):
         
     return 2.5, f"📡 {val}"
 
+def river_weather_key(region):
+    """Forecast location used for a region's no-gauge estimates."""
+    return "Forks" if "WA" in region else "Brookings" if "South" in region else "Eureka"
+
+_SCORE_CACHE = {"data": None, "scores": {}}
+
+@timed("score_rivers")
+def batch_auto_scores(live_data):
+    """{river name: (score, label)} for every river, scored in one vectorized pass.
+
+    Same rules as get_trend + auto_score; recomputed only when a new snapshot arrives.
+    """
+    if _SCORE_CACHE["data"] is live_data: return _SCORE_CACHE["scores"]
+    flows, weather = live_data["flows"], live_data["weather"]
+    specs, series, periods = [], [], []
+    for reg, rivers in RIVER_REGIONS.items():
+        for r in rivers:
+            specs.append(r)
+            series.append(flows.get(r["Name"]) or None)
+            periods.append(weather.get(river_weather_key(reg)) or None)
+    scores = PlannerScoringEngine(specs, series, periods).score_map()
+    _SCORE_CACHE.update(data=live_data, scores=scores)
+    return scores
+
+def nearest_weather_loc(hub):
+    c = NODE_COORDS[hub]
+    coastal = [w for w in WEATHER_LOCS if w[0] != "Pyramid"]
+    return min(coastal, key=lambda w: (w[1] - c["lat"])**2 + (w[2] - c["lon"])**2)[0]
+
+_OUTLOOK_CACHE = {"data": None, "engine": None, "outlook": None, "scenarios": None}
+_CLIMATE_CACHE = {"day": None, "norms": None}
+
+def river_climatology(specs):
+    """Seasonal norm score per river from the local history store; recomputed once a day."""
+    today = date.today()
+    if _CLIMATE_CACHE["day"] == today: return _CLIMATE_CACHE["norms"]
+    daily = []
+    for r in specs:
+        try:
+            daily.append(None if r["ID"] == "NO_GAUGE" else seasonal_daily(r["ID"], r.get("P", "00060"), today))
+        except Exception:
+            daily.append(None)
+    norms = climatology_scores(specs, daily)
+    _CLIMATE_CACHE.update(day=today, norms=norms)
+    return norms
+
+@timed("river_outlook")
+def river_outlook(live_data):
+    """Expected score per river (rows) per date (columns) from NWPS, NWS precip and recession.
+
+    Built once per live snapshot, like batch_auto_scores; see scoring_v2.PlannerOutlookEngine.
+    """
+    if _OUTLOOK_CACHE["data"] is live_data: return _OUTLOOK_CACHE["outlook"]
+    flows, weather, nwps = live_data["flows"], live_data["weather"], live_data.get("nwps", {})
+    specs, series, forecasts, periods = [], [], [], []
+    for rivers in RIVER_REGIONS.values():
+        for r in rivers:
+            specs.append(r)
+            series.append(flows.get(r["Name"]) or None)
+            fc = nwps.get(r.get("NWS"))
+            forecasts.append(None if isinstance(fc, FetchError) else fc)
+            wx = weather.get(nearest_weather_loc(r["Hub"]))
+            periods.append(None if isinstance(wx, FetchError) else wx)
+    engine = PlannerOutlookEngine(specs, series, forecasts, periods, climatology=river_climatology(specs))
+    outlook = pd.DataFrame(engine.scores, index=engine.names, columns=pd.to_datetime(engine.dates))
+    _OUTLOOK_CACHE.update(data=live_data, engine=engine, outlook=outlook, scenarios=None)
+    return outlook
+
+@timed("river_scenarios")
+def river_scenarios(live_data):
+    """(engine, sampled scores (S, rivers, days)) for this snapshot; sampled on first use."""
+    river_outlook(live_data)
+    if _OUTLOOK_CACHE["scenarios"] is None:
+        _OUTLOOK_CACHE["scenarios"] = _OUTLOOK_CACHE["engine"].simulate()
+    return _OUTLOOK_CACHE["engine"], _OUTLOOK_CACHE["scenarios"]
+
+def plan_robustness(fish, start_date, engine, scenarios, ratings, offsets):
+    """Good fishing days per scenario for one plan's [(trip day, river)] fish days.
+
+    Rivers without a gauge model (Pyramid) count as fished when their rating clears the bar.
+    Returns (expected good days, 10th percentile).
+    """
+    row = {n: i for i, n in enumerate(engine.names)}
+    shift = (start_date - engine.origin).days
+    last = len(engine.dates) - 1
+    modeled = [(row[n], min(max(shift + d, 0), last), offsets.get(n, 0.0)) for d, n in fish if n in row]
+    fixed = sum(1 for _, n in fish if n not in row and ratings.get(n, 0) >= FISHABLE_SCORE)
+    rivers, days, offs = zip(*modeled) if modeled else ((), (), ())
+    counts = scenario_fish_days(scenarios, rivers, days, offs) + fixed
+    return float(counts.mean()), float(np.percentile(counts, 10))
+
 def format_precip_text(txt: str) -> str:
     lower = txt.lower()
     m = re.search(r"(amounts? (of|between) .+? (possible|expected))", lower)
@@ -281,6 +461,26 @@ def format_precip_text(txt: str) -> str:
 # 3. ROUTING & ITINERARY (UPDATED FOR COMPRESSED JSON & INJECTION)
 # ============================================================
 
+ROUTE_DB_PATH = "routes.bin"  # Build with: python routes_v2.py convert routes.json.gz routes.bin
+
+def add_manual_routes(data):
+    """INJECTS critical routes missing from the route database (straight-line geometry)."""
+    if "Home|Delta, UT" not in data:
+        data["Home|Delta, UT"] = {
+            "miles": 524.8,  
+            "hours": 9.72,
+            "geometry": [[-105.879, 37.472], [-112.575, 39.352]] 
+        }
+    
+    if "Pyramid|Delta, UT" not in data:
+        data["Pyramid|Delta, UT"] = {
+            "miles": 474.8, 
+            "hours": 8.61, 
+            "geometry": [[-119.60, 39.95], [-112.575, 39.352]]
+        }
+
+    return data
+
 @st.cache_data
 def load_routes():
     """Load pre-calculated routes with geometry from JSON or GZIP JSON.
@@ -308,345 +508,267 @@ def load_routes():
 
     # 3. MANUAL INJECTION of Critical Missing Routes
     #    (Uses simple straight lines if complex geometry unavailable)
-    
-    if "Home|Delta, UT" not in data:
-        data["Home|Delta, UT"] = {
-            "miles": 524.8,  
-            "hours": 9.72,
-            "geometry": [[-105.879, 37.472], [-112.575, 39.352]] 
-        }
-    
-    if "Pyramid|Delta, UT" not in data:
-        data["Pyramid|Delta, UT"] = {
-            "miles": 474.8, 
-            "hours": 8.61, 
-            "geometry": [[-119.60, 39.95], [-112.575, 39.352]]
-        }
+    return add_manual_routes(data)
 
-    return data
+@st.cache_resource
+def load_route_index():
+    """Hub names -> integer IDs with dense miles/hours matrices, built once per process.
+
+    Prefers the memory-mapped routes.bin (geometry decoded lazily, per drawn segment);
+    falls back to routes.json(.gz).
+    """
+    if os.path.exists(ROUTE_DB_PATH):
+        try:
+            routes, geometries = load_route_db(ROUTE_DB_PATH)
+            return RouteIndex.from_routes(add_manual_routes(routes), NODE_COORDS, geometries)
+        except Exception as e:
+            st.error(f"Error loading {ROUTE_DB_PATH}: {e}")
+    return RouteIndex.from_routes(load_routes(), NODE_COORDS)
 
-ROUTES_DB = load_routes()
+ROUTE_INDEX = load_route_index()
 
 def get_routing_info(loc1, loc2):
     """
     Get distance, time, and geometry between two hubs.
-    Returns: (miles, hours, geometry_list)
+    Returns: (miles, hours, geometry_id) -- ROUTE_INDEX.geometry(id) decodes the path, -1 = none
     """
-    if loc1 == loc2: return 0, 0.0, []
-    
-    # Fuzzy match logic for keys
-    potential_keys = [
-        f"{loc1}|{loc2}",
-        f"{loc2}|{loc1}",
-        f"{loc1}|{loc2}, UT", # Handle potential "Delta, UT" mismatch
-        f"{loc2}, UT|{loc1}",
-        f"{loc1}, UT|{loc2}",
-        f"{loc2}|{loc1}, UT"
-    ]
-    
-    for key in potential_keys:
-        if key in ROUTES_DB:
-            r = ROUTES_DB[key]
-            geo = r.get('geometry', [])
-            return r['miles'], r['hours'], geo
-
-    # Fallback to Haversine if route missing in JSON
-    if loc1 in NODE_COORDS and loc2 in NODE_COORDS:
-        c1 = NODE_COORDS.get(loc1) or NODE_COORDS.get(f"{loc1}, UT")
-        c2 = NODE_COORDS.get(loc2) or NODE_COORDS.get(f"{loc2}, UT")
-        
-        if c1 and c2:
-            R = 3958.8
-            a = math.sin(math.radians(c2['lat']-c1['lat'])/2)**2 + math.cos(math.radians(c1['lat'])) * math.cos(math.radians(c2['lat'])) * math.sin(math.radians(c2['lon']-c1['lon'])/2)**2
-            c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-            dist = R * c * 1.35
-            return int(dist), round(dist/50.0, 1), [[c1['lon'], c1['lat']], [c2['lon'], c2['lat']]]
-        
-    return 0, 0.0, []
+    return ROUTE_INDEX.route(loc1, loc2)
 
 def get_return_days_needed(loc):
     if loc == "Home": return 0
-    _, h, _ = get_routing_info(loc, "Home")
+    h = ROUTE_INDEX.hours_between(loc, "Home")
     
     # Updated threshold: 27 hours allows covering more ground
     if h <= 12: return 1
     if h <= 27: return 2
     return 3
 
-def generate_itinerary(start_date, trip_days, ratings, vetoes, mpg, gas_adj_total, start_location="Home"):
-    rows = []
-    curr_date = start_date
-    curr_loc = start_location
-    days_used = 0
-    map_segments = [] # Store geometry for map
-    
-    FAMILIAR_WATERS = [
-        "Eel (Main)", "SF Eel", "Van Duzen", "Redwood Creek", 
-        "Smith River (CA)", "Chetco", "Umpqua (Main)", "N. Umpqua"
-    ]
-    
-    # 1. PYRAMID BLOCK (With Delta Stop)
-    if start_location in ["Home", "Pyramid", "Delta", "Delta, UT"]:
-        if not vetoes.get("Pyramid") and ratings.get("Pyramid", 0) > 0.5:
-            pyr_score = ratings["Pyramid"]
-            pyr_days = 3 if pyr_score >= 3.5 else 2 if pyr_score >= 2.5 else 1
-            
-            # --- CUSTOM: Route Home -> Delta -> Pyramid ---
-            if curr_loc == "Home":
-                # Leg 1: Home -> Delta
-                m, h, geo = get_routing_info("Home", "Delta, UT")
-                cost = (m/mpg) * (BASE_GAS_PRICES.get("Home", 3.00) + gas_adj_total)
-                rows.append([curr_date.strftime("%m/%d/%Y"), "Delta, UT", f"DRIVE: Home → Delta (Overnight)", m, h, cost])
-                if geo: map_segments.append(geo)
-                curr_loc = "Delta, UT"
-                curr_date += timedelta(days=1)
-                days_used += 1
-                
-                # Leg 2: Delta -> Pyramid
-                m, h, geo = get_routing_info("Delta, UT", "Pyramid")
-                cost = (m/mpg) * (BASE_GAS_PRICES.get("Delta", 3.69) + gas_adj_total)
-                rows.append([curr_date.strftime("%m/%d/%Y"), "Pyramid", f"DRIVE: Delta → Pyramid", m, h, cost])
-                if geo: map_segments.append(geo)
-                curr_loc = "Pyramid"
-                curr_date += timedelta(days=1)
-                days_used += 1
-            
-            # If not starting at Home (e.g. debugging), standard move
-            elif curr_loc != "Pyramid":
-                 m, h, geo = get_routing_info(curr_loc, "Pyramid")
-                 cost = (m/mpg) * (BASE_GAS_PRICES.get(curr_loc, 3.50) + gas_adj_total)
-                 rows.append([curr_date.strftime("%m/%d/%Y"), "Pyramid", f"DRIVE: {curr_loc} → Pyramid", m, h, cost])
-                 if geo: map_segments.append(geo)
-                 curr_loc = "Pyramid"
-                 curr_date += timedelta(days=1)
-                 days_used += 1
-
-            # Fish Pyramid
-            for _ in range(pyr_days):
-                if days_used + get_return_days_needed(curr_loc) >= trip_days: break
-                rows.append([curr_date.strftime("%m/%d/%Y"), "Pyramid", "FISH: Pyramid Lake", 0, 0, 0])
-                curr_date += timedelta(days=1)
-                days_used += 1
-            
-            # Move to Eagle
-            if days_used + get_return_days_needed("Eagle") < trip_days:
-                m, h, geo = get_routing_info("Pyramid", "Eagle")
-                cost = (m/mpg) * (BASE_GAS_PRICES.get("Pyramid", 4.00) + gas_adj_total)
-                rows.append([curr_date.strftime("%m/%d/%Y"), "Eagle", "DRIVE: Pyramid → Eagle", m, h, cost])
-                if geo: map_segments.append(geo)
-                curr_loc = "Eagle"
-                curr_date += timedelta(days=1)
-                days_used += 1
-                rows.append([(curr_date - timedelta(days=1)).strftime("%m/%d/%Y"), "Eagle", "FISH: Eagle Lake (PM)", 0, 0, 0])
-
-    # 2. COASTAL LOOP
-    regions = ["Northern California", "Southern Oregon Coast", "Central Oregon Coast", 
-               "Northern Oregon Coast", "Washington Coast", "Olympic Peninsula"]
-    
-    for reg in regions:
+FAMILIAR_WATERS = [
+    "Eel (Main)", "SF Eel", "Van Duzen", "Redwood Creek", 
+    "Smith River (CA)", "Chetco", "Umpqua (Main)", "N. Umpqua"
+]
+PLANNER_HUBS = list(NODE_COORDS)  # Includes Home
+COASTAL_HUBS = {r["Hub"] for rivers in RIVER_REGIONS.values() for r in rivers}
+
+# Legs of the Pyramid opening keep their original wording in the itinerary
+OPENING_LABELS = {
+    ("Home", "Delta, UT"): "DRIVE: Home → Delta (Overnight)",
+    ("Delta, UT", "Pyramid"): "DRIVE: Delta → Pyramid",
+    ("Pyramid", "Eagle"): "DRIVE: Pyramid → Eagle",
+}
+
+def gas_price(loc):
+    return BASE_GAS_PRICES.get(loc, BASE_GAS_PRICES.get(loc.split(",")[0], 4.00))
+
+def build_trip_problem(trip_days, ratings, vetoes, mpg, gas_adj_total, start_date=None, day_scores=None):
+    """Planner inputs -> TripProblem: hubs, route matrices, and every fishable option's daily score.
+
+    day_scores (rivers x dates, e.g. river_outlook) gives a river its score on each trip day;
+    rivers it lacks, Pyramid and Eagle keep their single rating for the whole window.
+    Coastal hubs are ordered by latitude, so the coastal loop runs one way up or down the coast.
+    """
+    T = max(trip_days, 0)
+    dates = pd.to_datetime([start_date + timedelta(days=d) for d in range(T)]) if start_date is not None else None
+    use_days = day_scores is not None and dates is not None and len(day_scores.columns) > 0
+    options, scores = [], []
+    if not vetoes.get("Pyramid"):
+        options.append({"name": "Pyramid", "hub": "Pyramid", "label": "Pyramid Lake", "familiar": False})
+        scores.append(np.full(T, ratings.get("Pyramid", 0), dtype=float))
+        options.append({"name": "Eagle", "hub": "Eagle", "label": "Eagle Lake (PM)", "familiar": False})
+        scores.append(np.full(T, ratings.get("Eagle", 0), dtype=float))
+    for reg, rivers in RIVER_REGIONS.items():
         if vetoes.get(reg): continue
-        
-        candidates = []
-        for r in RIVER_REGIONS[reg]:
-            s = ratings.get(r["Name"], 0)
-            sort_score = s
-            if r["Name"] in FAMILIAR_WATERS: sort_score += 1.5 
-            if sort_score >= 2.5: candidates.append((r, sort_score, s))
-            
-        candidates.sort(key=lambda x: x[1], reverse=True)
-        if not candidates: continue
-        
-        target, boosted_score, real_score = candidates[0]
-        hub = target["Hub"]
-        
-        return_days_from_hub = get_return_days_needed(hub)
-        _, move_h, _ = get_routing_info(curr_loc, hub)
-        move_days = 1 if move_h > 4 else 0 
-        
-        # --- STAY DURATION & CAPACITY LOGIC ---
-        days_fish = 1
-        if real_score >= 4.0:
-            days_fish = 3 
-            if target["Name"] in FAMILIAR_WATERS: days_fish = 4
-        elif real_score >= 3.0:
-            days_fish = 2
-            if target["Name"] in FAMILIAR_WATERS: days_fish = 3
-        
-        # Justify Move: Force min 2 days if moving
-        if curr_loc != hub:
-            days_fish = max(2, days_fish)
+        for r in rivers:
+            if r["Hub"] not in NODE_COORDS: continue
+            options.append({"name": r["Name"], "hub": r["Hub"], "label": None, "familiar": r["Name"] in FAMILIAR_WATERS})
+            if use_days and r["Name"] in day_scores.index:
+                # Trip days outside the outlook take its nearest day (first or last)
+                row = day_scores.loc[r["Name"]]
+                scores.append(row.reindex(dates, method="nearest").to_numpy(dtype=float))
+            else:
+                scores.append(np.full(T, ratings.get(r["Name"], 0), dtype=float))
+    ids = [ROUTE_INDEX.id(h) for h in PLANNER_HUBS]
+    return TripProblem(
+        PLANNER_HUBS, "Home", options, np.array(scores, dtype=float).reshape(len(options), T),
+        ROUTE_INDEX.hours[np.ix_(ids, ids)], ROUTE_INDEX.miles[np.ix_(ids, ids)],
+        [gas_price(h) for h in PLANNER_HUBS], mpg, gas_adj_total,
+        order=[NODE_COORDS[h]["lat"] if h in COASTAL_HUBS else np.nan for h in PLANNER_HUBS]
+    )
+
+def trip_opening(problem, start_location, ratings, vetoes):
+    """Fixed start of the trip, as solver steps: Home → Delta (overnight) → Pyramid for 1-3
+    days by rating → Eagle Lake for the afternoon. The solver plans the coast from there.
+
+    Empty when Pyramid is vetoed or rated out, the start is elsewhere, or the window
+    can't fit a day on Pyramid.
+    """
+    if start_location not in ["Home", "Pyramid", "Delta", "Delta, UT"] or start_location not in problem.hubs: return []
+    if vetoes.get("Pyramid") or ratings.get("Pyramid", 0) <= 0.5: return []
+    hub, names = problem.hubs.index, [o["name"] for o in problem.options]
+    pyramid, eagle = hub("Pyramid"), hub("Eagle")
+    at, d, steps = hub(start_location), 0, []
+    legs = [hub("Delta, UT"), pyramid] if start_location == "Home" else [pyramid] if at != pyramid else []
+    for to in legs:
+        steps.append(("drive", d, at, to, -1))
+        d, at = d + int(problem.drive_days[at, to]), to
+
+    pyr_score = ratings["Pyramid"]
+    for _ in range(3 if pyr_score >= 3.5 else 2 if pyr_score >= 2.5 else 1):
+        if d + problem.return_days[pyramid] >= problem.days: break
+        steps.append(("fish", d, pyramid, pyramid, names.index("Pyramid")))
+        d += 1
+    if not steps or steps[-1][0] != "fish": return []
+    if d + problem.return_days[eagle] < problem.days:
+        steps += [("hop", d, pyramid, eagle, -1), ("fish", d, eagle, eagle, names.index("Eagle"))]
+    return steps
 
-        # Capacity Check
-        if days_used + move_days + days_fish + return_days_from_hub > trip_days:
+def itinerary_rows(problem, plan, start_date):
+    """Solver steps -> (itinerary DataFrame, geometry IDs of every leg driven)."""
+    rows, map_segments = [], []
+    day = lambda d: (start_date + timedelta(days=d)).strftime("%m/%d/%Y")
+    for kind, d, a, b, opt in plan.steps:
+        src, dst = problem.hubs[a], problem.hubs[b]
+        if kind == "fish":
+            if a == problem.home: continue
+            if opt < 0:
+                rows.append([day(d), dst, "FISH: Extension (Time Remaining)", 0, 0, 0])
+            else:
+                o = problem.options[opt]
+                label = o["label"] or f"{o['name']} ({problem.scores[opt, d]:.1f})"
+                rows.append([day(d), dst, f"FISH: {label}", 0, 0, 0])
             continue
-            
-        # Execute Move
-        if curr_loc != hub:
-            m, h, geo = get_routing_info(curr_loc, hub)
-            cost = (m/mpg) * (BASE_GAS_PRICES.get(curr_loc, 4.00) + gas_adj_total)
-            if h > 4.0:
-                rows.append([curr_date.strftime("%m/%d/%Y"), hub, f"DRIVE: {curr_loc} → {hub}", m, h, cost])
-                curr_date += timedelta(days=1)
-                days_used += 1
+
+        m, h, geo = get_routing_info(src, dst)
+        cost = problem.fuel[a, b]
+        if geo >= 0: map_segments.append(geo)
+        if kind == "hop":
+            rows.append([day(d), dst, OPENING_LABELS.get((src, dst), f"DRIVE: {src} → {dst} (AM)"), m, h, cost])
+        elif kind == "drive":
+            legs = int(problem.drive_days[a, b])
+            if legs == 1:
+                rows.append([day(d), dst, OPENING_LABELS.get((src, dst), f"DRIVE: {src} → {dst}"), m, h, cost])
             else:
-                rows.append([curr_date.strftime("%m/%d/%Y"), hub, f"DRIVE: {curr_loc} → {hub} (AM)", m, h, cost])
-            if geo: map_segments.append(geo)
-            curr_loc = hub
-        
-        # Fish
-        for _ in range(days_fish):
-            if days_used + return_days_from_hub >= trip_days: break
-            rows.append([curr_date.strftime("%m/%d/%Y"), hub, f"FISH: {target['Name']} ({real_score:.1f})", 0, 0, 0])
-            curr_date += timedelta(days=1)
-            days_used += 1
-
-    # 2b. SLACK FILLER (Prevents early home)
-    return_days_current = get_return_days_needed(curr_loc)
-    slack_days = trip_days - days_used - return_days_current
-    if slack_days > 0 and curr_loc != "Home":
-        for _ in range(slack_days):
-             rows.append([curr_date.strftime("%m/%d/%Y"), curr_loc, "FISH: Extension (Time Remaining)", 0, 0, 0])
-             curr_date += timedelta(days=1)
-             days_used += 1
-
-    # 3. RETURN
-    if curr_loc != "Home":
-        m, h, geo = get_routing_info(curr_loc, "Home")
-        if geo: map_segments.append(geo)
-        
-        cost = (m/mpg) * (BASE_GAS_PRICES.get(curr_loc, 4.00) + gas_adj_total)
-        return_days = get_return_days_needed(curr_loc)
-        
-        if return_days == 3:
-            rows.append([curr_date.strftime("%m/%d/%Y"), "Transit", f"RETURN (Leg 1): {curr_loc} → Stop 1", m/3, h/3, cost/3])
-            curr_date += timedelta(days=1)
-            rows.append([curr_date.strftime("%m/%d/%Y"), "Transit", f"RETURN (Leg 2): Stop 1 → Stop 2", m/3, h/3, cost/3])
-            curr_date += timedelta(days=1)
-            rows.append([curr_date.strftime("%m/%d/%Y"), "Home", f"RETURN (Leg 3): Stop 2 → Home", m/3, h/3, cost/3])
-        elif return_days == 2:
-            rows.append([curr_date.strftime("%m/%d/%Y"), "Transit", f"RETURN (Leg 1): {curr_loc} → Midway", m/2, h/2, cost/2])
-            curr_date += timedelta(days=1)
-            rows.append([curr_date.strftime("%m/%d/%Y"), "Home", f"RETURN (Leg 2): Midway → Home", m/2, h/2, cost/2])
-        else:
-            rows.append([curr_date.strftime("%m/%d/%Y"), "Home", f"RETURN: {curr_loc} → Home", m, h, cost])
+                for k in range(legs):
+                    loc = dst if k == legs - 1 else "Transit"
+                    rows.append([day(d + k), loc, f"DRIVE (Leg {k + 1}): {src} → {dst}", m/legs, h/legs, cost/legs])
+        elif src != dst:
+            return_days = get_return_days_needed(src)
+            if return_days == 3:
+                rows.append([day(d), "Transit", f"RETURN (Leg 1): {src} → Stop 1", m/3, h/3, cost/3])
+                rows.append([day(d + 1), "Transit", f"RETURN (Leg 2): Stop 1 → Stop 2", m/3, h/3, cost/3])
+                rows.append([day(d + 2), "Home", f"RETURN (Leg 3): Stop 2 → Home", m/3, h/3, cost/3])
+            elif return_days == 2:
+                rows.append([day(d), "Transit", f"RETURN (Leg 1): {src} → Midway", m/2, h/2, cost/2])
+                rows.append([day(d + 1), "Home", f"RETURN (Leg 2): Midway → Home", m/2, h/2, cost/2])
+            else:
+                rows.append([day(d), "Home", f"RETURN: {src} → Home", m, h, cost])
 
     return pd.DataFrame(rows, columns=["Date", "Location", "Activity", "Miles", "Hours", "Fuel Cost"]), map_segments
 
-# ============================================================
-# 4. RENDER FUNCTION (CALLED BY MAIN APP)
-# ============================================================
+@timed("generate_itinerary")
+def generate_itinerary(start_date, trip_days, ratings, vetoes, mpg, gas_adj_total, start_location="Home", day_scores=None):
+    """Pyramid opening, then the optimal coastal plan: most fishing score net of drive time
+    and fuel (see itinerary_v2)."""
+    problem = build_trip_problem(trip_days, ratings, vetoes, mpg, gas_adj_total, start_date, day_scores)
+    if start_location not in problem.hubs: start_location = "Home"
+    plan = solve_itinerary(problem, start_location, trip_opening(problem, start_location, ratings, vetoes))
+    return itinerary_rows(problem, plan, start_date)
 
-def render_planner():
-    st.title("Steelhead Navigator V10 🧭")
+@timed("generate_alternatives")
+def generate_alternatives(start_date, trip_days, ratings, vetoes, mpg, gas_adj_total, start_location="Home", day_scores=None, k=TOP_K):
+    """Top-k distinct plans plus the score/miles/fuel Pareto set from one batched solve.
+    Returns [{"name", "df", "map_segments", "fish", "score", "fish_days", "miles", "fuel", "pareto"}],
+    fish being the plan's [(trip day, river)] for scenario checks.
+    """
+    problem = build_trip_problem(trip_days, ratings, vetoes, mpg, gas_adj_total, start_date, day_scores)
+    if start_location not in problem.hubs: start_location = "Home"
+    opening = trip_opening(problem, start_location, ratings, vetoes)
+    top, pareto = solve_alternatives(problem, start_location, k, opening=opening)
+    on_front = {tuple(p.steps) for p in pareto}
+    plans = [(("Best" if i == 0 else f"Alt {i + 1}"), p) for i, p in enumerate(top)]
+    listed = {tuple(p.steps) for p in top}
+    plans += [(f"Pareto: {p.miles:,.0f} mi", p) for p in pareto if tuple(p.steps) not in listed]
 
-    with st.spinner("Fetching Live Data (Async Flows + Weather)..."):
-        LIVE_DATA = get_live_data()
-        LIVE_FLOWS = LIVE_DATA["flows"]
-        LIVE_WEATHER = LIVE_DATA["weather"]
+    alternatives = []
+    for name, plan in plans:
+        df, map_segments = itinerary_rows(problem, plan, start_date)
+        alternatives.append({
+            "name": name, "df": df, "map_segments": map_segments,
+            "fish": [(d, problem.options[o]["name"]) for kind, d, _, _, o in plan.steps if kind == "fish" and o >= 0],
+            "score": plan.score, "fish_days": plan.fish_days, "miles": plan.miles, "fuel": plan.fuel,
+            "pareto": tuple(plan.steps) in on_front,
+        })
+    return alternatives
 
-    with st.sidebar:
-        st.header("🎛️ Mission Controls")
-        with st.expander("📍 Live Navigator", expanded=True):
-            loc_options = ["Home"] + sorted(list(NODE_COORDS.keys()))
-            current_loc = st.selectbox("Where are you now?", loc_options, index=0)
-        with st.expander("📅 Timeline", expanded=False):
-            # START DATE: Later of 2026/01/01 or Today
-            now = datetime.date.today()
-            season_start = datetime.date(2026, 1, 1)
-            start_default = max(now, season_start)
-            
-            start_d = st.date_input("Start Date", start_default, format="MM/DD/YYYY")
-            # Default trip length is now 16 days
-            end_d = st.date_input("End Date", start_default + timedelta(days=16), format="MM/DD/YYYY")
-            
-            # Calculate duration from dates
-            trip_len = (end_d - start_d).days + 1
-            
-            st.info(f"Total Window: {trip_len} Days")
+# --- Plan & map memo: reruns with the same inputs (any unrelated widget) reuse results ---
 
-        user_ratings = {}
-        vetoes = {}
-        st.subheader("🌊 River Ratings")
-        with st.expander("Pyramid Lake", expanded=False):
-            user_ratings["Pyramid"] = st.slider("Manual Rating", 0.0, 5.0, 3.5, 0.25)
+PLAN_CACHE_SIZE = 32  # Recent plan sets (and route maps) kept per process, least recent dropped
+RATING_STEP = 0.25    # Slider step: ratings are keyed (and solved) on this grid
 
-        for reg, rivers in RIVER_REGIONS.items():
-            with st.expander(reg, expanded=False):
-                vetoes[reg] = st.checkbox(f"Veto {reg}", value=False)
-                if not vetoes[reg]:
-                    for r in rivers:
-                        series = LIVE_FLOWS.get(r["Name"])
-                        hub = r.get("Hub", "")
-                        w_key = "Forks" if "WA" in reg else "Brookings" if "South" in reg else "Eureka"
-                        w_periods = LIVE_WEATHER.get(w_key, [])
-                        auto, _ = auto_score(series, r, w_periods)
-                        label = f"{r['Name']}"
-                        if auto >= 4.0: label += " 🔥"
-                        elif auto <= 1.0: label += " ⚠️"
-                        user_ratings[r["Name"]] = st.slider(label, 0.0, 5.0, float(auto), 0.25, key=f"{r['Name']}_{r['ID']}")
+_MEMO_LOCK = threading.Lock()
+_PLAN_CACHE = OrderedDict()   # plan key -> alternatives (shared by sessions: read-only)
+_DECK_CACHE = OrderedDict()   # (plan key, choice, snapshot) -> pdk.Deck
 
-        with st.expander("⚙️ Logistics", expanded=False):
-            mpg = st.number_input("MPG", 5.0, 40.0, 23.0, step=0.1, format="%.1f")
-            user_adj = st.slider("Gas +/-", -1.0, 1.0, 0.0, 0.1, format="%.1f")
-            total_gas_adj = user_adj
+def _memo_get(cache, key, layer):
+    with _MEMO_LOCK:
+        value = cache.get(key)
+        if value is not None: cache.move_to_end(key)
+    record_cache(layer, "hit" if value is not None else "miss")
+    return value
 
-        st.markdown("---")
-        st.markdown("### 🔗 Quick Links")
-        st.markdown("""
-        * [NOAA River Forecast](https://www.cnrfc.noaa.gov/)
-        * [Pyramid Fly Co](https://pyramidflyco.com/fishing-report/)
-        * [The Fly Shop](https://www.theflyshop.com/stream-report)
-        * [Ashland Fly Shop](https://www.ashlandflyshop.com/blogs/fishing-reports)
-        * [Waters West](https://waterswest.com/fishing-report/)
-        """)
+def _memo_put(cache, key, value):
+    with _MEMO_LOCK:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > PLAN_CACHE_SIZE:
+            cache.popitem(last=False)
 
-    # ============================================================
-    # 5. MAIN CONTENT
-    # ============================================================
+def quantize_ratings(ratings):
+    return {name: round(float(v) / RATING_STEP) * RATING_STEP for name, v in ratings.items()}
 
-    df, map_segments = generate_itinerary(start_d, trip_len, user_ratings, vetoes, mpg, total_gas_adj, current_loc)
-
-    c1, c2, c3, c4 = st.columns(4)
-    c1.metric("Total Days", trip_len)
-    c2.metric("Fish Days", len(df[df["Activity"].str.contains("FISH")]))
-    c3.metric("Est. Miles", f"{df['Miles'].sum():,.0f}")
-    c4.metric("Est. Fuel", f"${df['Fuel Cost'].sum():,.0f}")
+def plan_key(start_date, trip_days, ratings, vetoes, mpg, gas_adj_total, start_location, day_scores=None):
+    """Canonical digest of everything generate_alternatives reads.
 
-    st.divider()
-    st.subheader("📅 Proposed Itinerary")
+    Ratings sit on the slider grid, vetoes reduce to the vetoed set, and MPG and gas
+    adjustment round to their widget steps. The outlook enters by content, so a new
+    snapshot only changes the key when its scores actually move.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    canon = (
+        str(start_date), int(trip_days), start_location, round(float(mpg), 1), round(float(gas_adj_total), 2),
+        tuple(sorted(quantize_ratings(ratings).items())), tuple(sorted(k for k, v in vetoes.items() if v)),
+    )
+    h.update(repr(canon).encode())
+    if day_scores is not None:
+        h.update(repr((list(day_scores.index), str(day_scores.columns[:1].tolist()), day_scores.shape)).encode())
+        h.update(np.ascontiguousarray(day_scores.to_numpy(dtype=np.float64)).tobytes())
+    return h.hexdigest()
 
-    def highlight_today(row):
-        try:
-            row_date = datetime.datetime.strptime(row['Date'], "%m/%d/%Y").date()
-            if row_date == datetime.date.today():
-                 return ['background-color: #dbeafe; color: #1e40af; font-weight: bold'] * len(row)
-        except: pass
-        return [''] * len(row)
+def memo_alternatives(start_date, trip_days, ratings, vetoes, mpg, gas_adj_total, start_location="Home", day_scores=None):
+    """(plan key, generate_alternatives result), solved once per distinct input."""
+    key = plan_key(start_date, trip_days, ratings, vetoes, mpg, gas_adj_total, start_location, day_scores)
+    alternatives = _memo_get(_PLAN_CACHE, key, "plan")
+    if alternatives is None:
+        alternatives = generate_alternatives(
+            start_date, trip_days, quantize_ratings(ratings), vetoes, round(float(mpg), 1),
+            round(float(gas_adj_total), 2), start_location, day_scores
+        )
+        _memo_put(_PLAN_CACHE, key, alternatives)
+    return key, alternatives
 
-    st.dataframe(
-        df.style.format({"Miles": "{:.0f}", "Hours": "{:.1f}", "Fuel Cost": "${:.0f}"}).apply(highlight_today, axis=1),
-        use_container_width=True,
-        height=(len(df)+1)*35,
-        hide_index=True
-    )
+def memo_route_deck(key, choice, snapshot_token, df, map_segments, user_ratings, vetoes, live_flows):
+    """build_route_deck for the chosen plan, reused while plan, pick and snapshot are unchanged."""
+    deck_key = (key, choice, snapshot_token)
+    deck = _memo_get(_DECK_CACHE, deck_key, "route_deck")
+    if deck is None:
+        deck = build_route_deck(df, map_segments, quantize_ratings(user_ratings), vetoes, live_flows)
+        _memo_put(_DECK_CACHE, deck_key, deck)
+    return deck
 
+@timed("build_route_deck")
+def build_route_deck(df, map_segments, user_ratings, vetoes, live_flows):
+    """pydeck payload for one itinerary: hub stops, every river's status, and the driven route."""
     import pydeck as pdk
-    st.subheader("🗺️ Route Map")
-    
-    st.markdown("""
-    <style>
-    .map-legend { font-size: 14px; margin-bottom: 10px; }
-    .dot { height: 10px; width: 10px; border-radius: 50%; display: inline-block; margin-right: 5px; }
-    </style>
-    <div class="map-legend">
-        <span class="dot" style="background-color: rgb(160, 32, 240);"></span>Nodes (Hubs) &nbsp;
-        <span class="dot" style="background-color: rgb(0, 255, 0);"></span>Prime (>= 4.0) &nbsp;
-        <span class="dot" style="background-color: rgb(255, 255, 0);"></span>Marginal (3.0-4.0) &nbsp;
-        <span class="dot" style="background-color: rgb(255, 165, 0);"></span>Marginal (2.0-3.0) &nbsp;
-        <span class="dot" style="background-color: rgb(255, 0, 0);"></span>Low/Poor (< 2.0) &nbsp;
-        <span class="dot" style="background-color: rgb(200, 200, 200);"></span>Vetoed/No Data
-    </div>
-    """, unsafe_allow_html=True)
 
     map_points = []
     
@@ -700,7 +822,7 @@ def render_planner():
                 elif score >= 2.0: col = [255, 165, 0]
                 else: col = [255, 0, 0]
 
-                series = LIVE_FLOWS.get(r["Name"])
+                series = live_flows.get(r["Name"])
                 if series and len(series) > 0:
                     val = series[-1][1]
                     unit = "ft" if "ft" in r.get("T", "") else "cfs"
@@ -719,10 +841,17 @@ def render_planner():
                     "radius": 8000
                 })
 
-    # Render Actual Route Geometry from JSON
+    # Dynamic View State
+    if lats and lons:
+        view = pdk.ViewState(latitude=sum(lats)/len(lats), longitude=sum(lons)/len(lons), zoom=5.2)
+    else:
+        view = pdk.ViewState(latitude=44.5, longitude=-122.0, zoom=5.2)
+
+    # Render Actual Route Geometry, simplified to what this view can show
+    tier = tier_for_view(view.zoom, view.latitude, ROUTE_INDEX.geometries.tolerances)
     l_route = pdk.Layer(
         "PathLayer",
-        data=[{"path": segment} for segment in map_segments],
+        data=[{"path": ROUTE_INDEX.geometry(gid, tier)} for gid in map_segments],
         get_path="path",
         get_color=[255, 140, 0],
         width_min_pixels=3,
@@ -748,13 +877,175 @@ def render_planner():
         auto_highlight=True
     )
 
-    # Dynamic View State
-    if lats and lons:
-        view = pdk.ViewState(latitude=sum(lats)/len(lats), longitude=sum(lons)/len(lons), zoom=5.2)
+    return pdk.Deck(layers=[l_route, l_points], initial_view_state=view, tooltip={"html": tooltip_html})
+
+# ============================================================
+# 4. RENDER FUNCTION (CALLED BY MAIN APP)
+# ============================================================
+
+def render_planner():
+    st.title("Steelhead Navigator V10 🧭")
+
+    if get_live_refresher().latest() is None:
+        with st.spinner("Fetching Live Data (Async Flows + Weather)..."):
+            LIVE_DATA = get_live_data()
     else:
-        view = pdk.ViewState(latitude=44.5, longitude=-122.0, zoom=5.2)
-        
-    st.pydeck_chart(pdk.Deck(layers=[l_route, l_points], initial_view_state=view, tooltip={"html": tooltip_html}))
+        LIVE_DATA = get_live_data()
+    LIVE_FLOWS = LIVE_DATA["flows"]
+    LIVE_WEATHER = LIVE_DATA["weather"]
+    auto_scores = batch_auto_scores(LIVE_DATA)
+
+    with st.sidebar:
+        st.header("🎛️ Mission Controls")
+        render_data_age(get_live_refresher())
+        with st.expander("📍 Live Navigator", expanded=True):
+            loc_options = ["Home"] + sorted(list(NODE_COORDS.keys()))
+            current_loc = st.selectbox("Where are you now?", loc_options, index=0)
+        with st.expander("📅 Timeline", expanded=False):
+            # START DATE: Later of 2026/01/01 or Today
+            now = datetime.date.today()
+            season_start = datetime.date(2026, 1, 1)
+            start_default = max(now, season_start)
+            
+            start_d = st.date_input("Start Date", start_default, format="MM/DD/YYYY")
+            # Default trip length is now 16 days
+            end_d = st.date_input("End Date", start_default + timedelta(days=16), format="MM/DD/YYYY")
+            
+            # Calculate duration from dates
+            trip_len = (end_d - start_d).days + 1
+            
+            st.info(f"Total Window: {trip_len} Days")
+
+        user_ratings = {}
+        vetoes = {}
+        st.subheader("🌊 River Ratings")
+        with st.expander("Pyramid Lake", expanded=False):
+            user_ratings["Pyramid"] = st.slider("Manual Rating", 0.0, 5.0, 3.5, 0.25)
+
+        for reg, rivers in RIVER_REGIONS.items():
+            with st.expander(reg, expanded=False):
+                vetoes[reg] = st.checkbox(f"Veto {reg}", value=False)
+                if not vetoes[reg]:
+                    for r in rivers:
+                        auto, _ = auto_scores[r["Name"]]
+                        label = f"{r['Name']}"
+                        if auto >= 4.0: label += " 🔥"
+                        elif auto <= 1.0: label += " ⚠️"
+                        user_ratings[r["Name"]] = st.slider(label, 0.0, 5.0, float(auto), 0.25, key=f"{r['Name']}_{r['ID']}")
+
+        with st.expander("⚙️ Logistics", expanded=False):
+            mpg = st.number_input("MPG", 5.0, 40.0, 23.0, step=0.1, format="%.1f")
+            user_adj = st.slider("Gas +/-", -1.0, 1.0, 0.0, 0.1, format="%.1f")
+            total_gas_adj = user_adj
+
+        st.markdown("---")
+        st.markdown("### 🔗 Quick Links")
+        st.markdown("""
+        * [NOAA River Forecast](https://www.cnrfc.noaa.gov/)
+        * [Pyramid Fly Co](https://pyramidflyco.com/fishing-report/)
+        * [The Fly Shop](https://www.theflyshop.com/stream-report)
+        * [Ashland Fly Shop](https://www.ashlandflyshop.com/blogs/fishing-reports)
+        * [Waters West](https://waterswest.com/fishing-report/)
+        """)
+
+    # ============================================================
+    # 5. MAIN CONTENT
+    # ============================================================
+
+    # Day-by-day outlook, shifted by however far each slider was moved off its auto score
+    outlook = river_outlook(LIVE_DATA)
+    user_ratings = quantize_ratings(user_ratings)
+    offsets = pd.Series({n: v - auto_scores[n][0] for n, v in user_ratings.items() if n in auto_scores})
+    day_scores = outlook.add(offsets.reindex(outlook.index, fill_value=0.0), axis=0).clip(0.0, 5.0)
+    plan_id, alternatives = memo_alternatives(start_d, trip_len, user_ratings, vetoes, mpg, total_gas_adj, current_loc, day_scores)
+    snap = get_live_refresher().latest()
+    snapshot_token = snap.fetched_at.isoformat() if snap is not None else None
+
+    simulate = st.toggle("🎲 Simulate forecast uncertainty", value=False,
+                         help="Replays every plan against thousands of sampled river futures.")
+    robustness = []
+    if simulate:
+        with st.spinner("Simulating river scenarios..."):
+            engine, scenarios = river_scenarios(LIVE_DATA)
+        robustness = [plan_robustness(a["fish"], start_d, engine, scenarios, user_ratings, offsets.to_dict()) for a in alternatives]
+
+    with st.expander("⚖️ Alternative Plans", expanded=simulate):
+        table = pd.DataFrame([{
+            "Plan": a["name"], "Score": a["score"], "Fish Days": a["fish_days"],
+            "Miles": a["miles"], "Fuel Cost": a["fuel"], "Pareto": "✅" if a["pareto"] else "",
+        } for a in alternatives])
+        if simulate:
+            table["Expected Good Days"] = [e for e, _ in robustness]
+            table["P10 Good Days"] = [p10 for _, p10 in robustness]
+        st.dataframe(
+            table.style.format({"Score": "{:.1f}", "Miles": "{:,.0f}", "Fuel Cost": "${:.0f}",
+                                "Expected Good Days": "{:.1f}", "P10 Good Days": "{:.0f}"}),
+            use_container_width=True,
+            hide_index=True
+        )
+        if simulate:
+            st.caption(f"Good day = scheduled river scores {FISHABLE_SCORE:.1f}+ in a sampled future; "
+                       f"P10 = good days in the worst 10% of {len(scenarios):,} futures.")
+    with st.expander("📈 River Outlook (Expected Score by Day)", expanded=False):
+        window = day_scores.loc[:, (day_scores.columns >= pd.Timestamp(start_d)) & (day_scores.columns <= pd.Timestamp(end_d))]
+        window = window.drop(index=[r["Name"] for reg, rivers in RIVER_REGIONS.items() if vetoes.get(reg) for r in rivers], errors="ignore")
+        window.columns = window.columns.strftime("%m/%d")
+        st.dataframe(window.style.format("{:.1f}"), use_container_width=True)
+        st.caption("NWPS hydrograph where available, then recession and NWS rain; later days fade toward each river's seasonal norm from local gauge history (2.5 without history).")
+    choice = st.radio("Plan", range(len(alternatives)), format_func=lambda i: alternatives[i]["name"], horizontal=True)
+    df, map_segments = alternatives[choice]["df"], alternatives[choice]["map_segments"]
+
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Total Days", trip_len)
+    c2.metric("Fish Days", len(df[df["Activity"].str.contains("FISH")]))
+    c3.metric("Est. Miles", f"{df['Miles'].sum():,.0f}")
+    c4.metric("Est. Fuel", f"${df['Fuel Cost'].sum():,.0f}")
+    if simulate:
+        expected, p10 = robustness[choice]
+        st.caption(f"🎲 Expected good fishing days: {expected:.1f} · P10: {p10:.0f}")
+
+    st.divider()
+    st.subheader("📅 Proposed Itinerary")
+
+    def highlight_today(row):
+        try:
+            row_date = datetime.datetime.strptime(row['Date'], "%m/%d/%Y").date()
+            if row_date == datetime.date.today():
+                 return ['background-color: #dbeafe; color: #1e40af; font-weight: bold'] * len(row)
+        except: pass
+        return [''] * len(row)
+
+    if df.empty:
+        # Nothing fits: no fishing day plus the drive home inside the window
+        st.warning(f"⏳ Window too short: {trip_len} day(s) from {current_loc} can't fit a fishing day "
+                   "and the drive home. Lengthen the trip to get an itinerary.")
+    else:
+        st.dataframe(
+            df.style.format({"Miles": "{:.0f}", "Hours": "{:.1f}", "Fuel Cost": "${:.0f}"}).apply(highlight_today, axis=1),
+            use_container_width=True,
+            height=(len(df)+1)*35,
+            hide_index=True
+        )
+
+    st.subheader("🗺️ Route Map")
+    
+    st.markdown("""
+    <style>
+    .map-legend { font-size: 14px; margin-bottom: 10px; }
+    .dot { height: 10px; width: 10px; border-radius: 50%; display: inline-block; margin-right: 5px; }
+    </style>
+    <div class="map-legend">
+        <span class="dot" style="background-color: rgb(160, 32, 240);"></span>Nodes (Hubs) &nbsp;
+        <span class="dot" style="background-color: rgb(0, 255, 0);"></span>Prime (>= 4.0) &nbsp;
+        <span class="dot" style="background-color: rgb(255, 255, 0);"></span>Marginal (3.0-4.0) &nbsp;
+        <span class="dot" style="background-color: rgb(255, 165, 0);"></span>Marginal (2.0-3.0) &nbsp;
+        <span class="dot" style="background-color: rgb(255, 0, 0);"></span>Low/Poor (< 2.0) &nbsp;
+        <span class="dot" style="background-color: rgb(200, 200, 200);"></span>Vetoed/No Data
+    </div>
+    """, unsafe_allow_html=True)
+
+    deck = memo_route_deck(plan_id, choice, snapshot_token, df, map_segments, user_ratings, vetoes, LIVE_FLOWS)
+    st.pydeck_chart(deck)
 
     # --- Conditions ---
     st.divider()
@@ -775,7 +1066,7 @@ def render_planner():
                             txt = x["detailedForecast"]
                             precip_clean = format_precip_text(txt)
                             st.caption(f"**{x['name']}**: {x['temperature']}°F. {x['shortForecast']}\n*Wind: {x.get('windSpeed')} | {precip_clean}*")
-                    else: st.caption("No Data")
+                    else: st.caption(f"No Data ({periods.describe()})" if isinstance(periods, FetchError) else "No Data")
                         
         with t2:
             cols = st.columns(3)
@@ -788,4 +1079,4 @@ def render_planner():
                             txt = x["detailedForecast"]
                             precip_clean = format_precip_text(txt)
                             st.caption(f"**{x['name']}**: {x['temperature']}°F. {x['shortForecast']} {precip_clean}")
-                    else: st.caption("No Data")
\ No newline at end of file
+                    else: st.caption(f"No Data ({periods.describe()})" if isinstance(periods, FetchError) else "No Data")
\ No newline at end of file
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import datetime as dt
+import threading
+import time
+from collections import namedtuple
+
+import streamlit as st
+
+from http_v2 import get_runtime, revalidating
+
+# ============================================================
+# 1. SNAPSHOTS + BACKGROUND REFRESH THREAD
+# ============================================================
+
+REFRESH_INTERVAL_S = 900  # Same cadence as the old st.cache_data(ttl=900)
+FIRST_LOAD_TIMEOUT_S = 90
+REFRESH_JOB_TIMEOUT_S = 120
+
+# Immutable view of one completed fetch. Renderers must treat `data` as read-only:
+# the same object is shared by every Streamlit session in the process.
+Snapshot = namedtuple("Snapshot", ["data", "fetched_at", "duration_s", "error"])
+
+class BackgroundRefresher:
+    """Daemon thread that keeps one dataset warm.
+
+    fetch_factory is a zero-arg callable returning a coroutine (e.g. fetch_all_data).
+    Every interval_s the thread submits it to the shared AsyncRuntime and publishes
+    the result as a new Snapshot; readers never block on the network once the
+    first snapshot exists.
+    """
+
+    def __init__(self, name, fetch_factory, interval_s=REFRESH_INTERVAL_S):
+        self.name = name
+        self._fetch_factory = fetch_factory
+        self._interval_s = interval_s
+        self._snapshot = None
+        self._last_error = None
+        self._refreshing = False
+        self._revalidate = False  # Next run skips the disk cache's fresh window (manual refresh)
+        self._wake = threading.Event()
+        self._ready = threading.Event()
+        self._published = threading.Condition()
+        self._generation = 0  # Bumped after every attempt, successful or not
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"refresher-{self.name}", daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        runtime = get_runtime()
+        while True:
+            self._refreshing = True
+            t0 = time.monotonic()
+            job = self._fetch_factory()
+            if self._revalidate:
+                self._revalidate = False
+                job = revalidating(job)
+            try:
+                data = runtime.run(job, timeout=REFRESH_JOB_TIMEOUT_S)
+                self._snapshot = Snapshot(data, dt.datetime.now(), time.monotonic() - t0, None)
+                self._last_error = None
+            except Exception as e:
+                # Keep serving the previous snapshot; just remember what went wrong
+                self._last_error = f"{type(e).__name__}: {e}"
+            finally:
+                self._refreshing = False
+                self._ready.set()
+                with self._published:
+                    self._generation += 1
+                    self._published.notify_all()
+            self._wake.wait(self._interval_s)
+            self._wake.clear()
+
+    def latest(self):
+        """Most recent snapshot, or None before the first fetch completes."""
+        return self._snapshot
+
+    def wait_for_snapshot(self, timeout=FIRST_LOAD_TIMEOUT_S):
+        self.start()
+        self._ready.wait(timeout)
+        return self._snapshot
+
+    def request_refresh(self, revalidate=False):
+        """Wake the thread for an immediate refresh; current data keeps being served.
+
+        revalidate=True (the refresh buttons) makes every cached request go upstream.
+        """
+        if revalidate: self._revalidate = True
+        self.start()
+        if not self._refreshing: self._wake.set()
+
+    def refresh_and_wait(self, timeout=FIRST_LOAD_TIMEOUT_S, revalidate=False):
+        """Trigger a refresh (or join the one in progress) and block until it finishes."""
+        with self._published:
+            gen = self._generation
+        self.request_refresh(revalidate)
+        with self._published:
+            self._published.wait_for(lambda: self._generation > gen, timeout)
+        return self._snapshot
+
+    def snapshot_age_s(self):
+        snap = self._snapshot
+        if snap is None: return None
+        return (dt.datetime.now() - snap.fetched_at).total_seconds()
+
+    @property
+    def is_refreshing(self):
+        return self._refreshing
+
+    @property
+    def last_error(self):
+        return self._last_error
+
+_REFRESHERS = {}
+_REFRESHERS_LOCK = threading.Lock()
+
+def get_refresher(name, fetch_factory, interval_s=REFRESH_INTERVAL_S):
+    """Process-wide refresher registry; started on first use."""
+    with _REFRESHERS_LOCK:
+        refresher = _REFRESHERS.get(name)
+        if refresher is None:
+            refresher = BackgroundRefresher(name, fetch_factory, interval_s)
+            _REFRESHERS[name] = refresher
+    return refresher.start()
+
+# ============================================================
+# 2. UI HELPERS
+# ============================================================
+
+def format_data_age(snapshot):
+    if snapshot is None: return "No data yet"
+    mins = int((dt.datetime.now() - snapshot.fetched_at).total_seconds() // 60)
+    age = "just now" if mins < 1 else f"{mins} min ago"
+    return f"Data as of {snapshot.fetched_at.strftime('%m/%d %H:%M')} ({age})"
+
+def render_data_age(refresher):
+    """Small data-age / refresh-status caption for a sidebar."""
+    snap = refresher.latest()
+    txt = f"🕒 {format_data_age(snap)}"
+    if refresher.is_refreshing: txt += " • 🔄 refreshing…"
+    st.caption(txt)
+    if refresher.last_error:
+        st.caption(f"⚠️ Last refresh failed ({refresher.last_error}); showing previous data.")
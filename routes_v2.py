@@ -0,0 +1,605 @@
+# -*- coding: utf-8 -*-
+import argparse
+import bz2
+import gzip
+import heapq
+import json
+import math
+import os
+import re
+import struct
+import sys
+import xml.etree.ElementTree as ET
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    import osmium  # Optional: only needed to read .osm.pbf extracts
+except ImportError:
+    osmium = None
+
+# ============================================================
+# 1. HUB ROUTE INDEX
+# ============================================================
+
+EARTH_RADIUS_MI = 3958.8
+ROAD_FACTOR = 1.35  # Straight-line -> road miles when no stored route exists
+FALLBACK_MPH = 50.0
+
+def route_keys(a, b):
+    """routes.json keys probed for a pair, in priority order (handles the 'Delta' / 'Delta, UT' split)."""
+    return (
+        f"{a}|{b}", f"{b}|{a}",
+        f"{a}|{b}, UT", f"{b}, UT|{a}",
+        f"{a}, UT|{b}", f"{b}|{a}, UT",
+    )
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    """Great-circle miles; broadcasts over NumPy arrays."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS_MI * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+GEOMETRY_DECIMALS = 5  # float32 lon/lat is good to ~1 m; rounding keeps the pydeck JSON short
+
+# Douglas-Peucker tolerance (degrees) per geometry tier; tier 0 is full resolution.
+# Roughly 20 m, 100 m, 400 m and 1.6 km of allowed deviation.
+ROUTE_TOLERANCES_DEG = (0.0, 0.0002, 0.001, 0.004, 0.016)
+TIER_ZOOM_HEADROOM = 2  # Pick a tier that still looks exact after zooming in this many levels
+
+def path_importance(coords, min_tolerance=0.0):
+    """Douglas-Peucker split distance per vertex, capped by its ancestors' (endpoints = inf).
+
+    One recursion serves every tier: the vertices DP keeps at tolerance tol are exactly
+    importance > tol. Splitting stops below min_tolerance (those vertices get 0).
+    """
+    pts = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    n = len(pts)
+    importance = np.zeros(n)
+    if n == 0: return importance
+    importance[[0, -1]] = np.inf
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        i, j, cap = stack.pop()
+        if j - i < 2: continue
+        a, inner = pts[i], pts[i + 1:j]
+        d = pts[j] - a
+        length2 = d @ d
+        t = np.clip(((inner - a) @ d) / length2, 0.0, 1.0) if length2 > 0 else np.zeros(len(inner))
+        dist = np.hypot(*(inner - a - t[:, None] * d).T)
+        k = int(np.argmax(dist))
+        if dist[k] > min_tolerance:
+            m = i + 1 + k
+            importance[m] = min(dist[k], cap)
+            stack.append((i, m, importance[m]))
+            stack.append((m, j, importance[m]))
+    return importance
+
+def simplify_path(coords, tolerance):
+    """Douglas-Peucker: the subset of (n, 2) vertices within `tolerance` of the original line."""
+    pts = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if len(pts) < 3 or tolerance <= 0: return pts
+    return pts[path_importance(pts, tolerance) > tolerance]
+
+def tier_for_view(zoom, latitude, tolerances=ROUTE_TOLERANCES_DEG):
+    """Coarsest tier whose error stays under one screen pixel at the given web-mercator zoom.
+
+    Longitude degrees per pixel shrink with cos(latitude), so northern views get finer tiers;
+    TIER_ZOOM_HEADROOM leaves room to zoom into the map before simplification shows.
+    """
+    deg_per_px = 360.0 / (256 * 2 ** (zoom + TIER_ZOOM_HEADROOM)) * math.cos(math.radians(latitude))
+    return max((k for k, tol in enumerate(tolerances) if tol <= deg_per_px), default=0)
+
+class GeometryTable:
+    """Route polylines as float32 (lon, lat) vertex blocks addressed by integer ID and tier.
+
+    The first `packed` blocks are slices of one offsets-indexed vertex array (memory-mapped
+    from routes.bin, one offsets row per precomputed tier); blocks added at build time
+    (JSON routes, straight-line fallbacks) follow and get simplified on first use.
+    Nothing is turned into Python lists until a segment is actually drawn.
+    """
+
+    def __init__(self, offsets=None, vertices=None, tolerances=ROUTE_TOLERANCES_DEG):
+        self.offsets = np.zeros((1, 1), dtype=np.int64) if offsets is None else np.atleast_2d(offsets)
+        self.vertices = np.empty((0, 2), dtype=np.float32) if vertices is None else vertices
+        self.tolerances = tuple(tolerances)
+        self.packed = self.offsets.shape[1] - 1
+        self._extra = []
+        self._importance = {}  # gid -> path_importance(), for blocks whose tiers are not stored
+
+    def __len__(self):
+        return self.packed + len(self._extra)
+
+    def add(self, coords):
+        self._extra.append(np.asarray(coords, dtype=np.float32).reshape(-1, 2))
+        return len(self) - 1
+
+    def block(self, gid, tier=0):
+        tier = min(max(tier, 0), len(self.tolerances) - 1)
+        if gid < self.packed and tier < len(self.offsets):
+            return self.vertices[self.offsets[tier, gid]:self.offsets[tier, gid + 1]]
+        full = self.block(gid, 0) if gid < self.packed else self._extra[gid - self.packed]
+        if tier == 0: return full
+        if gid not in self._importance:
+            self._importance[gid] = path_importance(full, min(t for t in self.tolerances if t > 0))
+        return full[self._importance[gid] > self.tolerances[tier]]
+
+    def decode(self, gid, tier=0):
+        """[[lon, lat], ...] for one geometry ID at one simplification tier."""
+        return np.round(self.block(gid, tier).astype(np.float64), GEOMETRY_DECIMALS).tolist()
+
+    def __getitem__(self, gid):
+        return self.decode(gid)
+
+class RouteIndex:
+    """Hub-to-hub routing as arrays: names -> int IDs, dense miles/hours matrices, geometry table.
+
+    Key aliasing and the straight-line fallback are resolved once when the index is
+    built, so a lookup is a dict hit plus two array reads. geo_ids[i, j] points into
+    the GeometryTable (-1 = none); both directions of a stored route share one entry.
+    """
+
+    def __init__(self, names, miles, hours, geo_ids, geometries):
+        self.names = list(names)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.miles = miles
+        self.hours = hours
+        self.geo_ids = geo_ids
+        self.geometries = geometries
+
+    @classmethod
+    def from_routes(cls, routes, coords, geometries=None):
+        """routes.json dict ({"A|B": {"miles", "hours", "geometry"}}) + hub coords -> RouteIndex.
+
+        "geometry" is either an inline [[lon, lat], ...] list or, for routes read from the
+        binary DB, an integer ID into `geometries` (the DB's GeometryTable).
+        """
+        names = list(coords)
+        for key in routes:
+            for name in key.split("|"):
+                if name not in coords and name not in names: names.append(name)
+        n = len(names)
+        miles = np.zeros((n, n), dtype=np.float64)
+        hours = np.zeros((n, n), dtype=np.float64)
+        geo_ids = np.full((n, n), -1, dtype=np.int32)
+        geometries = GeometryTable() if geometries is None else geometries
+        geo_of_key = {}
+
+        # Straight-line estimates for every pair of known hubs, computed in one shot
+        known = np.array([name in coords for name in names])
+        lat = np.array([coords[name]["lat"] if name in coords else 0.0 for name in names])
+        lon = np.array([coords[name]["lon"] if name in coords else 0.0 for name in names])
+        est = haversine_miles(lat[:, None], lon[:, None], lat[None, :], lon[None, :]) * ROAD_FACTOR
+
+        for i, a in enumerate(names):
+            for j, b in enumerate(names):
+                if i == j: continue
+                key = next((k for k in route_keys(a, b) if k in routes), None)
+                if key is not None:
+                    r = routes[key]
+                    miles[i, j], hours[i, j] = r["miles"], r["hours"]
+                    if key not in geo_of_key:
+                        geo = r.get("geometry", [])
+                        if isinstance(geo, (int, np.integer)): geo_of_key[key] = int(geo)
+                        else: geo_of_key[key] = geometries.add(geo) if len(geo) else -1
+                    geo_ids[i, j] = geo_of_key[key]
+                elif known[i] and known[j]:
+                    miles[i, j] = int(est[i, j])
+                    hours[i, j] = round(est[i, j] / FALLBACK_MPH, 1)
+                    geo_ids[i, j] = geometries.add([[lon[i], lat[i]], [lon[j], lat[j]]])
+        return cls(names, miles, hours, geo_ids, geometries)
+
+    def __len__(self):
+        return len(self.names)
+
+    def id(self, name):
+        return self.ids.get(name, -1)
+
+    def geometry(self, gid, tier=0):
+        return self.geometries.decode(gid, tier) if gid >= 0 else []
+
+    def route(self, a, b):
+        """(miles, hours, geometry ID) between two hubs; (0, 0.0, -1) for the same or unknown hubs."""
+        if a == b: return 0, 0.0, -1
+        i, j = self.ids.get(a, -1), self.ids.get(b, -1)
+        if i < 0 or j < 0: return 0, 0.0, -1
+        return float(self.miles[i, j]), float(self.hours[i, j]), int(self.geo_ids[i, j])
+
+    def hours_between(self, a, b):
+        i, j = self.ids.get(a, -1), self.ids.get(b, -1)
+        if a == b or i < 0 or j < 0: return 0.0
+        return float(self.hours[i, j])
+
+# ============================================================
+# 2. BINARY ROUTE DATABASE (routes.bin)
+# ============================================================
+
+# Layout (little-endian, every section 8-byte aligned):
+#   header     magic, n_names, n_routes, n_vertices, names_len, n_tiers
+#   names      UTF-8 hub names joined by "\n"
+#   tolerances n_tiers x float64, Douglas-Peucker tolerance of each tier (0 = full)
+#   routes     n_routes x ROUTE_DTYPE (hub IDs into names + miles/hours)
+#   offsets    n_tiers x (n_routes + 1) int64, vertex index where each route's tier starts
+#   vertices   n_vertices x (lon, lat) float32, every tier of every route
+ROUTE_DB_MAGIC = b"SHROUTE2"
+ROUTE_DB_HEADER = struct.Struct("<8sIIQQI4x")
+ROUTE_DTYPE = np.dtype([("a", "<i4"), ("b", "<i4"), ("miles", "<f8"), ("hours", "<f8")])
+
+def _align8(n):
+    return (n + 7) & ~7
+
+def read_routes_json(path):
+    """routes.json or routes.json.gz -> dict."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_routes_json(routes, path):
+    opener = gzip.open if path.endswith(".gz") else open
+    tmp = path + ".tmp"
+    with opener(tmp, "wt", encoding="utf-8") as f:
+        json.dump(routes, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+def write_route_db(routes, path, tolerances=ROUTE_TOLERANCES_DEG):
+    """routes.json-style dict -> routes.bin with every simplification tier precomputed.
+
+    Written to a temp file, then swapped in. Returns (routes, vertices per tier).
+    """
+    names, ids, records, full = [], {}, [], []
+    for key, r in routes.items():
+        a, _, b = key.partition("|")
+        for name in (a, b):
+            if name not in ids:
+                ids[name] = len(names)
+                names.append(name)
+        records.append((ids[a], ids[b], float(r["miles"]), float(r["hours"])))
+        full.append(np.asarray(r.get("geometry") or [], dtype=np.float32).reshape(-1, 2))
+    # Simplify the float32 vertices the map will actually see; one DP pass per route serves all tiers
+    finest = min((t for t in tolerances if t > 0), default=0.0)
+    importance = [path_importance(b, finest) for b in full]
+    blocks = [[b[imp > tol] if tol > 0 else b for b, imp in zip(full, importance)] for tol in tolerances]
+    counts = np.array([[len(b) for b in tier] for tier in blocks], dtype=np.int64).reshape(len(tolerances), -1)
+    offsets = np.zeros((len(tolerances), len(records) + 1), dtype=np.int64)
+    offsets[:, 1:] = np.cumsum(counts.ravel()).reshape(counts.shape)
+    offsets[1:, 0] = offsets[:-1, -1]
+    flat = [b for tier in blocks for b in tier]
+    vertices = np.concatenate(flat) if flat else np.empty((0, 2), dtype=np.float32)
+    name_bytes = "\n".join(names).encode("utf-8")
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(ROUTE_DB_HEADER.pack(ROUTE_DB_MAGIC, len(names), len(records), len(vertices), len(name_bytes), len(tolerances)))
+        f.write(name_bytes.ljust(_align8(len(name_bytes)), b"\0"))
+        f.write(np.asarray(tolerances, dtype="<f8").tobytes())
+        f.write(np.array(records, dtype=ROUTE_DTYPE).tobytes())
+        f.write(offsets.tobytes())
+        f.write(vertices.astype("<f4").tobytes())
+    os.replace(tmp, path)
+    return len(records), counts.sum(axis=1).tolist()
+
+def load_route_db(path):
+    """Memory-maps routes.bin -> (routes dict with integer geometry IDs, GeometryTable).
+
+    Only the header, names and route table are read up front; vertex pages are faulted
+    in by the OS when a segment is decoded for the map.
+    """
+    mm = np.memmap(path, dtype=np.uint8, mode="r")
+    if bytes(mm[:8]) != ROUTE_DB_MAGIC:
+        raise ValueError(f"{path} is not a current route database (rebuild with: python routes_v2.py convert)")
+    _, n_names, n_routes, n_vertices, names_len, n_tiers = ROUTE_DB_HEADER.unpack_from(mm, 0)
+    pos = ROUTE_DB_HEADER.size
+    names = bytes(mm[pos:pos + names_len]).decode("utf-8").split("\n") if n_names else []
+    pos += _align8(names_len)
+    tolerances = np.frombuffer(mm, dtype="<f8", count=n_tiers, offset=pos)
+    pos += tolerances.nbytes
+    table = np.frombuffer(mm, dtype=ROUTE_DTYPE, count=n_routes, offset=pos)
+    pos += table.nbytes
+    offsets = np.frombuffer(mm, dtype="<i8", count=n_tiers * (n_routes + 1), offset=pos).reshape(n_tiers, -1)
+    pos += offsets.nbytes
+    vertices = np.frombuffer(mm, dtype="<f4", count=n_vertices * 2, offset=pos).reshape(-1, 2)
+
+    routes = {}
+    for gid, (a, b, miles, hours) in enumerate(table.tolist()):
+        has_geo = offsets[0, gid + 1] > offsets[0, gid]
+        routes[f"{names[a]}|{names[b]}"] = {"miles": miles, "hours": hours, "geometry": gid if has_geo else -1}
+    return routes, GeometryTable(offsets, vertices, tolerances.tolist())
+
+# ============================================================
+# 3. OFFLINE ROUTE BUILDER (OSM EXTRACT -> routes.json)
+# ============================================================
+
+# Free-flow speed per OSM highway class, used when a way has no usable maxspeed
+ROAD_SPEEDS_MPH = {
+    "motorway": 65, "trunk": 55, "primary": 50, "secondary": 45, "tertiary": 35,
+    "unclassified": 30, "residential": 25, "living_street": 10, "service": 15,
+    "motorway_link": 40, "trunk_link": 35, "primary_link": 30, "secondary_link": 30, "tertiary_link": 25,
+}
+HUB_SNAP_WARN_MI = 5.0  # Report hubs whose nearest routable road is farther than this
+
+def _maxspeed_mph(tag, default):
+    m = re.match(r"\s*(\d+(?:\.\d+)?)\s*(mph)?", tag or "")
+    if not m: return default
+    return float(m.group(1)) if m.group(2) else float(m.group(1)) / 1.609344  # Bare numbers are km/h
+
+def _road_way(tags):
+    """OSM way tags -> (speed mph, oneway) for drivable roads, else None. oneway: 1 fwd, -1 rev, 0 both."""
+    highway = tags.get("highway")
+    if highway not in ROAD_SPEEDS_MPH or tags.get("access") in ("no", "private") or tags.get("area") == "yes":
+        return None
+    oneway = tags.get("oneway", "")
+    if oneway in ("yes", "true", "1"): direction = 1
+    elif oneway == "-1": direction = -1
+    elif oneway == "no": direction = 0
+    else: direction = 1 if highway == "motorway" or tags.get("junction") in ("roundabout", "circular") else 0
+    return _maxspeed_mph(tags.get("maxspeed"), ROAD_SPEEDS_MPH[highway]), direction
+
+def _open_osm(path):
+    if path.endswith(".bz2"): return bz2.open(path, "rb")
+    if path.endswith(".gz"): return gzip.open(path, "rb")
+    return open(path, "rb")
+
+def read_osm_xml(path):
+    """.osm(.bz2|.gz) -> ([(node refs, mph, oneway)], {ref: (lon, lat)}) in two streaming passes."""
+    ways = []
+    with _open_osm(path) as f:
+        for _, elem in ET.iterparse(f):
+            if elem.tag == "way":
+                road = _road_way({t.get("k"): t.get("v") for t in elem.iter("tag")})
+                if road: ways.append(([int(nd.get("ref")) for nd in elem.iter("nd")], *road))
+            if elem.tag in ("node", "way", "relation"): elem.clear()
+    needed = {ref for refs, _, _ in ways for ref in refs}
+    coords = {}
+    with _open_osm(path) as f:
+        for _, elem in ET.iterparse(f):
+            if elem.tag == "node":
+                ref = int(elem.get("id"))
+                if ref in needed: coords[ref] = (float(elem.get("lon")), float(elem.get("lat")))
+            if elem.tag in ("node", "way", "relation"): elem.clear()
+    return ways, coords
+
+def read_osm_pbf(path):
+    """.osm.pbf -> same as read_osm_xml, via pyosmium's node location cache."""
+    if osmium is None:
+        raise RuntimeError("Reading .pbf extracts needs pyosmium (pip install osmium); .osm/.osm.bz2 XML works without it")
+    ways, coords = [], {}
+
+    class Handler(osmium.SimpleHandler):
+        def way(self, w):
+            road = _road_way({t.k: t.v for t in w.tags})
+            if not road: return
+            refs = []
+            for n in w.nodes:
+                if n.location.valid():
+                    coords[n.ref] = (n.location.lon, n.location.lat)
+                    refs.append(n.ref)
+            ways.append((refs, *road))
+
+    Handler().apply_file(path, locations=True)
+    return ways, coords
+
+def read_osm(path):
+    return read_osm_pbf(path) if path.endswith(".pbf") else read_osm_xml(path)
+
+class RoadGraph:
+    """Drivable road network contracted to intersections, as CSR arrays weighted by hours.
+
+    Vertices are way endpoints and nodes shared by several ways; every edge keeps its
+    intermediate OSM nodes as geometry (a slice of the pts arrays, reversed for the
+    opposite direction), so Dijkstra walks a small graph while routes follow the road.
+    """
+
+    def __init__(self, lon, lat, indptr, tail, head, miles, hours, geo_start, geo_stop, geo_rev, pts):
+        self.lon, self.lat = lon, lat
+        self.indptr, self.tail, self.head = indptr, tail, head
+        self.miles, self.hours = miles, hours
+        self.geo_start, self.geo_stop, self.geo_rev = geo_start, geo_stop, geo_rev
+        self.pts = pts
+        self._adjacency = None
+
+    @classmethod
+    def from_ways(cls, ways, coords):
+        ways = [([r for r in refs if r in coords], mph, oneway) for refs, mph, oneway in ways]
+        ways = [w for w in ways if len(w[0]) >= 2]
+        usage = Counter(ref for refs, _, _ in ways for ref in refs)
+        vertex = {}
+        def vid(ref):
+            if ref not in vertex: vertex[ref] = len(vertex)
+            return vertex[ref]
+
+        pts, edges = [], []  # edge: (tail, head, miles, hours, geo_start, geo_stop, reversed)
+        for refs, mph, oneway in ways:
+            xy = np.array([coords[r] for r in refs], dtype=np.float64)
+            cum = np.r_[0.0, np.cumsum(haversine_miles(xy[:-1, 1], xy[:-1, 0], xy[1:, 1], xy[1:, 0]))]
+            cuts = [0] + [k for k in range(1, len(refs) - 1) if usage[refs[k]] > 1] + [len(refs) - 1]
+            base = len(pts)
+            pts.extend(xy.tolist())
+            for s, e in zip(cuts[:-1], cuts[1:]):
+                u, v = vid(refs[s]), vid(refs[e])
+                miles = cum[e] - cum[s]
+                if oneway >= 0: edges.append((u, v, miles, miles / mph, base + s, base + e + 1, False))
+                if oneway <= 0: edges.append((v, u, miles, miles / mph, base + s, base + e + 1, True))
+
+        order_xy = np.array([coords[ref] for ref in vertex], dtype=np.float64).reshape(-1, 2)
+        e = np.array(edges, dtype=np.float64).reshape(-1, 7)
+        order = np.argsort(e[:, 0], kind="stable")
+        e = e[order]
+        tail = e[:, 0].astype(np.int64)
+        indptr = np.searchsorted(tail, np.arange(len(vertex) + 1)).astype(np.int64)
+        return cls(
+            order_xy[:, 0], order_xy[:, 1], indptr, tail, e[:, 1].astype(np.int64),
+            e[:, 2], e[:, 3], e[:, 4].astype(np.int64), e[:, 5].astype(np.int64), e[:, 6].astype(bool),
+            np.array(pts, dtype=np.float64).reshape(-1, 2),
+        )
+
+    def __len__(self):
+        return len(self.lon)
+
+    def main_component(self):
+        """Mask of vertices in the largest (undirected) connected piece of the network."""
+        parent = list(range(len(self)))
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+        for u, v in zip(self.tail.tolist(), self.head.tolist()):
+            ru, rv = find(u), find(v)
+            if ru != rv: parent[ru] = rv
+        roots = np.array([find(x) for x in range(len(self))])
+        return roots == np.bincount(roots).argmax()
+
+    def snap(self, lon, lat, mask=None):
+        """Nearest vertex to a point (optionally within mask) -> (vertex, miles away)."""
+        dist = haversine_miles(lat, lon, self.lat, self.lon)
+        if mask is not None: dist = np.where(mask, dist, np.inf)
+        v = int(np.argmin(dist))
+        return v, float(dist[v])
+
+    def _lists(self):
+        # Python lists index ~10x faster than NumPy scalars inside the heap loop
+        if self._adjacency is None:
+            self._adjacency = (self.indptr.tolist(), self.tail.tolist(), self.head.tolist(), self.hours.tolist())
+        return self._adjacency
+
+    def path_geometry(self, edge_ids):
+        parts = []
+        for k in edge_ids:
+            seg = self.pts[self.geo_start[k]:self.geo_stop[k]]
+            if self.geo_rev[k]: seg = seg[::-1]
+            parts.append(seg if not parts else seg[1:])
+        return np.concatenate(parts) if parts else np.empty((0, 2))
+
+    def shortest_paths(self, source, targets):
+        """Fastest routes from source: {target: (miles, hours, geometry (n, 2))}; stops once all are settled."""
+        indptr, tail, head, hours = self._lists()
+        best, pred, settled = {source: 0.0}, {}, set()
+        remaining = set(targets) - {source}
+        heap = [(0.0, source)]
+        while heap and remaining:
+            d, u = heapq.heappop(heap)
+            if u in settled: continue
+            settled.add(u)
+            remaining.discard(u)
+            for k in range(indptr[u], indptr[u + 1]):
+                v, nd = head[k], d + hours[k]
+                if nd < best.get(v, math.inf):
+                    best[v], pred[v] = nd, k
+                    heapq.heappush(heap, (nd, v))
+        found = {}
+        for target in targets:
+            if target == source or target not in settled: continue
+            edge_ids, v = [], target
+            while v != source:
+                edge_ids.append(pred[v])
+                v = tail[pred[v]]
+            edge_ids.reverse()
+            found[target] = (float(self.miles[edge_ids].sum()), best[target], self.path_geometry(edge_ids))
+        return found
+
+_WORKER_GRAPH = None
+
+def _init_route_worker(graph):
+    global _WORKER_GRAPH
+    _WORKER_GRAPH = graph
+
+def _route_job(job):
+    source, targets = job
+    return source, _WORKER_GRAPH.shortest_paths(source, targets)
+
+def build_routes(graph, hubs, jobs=None, log=print):
+    """All hub pairs -> routes.json dict ({"A|B": {"miles", "hours", "geometry"}}, A before B in hubs).
+
+    One early-exit Dijkstra per distinct hub vertex (to every other hub, since one-way
+    roads make A -> B and B -> A differ), spread over processes; hubs that snap to the
+    same road vertex (e.g. "Delta" / "Delta, UT") share the work. Where the way back
+    differs it is written as "B|A" too (route_keys tries the exact direction first).
+    """
+    mask = graph.main_component()
+    snapped = {}
+    for name, c in hubs.items():
+        snapped[name], off = graph.snap(c["lon"], c["lat"], mask)
+        if off > HUB_SNAP_WARN_MI: log(f"warning: {name} is {off:.1f} mi from the nearest routable road")
+    vertices = sorted(set(snapped.values()))
+    work = [(v, [w for w in vertices if w != v]) for v in vertices]
+    paths = {}
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_route_worker, initargs=(graph,)) as pool:
+        for source, found in pool.map(_route_job, work):
+            for target, route in found.items(): paths[(source, target)] = route
+
+    def entry(u, v):
+        # The u -> v path, else the v -> u one driven backwards
+        route = paths.get((u, v))
+        if route is None and (v, u) in paths:
+            miles, hours, geometry = paths[(v, u)]
+            route = (miles, hours, geometry[::-1])
+        if route is None: return None
+        miles, hours, geometry = route
+        return {
+            "miles": round(miles, 1), "hours": round(hours, 2),
+            "geometry": np.round(geometry, GEOMETRY_DECIMALS).tolist(),
+        }
+
+    routes, names = {}, list(hubs)
+    for i, a in enumerate(names):
+        for b in names[i + 1:]:
+            u, v = snapped[a], snapped[b]
+            if u == v: continue
+            there, back = entry(u, v), entry(v, u)
+            if there is None:
+                log(f"warning: no road route {a} -> {b}; the planner will use a straight-line estimate")
+                continue
+            routes[f"{a}|{b}"] = there
+            if (back["miles"], back["hours"]) != (there["miles"], there["hours"]):
+                routes[f"{b}|{a}"] = back
+    return routes
+
+def _planner_hubs():
+    from planner_v3 import NODE_COORDS  # Imported lazily: pulls in Streamlit
+    return NODE_COORDS
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Route database tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    conv = sub.add_parser("convert", help="routes.json(.gz) -> routes.bin")
+    conv.add_argument("source", nargs="?", help="default: routes.json.gz, else routes.json")
+    conv.add_argument("dest", nargs="?", default="routes.bin")
+    build = sub.add_parser("build", help="OSM extract -> routes.json(.gz) + routes.bin for every hub pair")
+    build.add_argument("extract", help=".osm, .osm.bz2, .osm.gz, or .osm.pbf (needs pyosmium)")
+    build.add_argument("--hubs", help='JSON file {"name": {"lat": .., "lon": ..}} (default: planner NODE_COORDS)')
+    build.add_argument("--out", default="routes.json.gz")
+    build.add_argument("--bin", default="routes.bin", help="binary DB to write as well ('' to skip)")
+    build.add_argument("--jobs", type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        if args.hubs:
+            with open(args.hubs, encoding="utf-8") as f:
+                hubs = json.load(f)
+        else:
+            hubs = _planner_hubs()
+        log = lambda msg: print(msg, file=sys.stderr)
+        ways, coords = read_osm(args.extract)
+        graph = RoadGraph.from_ways(ways, coords)
+        log(f"{args.extract}: {len(ways):,} road ways -> {len(graph):,} vertices, {len(graph.head):,} edges")
+        routes = build_routes(graph, hubs, args.jobs, log)
+        write_routes_json(routes, args.out)
+        print(f"{len(routes)} routes for {len(hubs)} hubs -> {args.out}")
+        if args.bin:
+            n_routes, _ = write_route_db(routes, args.bin)
+            print(f"{args.out} -> {args.bin}: {n_routes} routes, {os.path.getsize(args.bin):,} bytes")
+        return 0
+
+    source = args.source or next((p for p in ("routes.json.gz", "routes.json") if os.path.exists(p)), None)
+    if not source:
+        print("No routes.json(.gz) found", file=sys.stderr)
+        return 1
+    n_routes, per_tier = write_route_db(read_routes_json(source), args.dest)
+    tiers = ", ".join(f"{n:,}" for n in per_tier)
+    print(f"{source} -> {args.dest}: {n_routes} routes, vertices per tier {tiers}, {os.path.getsize(args.dest):,} bytes")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
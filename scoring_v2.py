@@ -0,0 +1,524 @@
+# -*- coding: utf-8 -*-
+import datetime as dt
+
+import numpy as np
+
+from gauges_v2 import GaugeSeries, display_value
+
+# ============================================================
+# 1. ALIGNED SERIES MATRIX (RIVER x TIME)
+# ============================================================
+
+def parse_target_range(t_str, default=(np.nan, np.nan)):
+    """'1500-7500 cfs' / '4.0-6.0 ft' -> (lo, hi); default if unparseable."""
+    try:
+        parts = str(t_str).lower().replace("cfs", "").replace("ft", "").strip().split("-")
+        return float(parts[0]), float(parts[1])
+    except Exception:
+        return default
+
+def _epoch_s(ts):
+    # Naive timestamps (dashboard, gauge-local) are read as UTC: only differences matter here
+    if ts.tzinfo is None: ts = ts.replace(tzinfo=dt.timezone.utc)
+    return ts.timestamp()
+
+def _first_true(mask):
+    """(index of first True per row, row has any True)."""
+    return mask.argmax(axis=1), mask.any(axis=1)
+
+def _last_true(mask):
+    n = mask.shape[1]
+    return n - 1 - mask[:, ::-1].argmax(axis=1), mask.any(axis=1)
+
+class SeriesMatrix:
+    """Every river's series (GaugeSeries, or legacy [(datetime, value)]) in one right-aligned
+    (river x time) array.
+
+    Row r holds its points sorted by time in the last lengths[r] columns, so column -1 is
+    each river's latest observation. Padding cells are excluded through `valid`.
+    """
+
+    def __init__(self, series_list):
+        series_list = [s or [] for s in series_list]
+        self.lengths = np.array([len(s) for s in series_list], dtype=np.int64)
+        rows, width = len(series_list), max(int(self.lengths.max(initial=0)), 1)
+        self.t = np.zeros((rows, width))
+        self.v = np.full((rows, width), np.nan)
+        for r, s in enumerate(series_list):
+            if not s: continue
+            if isinstance(s, GaugeSeries):
+                # Already sorted arrays: a straight copy into the row
+                self.t[r, width - len(s):] = s.t
+                self.v[r, width - len(s):] = s.v
+                continue
+            ts = np.fromiter((_epoch_s(p[0]) for p in s), float, len(s))
+            vs = np.fromiter((p[1] for p in s), float, len(s))
+            order = np.argsort(ts, kind="stable")
+            self.t[r, width - len(s):] = ts[order]
+            self.v[r, width - len(s):] = vs[order]
+        self.valid = np.arange(width)[None, :] >= (width - self.lengths)[:, None]
+        self.rows = np.arange(rows)
+
+    @property
+    def has_data(self):
+        return self.lengths > 0
+
+    def last_value(self):
+        return np.where(self.has_data, self.v[:, -1], np.nan)
+
+    def last_time(self):
+        return self.t[:, -1]
+
+    def first_index(self):
+        # Empty rows point at the (invalid) last column so fancy indexing stays in bounds
+        width = self.t.shape[1]
+        return np.minimum(width - self.lengths, width - 1)
+
+    def window_start(self, hours):
+        """coastal_compute_trend's start point: first point inside the last `hours`,
+        or the first point overall when the window holds fewer than two."""
+        mask = self.valid & (self.t >= (self.last_time() - hours * 3600.0)[:, None])
+        idx, _ = _first_true(mask)
+        return np.where(mask.sum(axis=1) >= 2, idx, self.first_index())
+
+    def lookback_start(self, hours):
+        """get_trend's start point: last point at least `hours` before the latest, else the first."""
+        mask = self.valid & (self.t <= (self.last_time() - hours * 3600.0)[:, None])
+        idx, found = _last_true(mask)
+        return np.where(found, idx, self.first_index())
+
+    def pct_change(self, start_idx, positive_start=True):
+        """(latest - start) / start; NaN with < 2 points or a start value <= 0 (== 0 if not positive_start)."""
+        start = self.v[self.rows, start_idx]
+        ok = (self.lengths >= 2) & ((start > 0) if positive_start else (start != 0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(ok, (self.v[:, -1] - start) / start, np.nan)
+
+    def hours_since_peak(self):
+        peak = np.where(self.valid, self.v, -np.inf).argmax(axis=1)
+        hours = (self.last_time() - self.t[self.rows, peak]) / 3600.0
+        return np.where(self.has_data, hours, np.nan)
+
+    def recession_rate(self, hours=24):
+        """Units per hour over the last `hours` (last two points if the window is sparser)."""
+        last = self.t.shape[1] - 1
+        mask = self.valid & (self.t >= (self.last_time() - hours * 3600.0)[:, None])
+        idx, _ = _first_true(mask)
+        start = np.where(mask.sum(axis=1) >= 2, idx, last - 1)
+        span = (self.t[:, -1] - self.t[self.rows, start]) / 3600.0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rate = (self.v[:, -1] - self.v[self.rows, start]) / span
+        return np.where((self.lengths >= 2) & (span > 0), rate, 0.0)
+
+# ============================================================
+# 2. COASTAL DASHBOARD ENGINE
+# ============================================================
+
+TREND_UP, TREND_FLAT, TREND_DOWN = 1, 0, -1
+TREND_TEXT = {TREND_UP: ("↑", "↑ rising"), TREND_FLAT: ("↔", "↔ stable"), TREND_DOWN: ("↓", "↓ dropping")}
+
+# Index = condition code returned by CoastalScoringEngine.conditions()
+CONDITIONS = [
+    ("no data", "#E0E0E0"), ("unknown", "#FFFFFF"), ("too low", "#E0E0E0"), ("low", "#FFEB3B"),
+    ("slightly high", "#FFCC80"), ("blown out", "#FFCDD2"), ("in shape", "#C8E6C9"),
+]
+(COND_NO_DATA, COND_UNKNOWN, COND_TOO_LOW, COND_LOW,
+ COND_SLIGHTLY_HIGH, COND_BLOWN_OUT, COND_IN_SHAPE) = range(len(CONDITIONS))
+
+FORECAST_LEADS = (48, 96)
+
+def _forecast_matrix(forecasts):
+    """NWPS point lists -> (time, value) arrays sorted like predict_future_state; +inf/NaN padded."""
+    width = max([len(f or []) for f in forecasts] + [1])
+    t = np.full((len(forecasts), width), np.inf)
+    v = np.full((len(forecasts), width), np.nan)
+    for r, pts in enumerate(forecasts):
+        for c, pt in enumerate(sorted(pts or [], key=lambda x: x.get("validTime", ""))):
+            try:
+                t[r, c] = dt.datetime.fromisoformat(pt["validTime"].replace("Z", "+00:00")).timestamp()
+                v[r, c] = np.nan if pt.get("primary") is None else float(pt["primary"])
+            except Exception:
+                continue
+    return t, v
+
+class CoastalScoringEngine:
+    """Batched version of the dashboard's per-river hydrology rules.
+
+    Mirrors coastal_compute_trend, coastal_time_since_peak, coastal_recession_rate,
+    coastal_get_condition, coastal_score and predict_future_state rule for rule, but for
+    every river at once. Threshold-independent features are computed once in __init__,
+    so re-scoring with different target ranges only runs the rule selection.
+    """
+
+    def __init__(self, specs, series_list, forecasts=None, now=None):
+        self.specs = specs
+        self.matrix = m = SeriesMatrix(series_list)
+        ranges = np.array([parse_target_range(s.get("T", "")) for s in specs], dtype=float).reshape(-1, 2)
+        self.lo, self.hi = ranges[:, 0], ranges[:, 1]
+        self.abs_low = np.array([s.get("Low") or np.nan for s in specs], dtype=float)
+        self.familiar = np.array([bool(s.get("Familiar")) for s in specs])
+
+        self.last_val = m.last_value()
+        self.pct = m.pct_change(m.window_start(12)) * 100.0
+        self.trend = np.select([self.pct > 5, self.pct < -5], [TREND_UP, TREND_DOWN], TREND_FLAT)
+        self.hours_since_peak = m.hours_since_peak()
+        self.recession = m.recession_rate(24)
+
+        # Forecast value at each lead (NaN when NWPS has no point that far out)
+        now_s = (now or dt.datetime.now(dt.timezone.utc)).timestamp()
+        ft, fv = _forecast_matrix(forecasts if forecasts is not None else [[] for _ in specs])
+        self.future_val = {}
+        for lead in FORECAST_LEADS:
+            idx, found = _first_true(ft >= now_s + lead * 3600.0)
+            self.future_val[lead] = np.where(found, fv[m.rows, idx], np.nan)
+
+    def trend_text(self):
+        return [TREND_TEXT[int(c)] for c in self.trend]
+
+    def conditions(self, lo=None, hi=None):
+        """Condition codes (index into CONDITIONS) for the latest values."""
+        lo = self.lo if lo is None else lo
+        hi = self.hi if hi is None else hi
+        val, hours = self.last_val, self.hours_since_peak
+        missing = np.isnan(val)
+        with np.errstate(invalid="ignore"):
+            modeled = np.select(
+                [self.trend == TREND_UP, (self.trend == TREND_DOWN) & np.isnan(hours),
+                 (self.trend == TREND_DOWN) & (hours < 12), (self.trend == TREND_DOWN) & (hours < 36),
+                 self.trend == TREND_DOWN],
+                [COND_BLOWN_OUT, COND_NO_DATA, COND_SLIGHTLY_HIGH, COND_IN_SHAPE, COND_LOW],
+                COND_NO_DATA
+            )
+            measured = np.select(
+                [np.isnan(lo) | np.isnan(hi), val < self.abs_low, val < lo, val > hi * 1.2, val > hi],
+                [COND_UNKNOWN, COND_TOO_LOW, COND_LOW, COND_BLOWN_OUT, COND_SLIGHTLY_HIGH],
+                COND_IN_SHAPE
+            )
+        return np.where(missing, modeled, measured)
+
+    def _score(self, val, trend, hours, lo, hi):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            in_range = (lo <= val) & (val <= hi)
+            flow = np.where(in_range, 1.0 + np.maximum(0.0, 1.0 - np.abs(val - (lo + hi) / 2) / (hi - lo)), 0.5)
+            trend_score = np.select([trend == TREND_UP, (trend == TREND_DOWN) & in_range], [0.0, 1.5], 0.5)
+            tsp = np.select([hours > 48, hours > 24], [1.0, 0.3], 0.0)
+        score = np.clip(flow + trend_score + tsp + np.where(self.familiar, 0.5, 0.0), 0.0, 5.0)
+        score = np.where(np.isnan(lo) | np.isnan(hi), 1.0, score)
+        return np.where(np.isnan(val), 0.5, score)
+
+    def scores(self, lo=None, hi=None):
+        """{"now"|"48h"|"96h": score array}. Pass lo/hi arrays to re-score against what-if ranges."""
+        lo = self.lo if lo is None else lo
+        hi = self.hi if hi is None else hi
+        out = {"now": self._score(self.last_val, self.trend, self.hours_since_peak, lo, hi)}
+        # predict_future_state's "rising"/"dropping" words carry no arrow, so coastal_score
+        # has always treated forecast horizons as stable with no time-since-peak credit
+        flat, no_peak = np.full(len(lo), TREND_FLAT), np.full(len(lo), np.nan)
+        for lead in FORECAST_LEADS:
+            out[f"{lead}h"] = self._score(self.future_val[lead], flat, no_peak, lo, hi)
+        return out
+
+# ============================================================
+# 3. PLANNER ENGINE
+# ============================================================
+
+PLANNER_TREND_TEXT = {TREND_UP: "rising", TREND_FLAT: "stable", TREND_DOWN: "dropping"}
+PLANNER_ARROWS = {TREND_UP: "↑", TREND_FLAT: "↔", TREND_DOWN: "↓"}
+
+# Index = label code returned by PlannerScoringEngine.scores(); "{val}"/"{arrow}" filled per river
+PLANNER_LABELS = [
+    "🧪 Rising (Est)", "🧪 Rain (Est)", "🧪 Low/Stable (Est)", "🧪 Unknown",
+    "📡 Too Low ({val})", "📡 {arrow} Near Ideal ({val})", "📡 ↑ Rising ({val})", "📡 Low ({val})",
+    "📡 ↓ Perfect Drop ({val})", "📡 In Shape ({val})", "📡 ↓ Dropping In ({val})",
+    "📡 ↑ Rising High ({val})", "📡 Slightly High ({val})", "📡 Blown Out ({val})", "📡 {val}",
+]
+PLANNER_LABEL_SCORES = np.array([1.0, 2.5, 2.0, 2.5, 0.0, 3.75, 3.0, 2.0, 5.0, 4.5, 4.5, 2.0, 3.5, 1.0, 2.5])
+
+def planner_codes(val, trend, lo, hi, abs_low, estimate):
+    """auto_score's rule selection for value/trend arrays -> label codes (NaN val = no data)."""
+    up, down = trend == TREND_UP, trend == TREND_DOWN
+    with np.errstate(invalid="ignore"):
+        return np.select(
+            [np.isnan(val), val < abs_low,
+             (val < lo) & (val >= 0.8 * lo), (val < lo) & up, val < lo,
+             (val <= hi) & down, val <= hi,
+             (val <= hi * 1.4) & down,
+             (val <= hi * 1.2) & up, val <= hi * 1.2,
+             val > hi * 1.2],
+            [estimate, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13],
+            14
+        )
+
+def weather_estimate_code(weather_periods):
+    """auto_score's no-gauge fallback, read from the first NWS period."""
+    if not weather_periods: return 3
+    # Read for every river in a batch (not only gauge-less ones), so tolerate odd payloads
+    try:
+        first = weather_periods[0]["detailedForecast"].lower()
+    except (KeyError, IndexError, TypeError, AttributeError):
+        return 3
+    if "rain" in first and ("heavy" in first or "100%" in first): return 0
+    if "rain" in first: return 1
+    return 2
+
+class PlannerScoringEngine:
+    """Batched get_trend + auto_score for every planner river (same rules, same labels)."""
+
+    def __init__(self, specs, series_list, weather_list):
+        self.specs = specs
+        self.matrix = m = SeriesMatrix(series_list)
+        ranges = np.array([parse_target_range(s["T"], (0, 99999)) for s in specs], dtype=float).reshape(-1, 2)
+        self.lo, self.hi = ranges[:, 0], ranges[:, 1]
+        self.abs_low = np.array([s.get("Low", 0) for s in specs], dtype=float)
+        self.last_val = m.last_value()
+        pct = m.pct_change(m.lookback_start(6), positive_start=False)
+        self.trend = np.select([pct < -0.01, pct > 0.01], [TREND_DOWN, TREND_UP], TREND_FLAT)
+        self.estimate = np.array([weather_estimate_code(w) for w in weather_list], dtype=np.int64)
+
+    def scores(self, lo=None, hi=None):
+        """(score array, label code array); label codes index PLANNER_LABELS."""
+        lo = self.lo if lo is None else lo
+        hi = self.hi if hi is None else hi
+        codes = planner_codes(self.last_val, self.trend, lo, hi, self.abs_low, self.estimate)
+        return PLANNER_LABEL_SCORES[codes], codes
+
+    def label(self, i, code):
+        val = display_value(self.last_val[i])
+        return PLANNER_LABELS[code].format(val=val, arrow=PLANNER_ARROWS[int(self.trend[i])])
+
+    def score_map(self):
+        """{river name: (score, label)}, the batched equivalent of auto_score per river."""
+        scores, codes = self.scores()
+        return {s["Name"]: (float(scores[i]), self.label(i, int(codes[i]))) for i, s in enumerate(self.specs)}
+
+# ============================================================
+# 4. PLANNER DAY-BY-DAY OUTLOOK
+# ============================================================
+
+OUTLOOK_DAYS = 45             # Days scored from today; later trip days reuse the last one
+OUTLOOK_UTC_HOUR = 20         # Each day is scored at local midday on the coast (~noon Pacific)
+UTC_OFFSET_HOURS = -8         # Which calendar day "today" is for the outlook
+BASEFLOW_FRACTION = 0.5       # Recession heads toward half the target's low end
+RECESSION_PER_DAY = 0.3       # Share of the excess over baseflow lost per day without a gauge trend
+RECESSION_BOUNDS = (0.1, 0.6) # Clamp for recession rates read off the gauge
+RAIN_RISE = 0.5               # Rise per rain day, as a share of the target's high end at 100% PoP
+HEAVY_RAIN_FACTOR = 2.0       # "heavy" in the forecast text doubles the rise
+CLIMATE_RAIN_CHANCE = 0.25    # Daily rain chance once the NWS forecast runs out
+OUTLOOK_CONFIDENCE_DAYS = 5.0 # e-folding lead time of trust in the modeled state
+CLIMATOLOGY_SCORE = 2.5       # What an unknown day is worth (auto_score's "Unknown")
+CLIMATE_MIN_DAYS = 20         # Historical daily means needed before a river gets its own norm
+SCENARIOS = 2000              # Monte Carlo futures per refresh
+SCENARIO_CHUNK = 250          # Futures simulated at once (bounds the (S, R, D) float64 temporaries)
+FORECAST_ERROR_PER_DAY = 0.15 # Log error of known values, growing with sqrt(lead days)
+RECESSION_ERROR = 0.35        # Log spread of a river's recession rate
+RAIN_RISE_ERROR = 0.5         # Log spread of one storm's rise
+FISHABLE_SCORE = 3.5          # A scheduled day counts as fished from this score (Slightly High)
+
+def _day_epoch(date):
+    return dt.datetime(date.year, date.month, date.day, OUTLOOK_UTC_HOUR, tzinfo=dt.timezone.utc).timestamp()
+
+def _nwps_points(pts, stage):
+    """NWPS hydrograph points -> sorted (t, value) arrays in the spec's unit.
+
+    primary is stage (ft); secondary is flow in kcfs when NWPS publishes it. Flow specs
+    fall back to primary, like the dashboard, and the anchor check below catches a mismatch.
+    """
+    t, v = [], []
+    for pt in pts or []:
+        try:
+            ts = dt.datetime.fromisoformat(pt["validTime"].replace("Z", "+00:00")).timestamp()
+            val = pt.get("primary") if stage or pt.get("secondary") is None else pt["secondary"] * 1000.0
+            if val is None or val < 0: continue  # NWPS marks missing values with -999
+            t.append(ts)
+            v.append(float(val))
+        except Exception:
+            continue
+    order = np.argsort(t, kind="stable")
+    return np.asarray(t, dtype=float)[order], np.asarray(v, dtype=float)[order]
+
+def _rain_days(periods, days):
+    """NWS forecast periods -> (per-day PoP 0..1, per-day heavy flag, per-day periods).
+
+    Days past the last forecast period get CLIMATE_RAIN_CHANCE.
+    """
+    pop, heavy = np.zeros(len(days)), np.zeros(len(days), dtype=bool)
+    per_day = [[] for _ in days]
+    for p in periods or []:
+        try:
+            start = dt.datetime.fromisoformat(p["startTime"]).astimezone(dt.timezone.utc)
+            day = (start + dt.timedelta(hours=UTC_OFFSET_HOURS)).date()
+            d = (day - days[0]).days
+            if not 0 <= d < len(days): continue
+            per_day[d].append(p)
+            pop[d] = max(pop[d], ((p.get("probabilityOfPrecipitation") or {}).get("value") or 0) / 100.0)
+            heavy[d] |= "heavy" in p.get("detailedForecast", "").lower()
+        except Exception:
+            continue
+    covered = np.flatnonzero([bool(p) for p in per_day])
+    pop[covered[-1] + 1 if len(covered) else 0:] = CLIMATE_RAIN_CHANCE
+    return pop, heavy, per_day
+
+def climatology_scores(specs, daily_list, default=CLIMATOLOGY_SCORE):
+    """Seasonal norm per river (R,): mean planner score of its historical daily means.
+
+    daily_list holds one daily GaugeSeries (or None) per spec, e.g. history_v2.seasonal_daily
+    around today. Trend is day-over-day on consecutive days, flat across gaps; rivers with
+    fewer than CLIMATE_MIN_DAYS days keep the default.
+    """
+    out = np.full(len(specs), default, dtype=float)
+    for r, (spec, series) in enumerate(zip(specs, daily_list)):
+        if series is None or len(series) < CLIMATE_MIN_DAYS: continue
+        t, v = np.asarray(series.t), np.asarray(series.v, dtype=float)
+        lo, hi = parse_target_range(spec["T"], (0, 99999))
+        trend = np.full(len(v), TREND_FLAT, dtype=np.int64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ratio = np.where(np.diff(t) == 86400, v[1:] / v[:-1], 1.0)
+        trend[1:] = np.select([ratio > 1.05, ratio < 0.95], [TREND_UP, TREND_DOWN], TREND_FLAT)
+        codes = planner_codes(v, trend, lo, hi, spec.get("Low", 0), 3)
+        out[r] = PLANNER_LABEL_SCORES[codes].mean()
+    return out
+
+class PlannerOutlookEngine:
+    """Expected planner score for every river on each of the next OUTLOOK_DAYS days.
+
+    Per river and day, the value comes from the NWPS hydrograph while it lasts. Beyond it,
+    exponential recession toward baseflow runs from the last known value, at the gauge's
+    observed rate when it is dropping (coastal_recession_rate-style), plus a rise on
+    forecast rain days. auto_score's rules then score the value with a day-over-day trend.
+    Confidence decays with lead time, blending the score toward each river's seasonal
+    norm (climatology, see climatology_scores) or CLIMATOLOGY_SCORE without one.
+    Gauge-less rivers use auto_score's weather estimate from that day's forecast text.
+    simulate() reruns the same model over randomly perturbed scenarios.
+    """
+
+    def __init__(self, specs, series_list, forecasts, weather_list, now=None, days=OUTLOOK_DAYS,
+                 climatology=None):
+        now = now or dt.datetime.now(dt.timezone.utc)
+        self.origin = (now + dt.timedelta(hours=UTC_OFFSET_HOURS)).date()
+        self.dates = [self.origin + dt.timedelta(days=d) for d in range(days)]
+        self.day_t = np.array([_day_epoch(d) for d in self.dates])
+        self.names = [s["Name"] for s in specs]
+
+        self.base = base = PlannerScoringEngine(specs, series_list, weather_list)
+        m, R = base.matrix, len(specs)
+        stage = np.array(["ft" in s.get("T", "") for s in specs])
+        self.baseflow = BASEFLOW_FRACTION * np.where(base.lo > 0, base.lo, 0.0)
+        self.rise = np.where(base.hi < 99999, RAIN_RISE * base.hi, 0.0)
+
+        # Recession constant (per day) from the last 24h when the gauge is dropping
+        with np.errstate(divide="ignore", invalid="ignore"):
+            k_obs = -m.recession_rate(24) * 24.0 / (base.last_val - self.baseflow)
+        k = np.where((base.trend == TREND_DOWN) & np.isfinite(k_obs) & (k_obs > 0),
+                     np.clip(k_obs, *RECESSION_BOUNDS), RECESSION_PER_DAY)
+        self.decay = -np.log1p(-k)  # Continuous rate so partial days decay consistently
+
+        # Known values (hydrograph, or the gauge held until the anchor) up to each river's
+        # anchor; the model takes over after it
+        self.fixed = np.zeros((R, days), dtype=bool)
+        self.fixed_val = np.full((R, days), np.nan)
+        self.anchor_t, self.anchor_v = np.full(R, np.inf), np.full(R, np.nan)
+        self.pop, self.heavy = np.zeros((R, days)), np.zeros((R, days), dtype=bool)
+        self.estimate = np.zeros((R, days), dtype=np.int64)
+        for r in range(R):
+            self.pop[r], self.heavy[r], per_day = _rain_days(weather_list[r], self.dates)
+            self.estimate[r] = [weather_estimate_code(p) if p else base.estimate[r] for p in per_day]
+            ft, fv = _nwps_points(forecasts[r] if forecasts is not None else None, stage[r])
+            obs_t, obs_v = m.last_time()[r], base.last_val[r]
+            if len(ft) and np.isfinite(obs_v) and obs_v > 0:
+                # Hydrograph far from the gauge (unit mix-up, wrong site): trust the gauge
+                anchor = np.interp(min(max(obs_t, ft[0]), ft[-1]), ft, fv)
+                if not 1 / 3 <= anchor / obs_v <= 3: ft, fv = ft[:0], fv[:0]
+
+            if len(ft):
+                self.anchor_t[r], self.anchor_v[r] = ft[-1], fv[-1]
+            elif np.isfinite(obs_v):
+                self.anchor_t[r], self.anchor_v[r] = obs_t, obs_v
+            else:
+                continue  # No gauge, no hydrograph: weather estimate only
+            self.fixed[r] = self.day_t <= self.anchor_t[r]
+            held = obs_v if np.isfinite(obs_v) else fv[0]
+            covered = (ft[0] <= self.day_t) if len(ft) else np.zeros(days, dtype=bool)
+            self.fixed_val[r] = np.where(covered, np.interp(self.day_t, ft, fv) if len(ft) else held, held)
+        self.modeled = ~self.fixed & np.isfinite(self.anchor_v)[:, None]
+
+        rain = self.pop * np.where(self.heavy, HEAVY_RAIN_FACTOR, 1.0)
+        self.values = self._run(rain[None])[0]
+        self.codes = self._codes(self.values[None], self.estimate[None])[0]
+        lead = np.maximum(self.day_t - now.timestamp(), 0.0) / 86400.0
+        trust = np.exp(-lead / OUTLOOK_CONFIDENCE_DAYS)
+        norm = np.full(R, CLIMATOLOGY_SCORE) if climatology is None else np.asarray(climatology, dtype=float)
+        self.scores = trust * PLANNER_LABEL_SCORES[self.codes] + (1.0 - trust) * norm[:, None]
+        self.lead = lead
+
+    def _run(self, rain, error=None, decay_mult=None):
+        """Values (S, R, D) for S scenarios: rain (S, R, D) in storm units, error (S, R, D)
+        multiplies known values, decay_mult (S, R) scales recession rates."""
+        S, R, D = rain.shape
+        decay = self.decay if decay_mult is None else self.decay * decay_mult
+        values = np.full((S, R, D), np.nan, dtype=np.float64)
+        prev_v = np.broadcast_to(self.anchor_v, (S, R)).copy()
+        prev_t = np.broadcast_to(self.anchor_t, (S, R)).copy()
+        fresh = np.ones(R, dtype=bool)  # Still recessing straight from the anchor
+        for d, t in enumerate(self.day_t):
+            err = 1.0 if error is None else error[:, :, d]
+            fixed, modeled = self.fixed[:, d], self.modeled[:, d]
+            start = np.where(fresh, prev_v * err, prev_v)
+            with np.errstate(invalid="ignore", over="ignore"):
+                recess = self.baseflow + np.maximum(start - self.baseflow, 0.0) * np.exp(-decay * (t - prev_t) / 86400.0)
+            v = np.where(fixed, self.fixed_val[:, d] * err, recess + self.rise * rain[:, :, d])
+            values[:, :, d] = np.where(fixed | modeled, v, np.nan)
+            prev_v = np.where(modeled, v, prev_v)
+            prev_t = np.where(modeled, t, prev_t)
+            fresh &= ~modeled
+        return values
+
+    def _codes(self, values, estimate):
+        # Day-over-day trend (predict_future_state's +/-5%); day 0 keeps the gauge trend
+        trend = np.full(values.shape, TREND_FLAT, dtype=np.int64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ratio = values[..., 1:] / values[..., :-1]
+        trend[..., 1:] = np.select([ratio > 1.05, ratio < 0.95], [TREND_UP, TREND_DOWN], TREND_FLAT)
+        trend[..., 0] = self.base.trend
+        b = self.base
+        return planner_codes(values, trend, b.lo[:, None], b.hi[:, None], b.abs_low[:, None], estimate)
+
+    def simulate(self, n=SCENARIOS, seed=0):
+        """Planner scores (n, R, D) for n sampled futures, float32.
+
+        Known values (hydrograph, gauge) get a lognormal error that random-walks with lead
+        time; each scenario scales every river's recession rate; a rain day happens when a
+        coast-wide draw falls under that river's PoP, with a lognormal storm size.
+        Runs SCENARIO_CHUNK futures at a time so memory stays flat in n.
+        """
+        rng = np.random.default_rng(seed)
+        R, D = self.fixed.shape
+        steps = np.sqrt(np.diff(np.concatenate([[0.0], self.lead])))
+        storm_factor = np.where(self.heavy, HEAVY_RAIN_FACTOR, 1.0)
+        label_scores = PLANNER_LABEL_SCORES.astype(np.float32)
+        out = np.empty((n, R, D), dtype=np.float32)
+        for lo in range(0, n, SCENARIO_CHUNK):
+            c = min(SCENARIO_CHUNK, n - lo)
+            walk = np.cumsum(rng.standard_normal((c, R, D)) * steps, axis=2)
+            error = np.exp(FORECAST_ERROR_PER_DAY * walk)
+            decay_mult = np.exp(RECESSION_ERROR * rng.standard_normal((c, R)))
+            storm = rng.random((c, 1, D)) < self.pop[None]
+            size = np.exp(RAIN_RISE_ERROR * rng.standard_normal((c, R, D)) - RAIN_RISE_ERROR ** 2 / 2)
+            codes = self._codes(self._run(storm * storm_factor * size, error, decay_mult), self.estimate[None])
+            out[lo:lo + c] = label_scores[codes]
+        return out
+
+# ============================================================
+# 5. SCENARIO ROBUSTNESS
+# ============================================================
+
+def scenario_fish_days(scenario_scores, rivers, days, offsets=None, threshold=FISHABLE_SCORE):
+    """Good fishing days per scenario for one plan's fish days.
+
+    rivers/days index the scenario array's river and day axes, one entry per fish day;
+    offsets (same length) shift the scores like the planner's sliders. -> (S,) counts.
+    """
+    rivers, days = np.asarray(rivers, dtype=np.int64), np.asarray(days, dtype=np.int64)
+    if not len(rivers): return np.zeros(len(scenario_scores))
+    picked = scenario_scores[:, rivers, days]
+    if offsets is not None: picked = picked + np.asarray(offsets, dtype=np.float32)
+    return (picked >= threshold).sum(axis=1)